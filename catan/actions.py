@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from typing import Union, TYPE_CHECKING
+
+import numpy as np
+
+from catan.board import Board, DevelopmentCard, Resource, RoadVertex, Road, DevCard
+from catan.error import CatanException
+if TYPE_CHECKING:
+    from catan.player import Player
+
+
+@dataclass
+class EndTurnAction:
+    pass
+
+@dataclass
+class BuildSettlementAction:
+    road_vertex: RoadVertex
+    pay_for: bool = True
+
+@dataclass
+class BuildCityAction:
+    road_vertex: RoadVertex
+    pay_for: bool = True
+
+@dataclass
+class BuildRoadAction:
+    road: Road
+    pay_for: bool = True
+
+@dataclass
+class BuyDevelopmentCardAction:
+    pass
+
+@dataclass
+class UseDevelopmentCardAction:
+    card: DevCard
+
+@dataclass
+class TradeAction:
+    giving: list[Resource]
+    receiving: list[Resource]
+
+    def simple_trade_options(giving: Resource, count: int) -> list['TradeAction']:
+        return [TradeAction([giving] * count, [resource]) for resource in Resource if resource != giving]
+
+Action = Union[
+    EndTurnAction,
+    BuildSettlementAction,
+    BuildCityAction,
+    BuildRoadAction,
+    BuyDevelopmentCardAction,
+    UseDevelopmentCardAction,
+    TradeAction
+]
+
+
+# development cards that can be played, in id order
+PLAYABLE_DEVELOPMENT_CARDS = [card_type for card_type in DevelopmentCard if card_type != DevelopmentCard.VICTORY_POINT]
+# resources given per resource received by the bank and harbor trades
+TRADE_RATES = (2, 3, 4)
+TRADES_PER_RATE = len(Resource) * (len(Resource) - 1)
+
+
+class ActionCatalogue:
+    '''
+    A stable integer id for every concrete action on one board. In id order: END_TURN, a
+    paid and a free settlement per vertex, a city per vertex, a paid and a free road per
+    road, BUY_DEVELOPMENT_CARD, playing each playable card type, and a trade per rate,
+    given resource and received resource (trades of one resource for each of the others
+    are consecutive). Ids only depend on the board size.
+
+    Action objects are built once per id on first use and then shared, so legal-move
+    generation hands out the same instances every time: never mutate them. Playing a card
+    refers to the player's card itself, so those actions are built on every request.
+    '''
+    board: Board
+    settlement_offset: int
+    free_settlement_offset: int
+    city_offset: int
+    road_offset: int
+    free_road_offset: int
+    buy_development_card_id: int
+    use_development_card_offset: int
+    trade_offset: int
+    size: int
+    # trade_ids[rate][giving.value] -> the ids trading giving for each other resource, in Resource order
+    trade_ids: dict[int, list[list[int]]]
+    _actions: list[Action | None]
+
+    END_TURN_ID = 0
+
+    def __init__(self, board: Board):
+        self.board = board
+        vertex_count = len(board.road_vertex_list)
+        road_count = len(board.roads)
+        self.settlement_offset = 1
+        self.free_settlement_offset = self.settlement_offset + vertex_count
+        self.city_offset = self.free_settlement_offset + vertex_count
+        self.road_offset = self.city_offset + vertex_count
+        self.free_road_offset = self.road_offset + road_count
+        self.buy_development_card_id = self.free_road_offset + road_count
+        self.use_development_card_offset = self.buy_development_card_id + 1
+        self.trade_offset = self.use_development_card_offset + len(PLAYABLE_DEVELOPMENT_CARDS)
+        self.size = self.trade_offset + len(TRADE_RATES) * TRADES_PER_RATE
+        self.trade_ids = {
+            rate: [list(range(self.get_trade_id(rate, giving, 0), self.get_trade_id(rate, giving, 0) + len(Resource) - 1))
+                   for giving in Resource]
+            for rate in TRADE_RATES
+        }
+        self._actions = [None] * self.size
+
+    @staticmethod
+    def for_board(board: Board) -> 'ActionCatalogue':
+        """The board's catalogue, built on first use."""
+        catalogue = board.action_catalogue
+        if catalogue is None:
+            catalogue = board.action_catalogue = ActionCatalogue(board)
+        return catalogue
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get_trade_id(self, rate: int, giving: Resource, receiving_rank: int) -> int:
+        """receiving_rank is the received resource's position among the resources other than giving."""
+        return self.trade_offset + TRADE_RATES.index(rate) * TRADES_PER_RATE + giving.value * (len(Resource) - 1) + receiving_rank
+
+    def get_use_development_card_id(self, card_type: DevelopmentCard) -> int:
+        return self.use_development_card_offset + PLAYABLE_DEVELOPMENT_CARDS.index(card_type)
+
+    def get_id(self, action: Action) -> int:
+        if isinstance(action, EndTurnAction):
+            return self.END_TURN_ID
+        elif isinstance(action, BuildSettlementAction):
+            return (self.settlement_offset if action.pay_for else self.free_settlement_offset) + action.road_vertex.id
+        elif isinstance(action, BuildCityAction):
+            return self.city_offset + action.road_vertex.id
+        elif isinstance(action, BuildRoadAction):
+            return (self.road_offset if action.pay_for else self.free_road_offset) + action.road.id
+        elif isinstance(action, BuyDevelopmentCardAction):
+            return self.buy_development_card_id
+        elif isinstance(action, UseDevelopmentCardAction):
+            return self.get_use_development_card_id(action.card.card_type)
+        elif isinstance(action, TradeAction) and len(action.receiving) == 1:
+            giving, receiving = action.giving[0], action.receiving[0]
+            rank = receiving.value - (receiving.value > giving.value)
+            return self.get_trade_id(len(action.giving), giving, rank)
+        raise CatanException(f'No catalogue id for action {action}')
+
+    def get_action(self, action_id: int, player: 'Player') -> Action:
+        """The action with id action_id; player is only needed to pick the card a card play uses."""
+        action = self._actions[action_id]
+        if action is None:
+            action = self._build(action_id, player)
+        return action
+
+    def get_actions(self, action_ids: list[int], player: 'Player') -> list[Action]:
+        actions = self._actions
+        return [actions[i] or self._build(i, player) for i in action_ids]
+
+    def get_mask(self, action_ids) -> np.ndarray:
+        """Boolean mask over the whole catalogue with action_ids set."""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[action_ids] = True
+        return mask
+
+    def _build(self, action_id: int, player: 'Player') -> Action:
+        board = self.board
+        if not 0 <= action_id < self.size:
+            raise CatanException(f'Invalid action id {action_id}')
+        if self.use_development_card_offset <= action_id < self.trade_offset:
+            card_type = PLAYABLE_DEVELOPMENT_CARDS[action_id - self.use_development_card_offset]
+            # the same card legal-move generation offers: the first playable one of its type
+            card = next((card for card in player.unplayed_dev_cards
+                         if card.card_type == card_type and not card.on_cooldown), None)
+            if card is None:
+                raise CatanException(f'No playable {card_type} card')
+            return UseDevelopmentCardAction(card)
+
+        if action_id == self.END_TURN_ID:
+            action = EndTurnAction()
+        elif action_id < self.free_settlement_offset:
+            action = BuildSettlementAction(board.road_vertex_list[action_id - self.settlement_offset])
+        elif action_id < self.city_offset:
+            action = BuildSettlementAction(board.road_vertex_list[action_id - self.free_settlement_offset], False)
+        elif action_id < self.road_offset:
+            action = BuildCityAction(board.road_vertex_list[action_id - self.city_offset])
+        elif action_id < self.free_road_offset:
+            action = BuildRoadAction(board.roads[action_id - self.road_offset])
+        elif action_id < self.buy_development_card_id:
+            action = BuildRoadAction(board.roads[action_id - self.free_road_offset], False)
+        elif action_id == self.buy_development_card_id:
+            action = BuyDevelopmentCardAction()
+        else:
+            rate_index, trade = divmod(action_id - self.trade_offset, TRADES_PER_RATE)
+            giving, rank = divmod(trade, len(Resource) - 1)
+            receiving = rank + (rank >= giving)
+            action = TradeAction([Resource(giving)] * TRADE_RATES[rate_index], [Resource(receiving)])
+        self._actions[action_id] = action
+        return action
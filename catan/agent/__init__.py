@@ -1,3 +1,4 @@
+import copy
 from typing import TYPE_CHECKING
 
 from catan.board import Board, Resource
@@ -14,6 +15,17 @@ class Agent:
         self.board = board
         self.player = player
 
+    def clone(self, board: Board, player: Player) -> 'Agent':
+        """Shallow copy bound to another board and player, for Game.clone(). Models are shared."""
+        agent = copy.copy(self)
+        agent.board = board
+        agent.player = player
+        return agent
+
+    def close(self):
+        """Release anything held across decisions (e.g. worker processes); called when a game ends."""
+        pass
+
     # returns index of chosen action out of all possible player actions
     def get_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
         raise NotImplementedError
@@ -1,6 +1,8 @@
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 import random
 
+from catan.analytics import BoardAnalytics
 from catan.board import Board, Resource, RoadVertex, Road, DevCard, DevelopmentCard
 from catan.player import Player, Action, BuildSettlementAction, BuildCityAction, BuildRoadAction, \
     BuyDevelopmentCardAction, TradeAction, UseDevelopmentCardAction, EndTurnAction
@@ -12,12 +14,30 @@ if TYPE_CHECKING:
     from catan.game import Game
 
 
+@dataclass
+class _DecisionCache:
+    '''Evaluations that cannot change while a single decision is being made.'''
+    most_needed_resource: Resource | None = None
+    # road vertex id -> evaluate_settlement_location score
+    settlement_scores: dict[int, int] = field(default_factory=dict)
+
 
 class HeuristicAgent(Agent):
+    # only set during get_action, nothing can change the game state before it returns
+    _cache: _DecisionCache | None
+
     def __init__(self, board: Board, player: Player):
         super().__init__(board, player)
+        self._cache = None
 
     def get_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
+        self._cache = _DecisionCache()
+        try:
+            return self._choose_action(game, possible_actions)
+        finally:
+            self._cache = None
+
+    def _choose_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
         # The logic is straightforward: prioritize certain types of actions first, try others next. If it can't do anything, just end the turn
         # You can try swapping the order of the isinstance statements to see if one performs better than the other (i.e. prioritizing using dev cards early on)
         best_action = None
@@ -53,17 +73,14 @@ class HeuristicAgent(Agent):
         return EndTurnAction()
 
     def evaluate_settlement_location(self, road_vertex: RoadVertex, game: 'Game') -> int:
-        score = 0
-        resource_types = set()
-        dice_probability = {2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 8: 5, 9: 4, 10: 3, 11: 2, 12: 1}
-
-        for tile in road_vertex.adjacent_tiles:
-            if tile and tile.resource:
-                score += dice_probability[tile.number]
-                resource_types.add(tile.resource)
+        cache = self._cache
+        if cache is not None and road_vertex.id in cache.settlement_scores:
+            return cache.settlement_scores[road_vertex.id]
+        analytics = BoardAnalytics.for_board(game.board)
+        score = analytics.pips[road_vertex.id]
 
         # the more resource types there are adjacent to this road_vertex, the bigger the score
-        score += len(resource_types)
+        score += analytics.diversity[road_vertex.id]
 
         num_available_roads = 0
         for road in road_vertex.adjacent_roads:
@@ -71,23 +88,19 @@ class HeuristicAgent(Agent):
                 num_available_roads += 1
         score += num_available_roads
 
-        if road_vertex.harbor:
+        if analytics.has_harbor[road_vertex.id]:
             score += 5
 
+        if cache is not None:
+            cache.settlement_scores[road_vertex.id] = score
         return score
 
     def evaluate_city_location(self, road_vertex: RoadVertex, game: 'Game') -> int:
-        score = 0
-        resource_types = set()
-        dice_probability = {2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 8: 5, 9: 4, 10: 3, 11: 2, 12: 1}
-
-        for tile in road_vertex.adjacent_tiles:
-            if tile and tile.resource:
-                score += 2 * dice_probability[tile.number]
-                resource_types.add(tile.resource)
+        analytics = BoardAnalytics.for_board(game.board)
+        score = 2 * analytics.pips[road_vertex.id]
 
         # the more resource types there are adjacent to this road_vertex, the bigger the score
-        score += len(resource_types)
+        score += analytics.diversity[road_vertex.id]
 
         return score
 
@@ -124,6 +137,14 @@ class HeuristicAgent(Agent):
         return score
 
     def get_most_needed_resource(self, game: 'Game') -> Resource:
+        cache = self._cache
+        if cache is None:
+            return self._find_most_needed_resource(game)
+        if cache.most_needed_resource is None:
+            cache.most_needed_resource = self._find_most_needed_resource(game)
+        return cache.most_needed_resource
+
+    def _find_most_needed_resource(self, game: 'Game') -> Resource:
         needed_resources = {
             BuildSettlementAction: [Resource.BRICK, Resource.WOOD, Resource.GRAIN, Resource.SHEEP],
             BuildCityAction: [Resource.ORE, Resource.ORE, Resource.ORE, Resource.GRAIN, Resource.GRAIN],
@@ -131,8 +152,8 @@ class HeuristicAgent(Agent):
         }
 
         # Given the order of iteration, this will prioritize settlements, then cities, then roads if we have 0 of the resources for those 3
+        possible_actions = self.player.get_all_possible_actions(game.board, game.game_phase == GamePhase.SETUP)
         for action, resources in needed_resources.items():
-            possible_actions = self.player.get_all_possible_actions(game.board, game.game_phase == GamePhase.SETUP)
             if action in possible_actions:
                 for resource in resources:
                     if self.player.resources[resource] == 0:
@@ -1,5 +1,4 @@
 from typing import TYPE_CHECKING
-import random
 
 from catan.board import Board, Resource
 from catan.player import Player, Action
@@ -13,13 +12,13 @@ class HumanAgent(Agent):
         super().__init__(board, player)
 
     def get_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
-        return random.choice(possible_actions)
+        return game.rng.choice(possible_actions)
 
     def get_most_needed_resource(self, game: 'Game') -> Resource:
-        return random.choice(list(Resource))
+        return game.rng.choice(list(Resource))
     
     def get_robber_placement(self, game: 'Game') -> CubeCoordinates:
         return CubeCoordinates(0, 0, 0)
     
     def get_player_to_steal_from(self, game: 'Game', options: list[int]) -> int:
-        return random.choice(options)
+        return game.rng.choice(options)
@@ -0,0 +1,325 @@
+import math
+import multiprocessing
+import multiprocessing.pool
+import random
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from catan.actions import ActionCatalogue
+from catan.agent import Agent
+from catan.agent.heuristic import HeuristicAgent
+from catan.analytics import BoardAnalytics
+from catan.board import Board, Resource
+from catan.game import GamePhase
+from catan.player import Player, Action
+from catan.util import CubeCoordinates
+if TYPE_CHECKING:
+    from catan.game import Game
+    from catan.sim import AgentFactory
+
+# Monte Carlo tree search over clones of the game. Tree nodes store legal actions as
+# ActionCatalogue ids, so the same tree can be walked on every iteration's fresh clone.
+# Dice rolls are chance nodes that sample each total with its real probability; actions with
+# a random result (buying or playing a development card, and the discards and steal of a 7)
+# branch on the outcome that was actually drawn. Every seat in the search, including this
+# one's opponents, is played by the rollout policy, and each seat maximises its own value.
+
+# Ways to roll each 2d6 total out of 36
+ROLLS = list(range(2, 13))
+ROLL_WAYS = [1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1]
+VICTORY_POINTS_TO_WIN = 10
+# victory points a pip of production is worth when scoring an unfinished rollout
+PIP_VALUE = 0.02
+
+DECISION = 0
+ROLL = 1
+# the game is over or the search horizon has been reached
+LEAF = 2
+
+
+@dataclass
+class SearchConfig:
+    # seconds per decision; a search stops at whichever of the two budgets runs out first
+    time_budget: float | None = 1.0
+    # iterations per worker
+    iterations: int | None = None
+    # worker processes, each growing its own tree from the same root (root parallelism)
+    workers: int = 1
+    # plays every seat in the search, and answers this agent's robber, steal and resource choices
+    rollout_agent: 'AgentFactory' = HeuristicAgent
+    # main turns after the decision at which positions are scored
+    horizon_turns: int = 6
+    exploration: float = 1.0
+    # seeds the agent's own random stream; None derives it from the game's seed
+    seed: int | None = None
+
+
+class _Edge:
+    __slots__ = ('visits', 'value', 'outcomes')
+
+    def __init__(self):
+        self.visits = 0
+        # summed value for the player who chose this edge
+        self.value = 0.0
+        # outcome key -> node; the key is None for actions without a random result
+        self.outcomes: dict = {}
+
+
+class _Node:
+    __slots__ = ('kind', 'player_index', 'action_ids', 'edges', 'untried', 'visits', 'outcomes')
+
+    def __init__(self, kind: int, player_index: int | None, action_ids: list[int] | None, rng: random.Random):
+        self.kind = kind
+        self.player_index = player_index
+        self.action_ids = action_ids
+        self.visits = 0
+        if kind == DECISION:
+            self.edges: list[_Edge | None] = [None] * len(action_ids)
+            self.untried = list(range(len(action_ids)))
+            rng.shuffle(self.untried)
+        elif kind == ROLL:
+            # roll (with the outcome of a 7) -> node
+            self.outcomes: dict = {}
+
+
+def _outcome_key(game: 'Game') -> tuple:
+    """Everything a random event can change: resources and development cards in hand."""
+    return tuple((tuple(pa.player.resources.values()), tuple(card.card_type.value for card in pa.player.unplayed_dev_cards))
+                 for pa in game.player_agents)
+
+
+def _evaluate(game: 'Game') -> list[float]:
+    """Each player's value: 1 for the winner, otherwise victory points and production as a fraction of a win."""
+    if game.winning_player_index is not None:
+        return [1.0 if i == game.winning_player_index else 0.0 for i in range(len(game.player_agents))]
+    analytics = BoardAnalytics.for_board(game.board)
+    values = []
+    for player_agent in game.player_agents:
+        player = player_agent.player
+        production = sum(analytics.pips[vertex.id] for vertex in player.settlements)
+        production += sum(analytics.pips[vertex.id] for vertex in player.cities)
+        score = (player.get_victory_points() + PIP_VALUE * production) / VICTORY_POINTS_TO_WIN
+        values.append(min(score, 0.99))
+    return values
+
+
+class _Search:
+    '''One tree grown from a root decision. With root parallelism each worker grows its own.'''
+    root_game: 'Game'
+    config: SearchConfig
+    horizon: int
+    root: _Node
+
+    def __init__(self, root_game: 'Game', player_index: int, action_ids: list[int], config: SearchConfig, seed: int):
+        self.root_game = root_game
+        self.config = config
+        self.rng = random.Random(seed)
+        self.horizon = root_game.main_turns_elapsed + config.horizon_turns
+        self.root = _Node(DECISION, player_index, action_ids, self.rng)
+
+    def run(self, deadline: float | None, iterations: int | None) -> list[tuple[int, float]]:
+        """Iterate until the deadline or iteration budget, and return the visits and summed value of each root action."""
+        count = 0
+        while True:
+            self._iterate()
+            count += 1
+            if iterations is not None and count >= iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return [(edge.visits, edge.value) if edge is not None else (0, 0.0) for edge in self.root.edges]
+
+    def _iterate(self):
+        game = self.root_game.clone()
+        # fresh dice and steals every iteration, and the undrawn cards in an order nobody knows
+        game.board.rng.seed(self.rng.getrandbits(64))
+        game.rng.shuffle(game.board.development_card_deck.cards)
+        catalogue = ActionCatalogue.for_board(game.board)
+
+        node = self.root
+        path: list[tuple[_Node, _Edge]] = []
+        kind, player_index, action_ids = DECISION, node.player_index, node.action_ids
+        while True:
+            if node.kind == LEAF:
+                break
+            if node.kind == ROLL:
+                roll = self.rng.choices(ROLLS, ROLL_WAYS)[0]
+                game.perform_dice_roll(roll)
+                key = (roll, _outcome_key(game)) if roll == 7 else roll
+                outcomes = node.outcomes
+                kind, player_index, action_ids = self._advance(game, catalogue, False)
+            else:
+                index = self._select(node)
+                edge = node.edges[index]
+                if edge is None:
+                    edge = node.edges[index] = _Edge()
+                path.append((node, edge))
+                action_id = node.action_ids[index]
+                player = game.player_agents[node.player_index].player
+                new_turn = game.play_action(catalogue.get_action(action_id, player), node.player_index)
+                is_random = catalogue.buy_development_card_id <= action_id < catalogue.trade_offset
+                key = _outcome_key(game) if is_random else None
+                outcomes = edge.outcomes
+                kind, player_index, action_ids = self._advance(game, catalogue, new_turn)
+
+            child = outcomes.get(key)
+            if child is None:
+                outcomes[key] = _Node(kind, player_index, action_ids, self.rng)
+                break
+            if child.kind != kind or child.action_ids != action_ids:
+                # an outcome key collision led somewhere else; score this position without expanding
+                break
+            node = child
+
+        if kind == DECISION:
+            kind = self._finish_turn(game, catalogue, player_index, action_ids)
+        while game.winning_player_index is None and game.main_turns_elapsed < self.horizon:
+            game.do_full_turn()
+        values = _evaluate(game)
+        for node, edge in path:
+            node.visits += 1
+            edge.visits += 1
+            edge.value += values[node.player_index]
+
+    def _select(self, node: _Node) -> int:
+        if node.untried:
+            return node.untried.pop()
+        log_visits = math.log(node.visits)
+        exploration = self.config.exploration
+        best_index, best_score = 0, -math.inf
+        for i, edge in enumerate(node.edges):
+            score = edge.value / edge.visits + exploration * math.sqrt(log_visits / edge.visits)
+            if score > best_score:
+                best_index, best_score = i, score
+        return best_index
+
+    def _advance(self, game: 'Game', catalogue: ActionCatalogue, new_turn: bool) -> tuple[int, int | None, list[int] | None]:
+        """
+        Play forced moves up to the next position the tree branches on: a choice between
+        several actions, the roll at the start of a turn, or the end of the search.
+        """
+        while True:
+            if game.winning_player_index is not None or game.main_turns_elapsed >= self.horizon:
+                return LEAF, None, None
+            is_setup = game.game_phase == GamePhase.SETUP
+            if is_setup:
+                if game.is_setup_complete():
+                    game.start_main_phase()
+                    new_turn = True
+                    continue
+                player_index = game.get_setup_player_index()
+            elif new_turn:
+                return ROLL, None, None
+            else:
+                player_index = game.player_turn_index
+            player = game.player_agents[player_index].player
+            action_ids = player.get_possible_action_ids(game.board, is_setup).tolist()
+            if len(action_ids) > 1:
+                return DECISION, player_index, action_ids
+            if not action_ids:
+                # only a setup placement can have no legal location, and it is skipped
+                game.setup_turns_elapsed += 1
+                continue
+            new_turn = game.play_action(catalogue.get_action(action_ids[0], player), player_index)
+
+    def _finish_turn(self, game: 'Game', catalogue: ActionCatalogue, player_index: int, action_ids: list[int]) -> int:
+        """Let the rollout agents decide until the current turn (or setup) is over, so whole turns can follow."""
+        kind = DECISION
+        while kind == DECISION:
+            player_agent = game.player_agents[player_index]
+            actions = catalogue.get_actions(action_ids, player_agent.player)
+            new_turn = game.play_action(player_agent.agent.get_action(game, actions), player_index)
+            kind, player_index, action_ids = self._advance(game, catalogue, new_turn)
+        return kind
+
+
+def _run_search(task: tuple['Game', int, list[int], SearchConfig, int]) -> list[tuple[int, float]]:
+    """Worker entry point: grow one tree for the configured budget and return the root statistics."""
+    root_game, player_index, action_ids, config, seed = task
+    deadline = time.perf_counter() + config.time_budget if config.time_budget is not None else None
+    return _Search(root_game, player_index, action_ids, config, seed).run(deadline, config.iterations)
+
+
+class MCTSAgent(Agent):
+    '''
+    Chooses actions by Monte Carlo tree search within config's time and iteration budgets, and
+    leaves robber, steal and resource choices to its rollout agent. With config.workers > 1,
+    that many processes each search the decision independently and their root statistics are
+    added up; the pool is created on the first such decision and kept until close(), which
+    the game drivers in catan.sim call when a game ends. Inside a
+    daemonic process, such as a tournament worker, the trees are searched in turn instead.
+    Setup placements in games with a human fall back on the rollout agent, as search follows
+    the regular setup order.
+    '''
+    config: SearchConfig
+    policy: Agent
+    # seeds the searches; kept apart from the game's stream, so the search settings never change the dice
+    rng: random.Random
+    _pool: multiprocessing.pool.Pool | None
+
+    def __init__(self, board: Board, player: Player, config: SearchConfig | None = None):
+        super().__init__(board, player)
+        self.config = config if config is not None else SearchConfig()
+        if self.config.time_budget is None and self.config.iterations is None:
+            raise ValueError("MCTSAgent needs a time budget or an iteration budget")
+        self.policy = self.config.rollout_agent(board, player)
+        if self.config.seed is not None:
+            self.rng = random.Random(self.config.seed)
+        else:
+            # a copy of the game's stream, so seeded games stay reproducible without drawing from it
+            game_stream = random.Random()
+            game_stream.setstate(board.rng.getstate())
+            self.rng = random.Random(game_stream.getrandbits(64) + player.index)
+        self._pool = None
+
+    def clone(self, board: Board, player: Player) -> 'MCTSAgent':
+        agent = super().clone(board, player)
+        agent.policy = self.policy.clone(board, player)
+        agent.rng = random.Random()
+        agent.rng.setstate(self.rng.getstate())
+        # the copy starts its own pool if it needs one, so closing either leaves the other working
+        agent._pool = None
+        return agent
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def get_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
+        if len(possible_actions) == 1 or game.game_phase == GamePhase.SETUP and game.has_human:
+            return self.policy.get_action(game, possible_actions)
+
+        root_game = game.clone()
+        for player_agent in root_game.player_agents:
+            player_agent.agent = self.config.rollout_agent(root_game.board, player_agent.player)
+        catalogue = ActionCatalogue.for_board(game.board)
+        action_ids = [catalogue.get_id(action) for action in possible_actions]
+        tasks = [(root_game, self.player.index, action_ids, self.config, self.rng.getrandbits(64))
+                 for _ in range(self.config.workers)]
+        if self.config.workers == 1 or multiprocessing.current_process().daemon:
+            # pool workers (e.g. a tournament's) cannot start processes of their own,
+            # so there the workers' trees are grown one after another instead
+            stats = self._merge(map(_run_search, tasks))
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.config.workers)
+            stats = self._merge(self._pool.map(_run_search, tasks))
+        # the most visited action, and between equally visited ones the best on average
+        best = max(range(len(stats)), key=lambda i: (stats[i][0], stats[i][1] / max(stats[i][0], 1)))
+        return possible_actions[best]
+
+    @staticmethod
+    def _merge(worker_stats) -> list[tuple[int, float]]:
+        """Sum each root action's visits and value over the workers' trees."""
+        return [tuple(map(sum, zip(*edges))) for edges in zip(*worker_stats)]
+
+    def get_most_needed_resource(self, game: 'Game') -> Resource:
+        return self.policy.get_most_needed_resource(game)
+
+    def get_robber_placement(self, game: 'Game') -> CubeCoordinates:
+        return self.policy.get_robber_placement(game)
+
+    def get_player_to_steal_from(self, game: 'Game', options: list[int]) -> int:
+        return self.policy.get_player_to_steal_from(game, options)
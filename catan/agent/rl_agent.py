@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
-import random
 
+from catan.analytics import BoardAnalytics
 from catan.util import CubeCoordinates
 from catan.agent import Agent
 if TYPE_CHECKING:
@@ -9,8 +9,8 @@ if TYPE_CHECKING:
 import torch
 import torch.optim as optim
 import numpy as np
-from collections import deque
 from catan.QNN import QNetwork
+from catan.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
 from catan.serialization import BrickRepresentation
 
 
@@ -24,6 +24,29 @@ from globals import DEV_MODE
 
 BOARD_SIZE = 5
 
+
+def calculate_reward(player: Player) -> float:
+    """Calculate reward based on player's progress, with higher rewards for wheat and ore."""
+    reward = 0
+
+    # Reward for victory points
+    reward += player.get_victory_points() * 5  # Reward for victory points
+
+    # Reward for resources, with higher weights for wheat and ore
+    resource_weights = {
+        Resource.GRAIN: .3,
+        Resource.ORE: .3,
+        Resource.BRICK: .1,
+        Resource.WOOD: .1,
+        Resource.SHEEP: .1,
+    }
+    # Calculate weighted sum of resources
+    for resource, amount in player.resources.items():
+        reward += amount * resource_weights.get(resource, 1)  # Use weight if defined, otherwise default to 1
+
+    return reward
+
+
 class RL_Agent(Agent):
     def __init__(self, board: Board, player: Player):
         super().__init__(board, player)
@@ -43,25 +66,31 @@ class RL_Agent(Agent):
         return self.rl_agent.get_action(game, self.player, possible_actions)
 
     def get_most_needed_resource(self, game: 'Game') -> Resource:
-        return random.choice(list(Resource))
+        return game.rng.choice(list(Resource))
     
     def get_robber_placement(self, game: 'Game') -> CubeCoordinates:
         return CubeCoordinates(0, 0, 0)
     
     def get_player_to_steal_from(self, game: 'Game', options: list[int]) -> int:
-        return random.choice(options)
+        return game.rng.choice(options)
 
 
 class RL_Model:
-    def __init__(self, model: QNetwork, gamma=0.99, epsilon=1.0, epsilon_decay=0.99995, batch_size=12, learning_rate=0.001):
+    def __init__(self, model: QNetwork, gamma=0.99, epsilon=1.0, epsilon_decay=0.99995, batch_size=12, learning_rate=0.001, buffer_capacity=10000, prioritized=False, replay_buffer=None):
         self.model = model
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay = epsilon_decay
         self.batch_size = batch_size
         self.optimizer = optim.Adam(model.parameters(), lr=learning_rate)
-        self.replay_buffer = deque(maxlen=10000)
+        self.buffer_capacity = buffer_capacity
+        self.prioritized = prioritized
+        # Any store with append/sample/len works here, e.g. a MemmapReplayStore for replay
+        # that does not fit in RAM. By default a ReplayBuffer is allocated on the first stored
+        # transition, once the state shapes are known.
+        self.replay_buffer = replay_buffer
         self.action_mapper = ActionMapper()
+        self.encoder: BrickRepresentation | None = None
 
     def get_action_heuristic(self, game: 'Game', possible_actions: list[Action], player: 'Player') -> Action:
             # The logic is straightforward: prioritize certain types of actions first, try others next. If it can't do anything, just end the turn
@@ -99,17 +128,11 @@ class RL_Model:
             return EndTurnAction()
 
     def evaluate_settlement_location(self, road_vertex: RoadVertex, game: 'Game') -> int:
-        score = 0
-        resource_types = set()
-        dice_probability = {2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 8: 5, 9: 4, 10: 3, 11: 2, 12: 1}
-
-        for tile in road_vertex.adjacent_tiles:
-            if tile and tile.resource:
-                score += dice_probability[tile.number]
-                resource_types.add(tile.resource)
+        analytics = BoardAnalytics.for_board(game.board)
+        score = analytics.pips[road_vertex.id]
 
         # the more resource types there are adjacent to this road_vertex, the bigger the score
-        score += len(resource_types)
+        score += analytics.diversity[road_vertex.id]
 
         num_available_roads = 0
         for road in road_vertex.adjacent_roads:
@@ -117,23 +140,17 @@ class RL_Model:
                 num_available_roads += 1
         score += num_available_roads
 
-        if road_vertex.harbor:
+        if analytics.has_harbor[road_vertex.id]:
             score += 5
 
         return score
 
     def evaluate_city_location(self, road_vertex: RoadVertex, game: 'Game') -> int:
-        score = 0
-        resource_types = set()
-        dice_probability = {2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 8: 5, 9: 4, 10: 3, 11: 2, 12: 1}
-
-        for tile in road_vertex.adjacent_tiles:
-            if tile and tile.resource:
-                score += 2 * dice_probability[tile.number]
-                resource_types.add(tile.resource)
+        analytics = BoardAnalytics.for_board(game.board)
+        score = 2 * analytics.pips[road_vertex.id]
 
         # the more resource types there are adjacent to this road_vertex, the bigger the score
-        score += len(resource_types)
+        score += analytics.diversity[road_vertex.id]
 
         return score
 
@@ -218,93 +235,105 @@ class RL_Model:
     
 
     def get_state(self, game: 'Game', player: 'Player'):
-        """Generate a state representation using BrickRepresentation"""
-        brick_rep = BrickRepresentation(size=BOARD_SIZE, num_players=len(game.player_agents), game=game, agent_player_num=player.index)
-        brick_rep.encode_all(player)
-        
+        """
+        Generate a state representation using BrickRepresentation.
+        The returned tensors share memory with the encoder's buffers and are overwritten
+        by the next call, so clone them if they need to outlive the current decision.
+        """
+        if self.encoder is None or self.encoder.num_players != len(game.player_agents):
+            self.encoder = BrickRepresentation(size=BOARD_SIZE, num_players=len(game.player_agents), game=game, agent_player_num=player.index)
+        self.encoder.game = game
+        self.encoder.agent_player_num = player.index
+        self.encoder.encode_all(player)
+
         # Board state: Multi-channel tensor
-        board_state = torch.tensor(brick_rep.board, dtype=torch.float32)
-        
+        board_state = torch.from_numpy(self.encoder.board)
+
         # Player state: Structured vector
-        player_state = torch.tensor(brick_rep.player_states, dtype=torch.float32).flatten()
-        
+        player_state = torch.from_numpy(self.encoder.player_states)
+
         return board_state, player_state
 
     def get_action(self, game: 'Game', player: 'Player', possible_actions: list[Action]):
         """Select an action using epsilon-greedy strategy"""
-        if random.random() < self.epsilon:
-            if DEV_MODE:
-                print("Heuristic action selected on epsilon of: ",  self.epsilon)
-            return self.get_action_heuristic(game,possible_actions, player)
-        else:
-            board_state, player_state = self.get_state(game, player)
-            board_state = board_state.unsqueeze(0)  # Add batch dimension
-            player_state = player_state.unsqueeze(0)
-            
-            # Get Q-values from the model
-            q_values = self.model.forward(board_state, player_state).detach().numpy().flatten()
-            
+        return self.get_actions([game], [player], [possible_actions])[0]
+
+    def get_actions(self, games: list['Game'], players: list['Player'], possible_actions: list[list[Action]],
+                    states: list[tuple[np.ndarray, np.ndarray]] | None = None) -> list[Action]:
+        """
+        get_action for several games at once. Every game draws its own exploration coin, and
+        the games that exploit share a single batched forward pass. states optionally holds
+        each game's already encoded (board, player state) arrays.
+        """
+        actions: list[Action | None] = [None] * len(games)
+        exploit = []
+        for i, (game, player) in enumerate(zip(games, players)):
+            if game.rng.random() < self.epsilon:
+                if DEV_MODE:
+                    print("Heuristic action selected on epsilon of: ",  self.epsilon)
+                actions[i] = self.get_action_heuristic(game, possible_actions[i], player)
+            else:
+                exploit.append(i)
+        if not exploit:
+            return actions
+
+        board_batch = player_batch = None
+        for row, i in enumerate(exploit):
+            if states is not None:
+                board_state, player_state = states[i]
+            else:
+                # get_state hands out views of the encoder's buffers, so copy each one out before the next encode
+                board_state, player_state = (state.numpy() for state in self.get_state(games[i], players[i]))
+            if board_batch is None:
+                board_batch = np.empty((len(exploit),) + board_state.shape, dtype=board_state.dtype)
+                player_batch = np.empty((len(exploit),) + player_state.shape, dtype=player_state.dtype)
+            board_batch[row] = board_state
+            player_batch[row] = player_state
+
+        # Get Q-values from the model
+        with torch.no_grad():
+            q_values = self.model.forward(torch.from_numpy(board_batch), torch.from_numpy(player_batch)).numpy()
+
+        for row, i in enumerate(exploit):
             # Ensure the number of Q-values matches the number of possible actions
-            if len(q_values) < len(possible_actions):
+            if len(q_values[row]) < len(possible_actions[i]):
                 if DEV_MODE:
                     print("Warning: Model output has fewer Q-values than possible actions")
-                return random.choice(possible_actions)
-            
-            # Filter Q-values to only valid actions
-            valid_q_values = q_values[:len(possible_actions)]
-            
+                actions[i] = games[i].rng.choice(possible_actions[i])
+                continue
             # Select the action with the highest Q-value among valid actions
-            action_idx = np.argmax(valid_q_values)
-            return possible_actions[action_idx]  # Exploit (best action based on Q-values)
-            # action_idx = np.argmax(q_values)
-            # if action_idx< len(possible_actions)-1:
-            #     return possible_actions[action_idx]  # Exploit (best action based on Q-values)
-            # else:
-            #     if DEV_MODE:
-            #       print("Invalid action index++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-            #       print("action: " +str(action_idx))
-            #       print("Possable actions: " + str(possible_actions))
-            #     return random.choice(possible_actions)  # Explore (random action)
+            action_idx = np.argmax(q_values[row][:len(possible_actions[i])])
+            actions[i] = possible_actions[i][action_idx]  # Exploit (best action based on Q-values)
+        return actions
 
     def store_experience(self, state, action, reward, next_state, done):
         """Store the agent's experience in the replay buffer."""
-        board_state, player_state = state
-        next_board_state, next_player_state = next_state
-
-        # Convert states to tensors
-        board_state_tensor = torch.tensor(board_state, dtype=torch.float32)
-        player_state_tensor = torch.tensor(player_state, dtype=torch.float32)
-        next_board_state_tensor = torch.tensor(next_board_state, dtype=torch.float32)
-        next_player_state_tensor = torch.tensor(next_player_state, dtype=torch.float32)
-
-        # Store the experience
-        self.replay_buffer.append((
-            (board_state_tensor, player_state_tensor),
-            action,
-            reward,
-            (next_board_state_tensor, next_player_state_tensor),
-            done
-        ))
+        self.store_transition(state, self.action_mapper.get_action_index(action), reward, next_state, done)
+
+    def store_transition(self, state, action_index, reward, next_state, done):
+        """Store a transition whose action is already an ActionMapper index."""
+        if self.replay_buffer is None:
+            board_state, player_state = state
+            buffer_class = PrioritizedReplayBuffer if self.prioritized else ReplayBuffer
+            self.replay_buffer = buffer_class(self.buffer_capacity, tuple(np.shape(board_state)), int(np.prod(np.shape(player_state))))
+
+        # The buffer copies the states into its own storage
+        self.replay_buffer.append(state, action_index, reward, next_state, done)
 
     def train(self):
         """Train the agent based on experiences collected during the game."""
-        if len(self.replay_buffer) < self.batch_size:
+        buffer_size = len(self.replay_buffer) if self.replay_buffer is not None else 0
+        if buffer_size < self.batch_size:
             if DEV_MODE:
-                print("replay buff too small"+ " Buffer size: "+str(len(self.replay_buffer))+ " Batch size:  "+ str(self.batch_size))
+                print("replay buff too small"+ " Buffer size: "+str(buffer_size)+ " Batch size:  "+ str(self.batch_size))
             return  # Not enough experiences to train
 
         # Sample a random batch from the replay buffer
-        batch = random.sample(self.replay_buffer, self.batch_size)
-        states, actions, rewards, next_states, dones = zip(*batch)
-
-        # Convert to tensors
-        board_states = torch.stack([s[0] for s in states])
-        player_states = torch.stack([s[1] for s in states])
-        actions = torch.tensor([self.action_mapper.get_action_index(a) for a in actions], dtype=torch.long)
-        rewards = torch.tensor(rewards, dtype=torch.float32)
-        next_board_states = torch.stack([s[0] for s in next_states])
-        next_player_states = torch.stack([s[1] for s in next_states])
-        dones = torch.tensor(dones, dtype=torch.float32)
+        if self.prioritized:
+            batch, indices, weights = self.replay_buffer.sample_with_weights(self.batch_size)
+        else:
+            batch = self.replay_buffer.sample(self.batch_size)
+        board_states, player_states, actions, rewards, next_board_states, next_player_states, dones = batch
 
         # Compute Q-values from the current state
         current_q_values = self.model.forward(board_states, player_states).gather(1, actions.unsqueeze(1)).squeeze(1)
@@ -315,7 +344,13 @@ class RL_Model:
             target_q_values = rewards + self.gamma * next_q_values * (1 - dones)
 
         # Compute the loss (mean squared error)
-        loss = torch.nn.functional.mse_loss(current_q_values, target_q_values)
+        if self.prioritized:
+            # importance-sampling weights correct for the non-uniform sampling
+            td_errors = target_q_values - current_q_values
+            loss = (weights * td_errors.pow(2)).mean()
+            self.replay_buffer.update_priorities(indices, td_errors)
+        else:
+            loss = torch.nn.functional.mse_loss(current_q_values, target_q_values)
 
         # Backpropagation and update the model
         self.optimizer.zero_grad()
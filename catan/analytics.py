@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from catan.board import Resource
+from catan.topology import NONE
+if TYPE_CHECKING:
+    from catan.board import Board
+
+# Ways to roll each 2d6 total out of 36, indexed directly by the roll; 7 and the desert's 0 produce nothing
+PIPS = np.array([0, 0, 1, 2, 3, 4, 5, 0, 5, 4, 3, 2, 1], dtype=np.int8)
+
+
+class BoardAnalytics:
+    '''
+    Per-layout values of every road vertex, computed once from a board's tiles and harbors
+    and then shared by the agents that score locations and by the encoder. Layouts never
+    change once a board is set up, so nothing here is ever updated; boards that get a new
+    layout (initialize_tile_info, set_harbors, replays) drop their table and the next
+    for_board() call builds a fresh one.
+    '''
+    # (vertices, resources) pips of the producing tiles around each vertex, by Resource value
+    vertex_resource_pips: np.ndarray
+    # (vertices,)
+    vertex_pips: np.ndarray
+    # number of distinct resources produced around each vertex
+    vertex_diversity: np.ndarray
+    vertex_has_harbor: np.ndarray
+    # vertices exactly two roads away from each vertex, in id order
+    vertex_second_neighbors: list[list[int]]
+    # the same values as plain lists, since indexing numpy arrays one element at a time is slow
+    pips: list[int]
+    diversity: list[int]
+    has_harbor: list[bool]
+
+    def __init__(self, board: Board):
+        topology = board.topology
+        state = board.state
+        producing = state.tile_resource != NONE
+        tile_pips = np.where(producing, PIPS[state.tile_number], 0)
+
+        self.vertex_resource_pips = np.zeros((topology.num_vertices, len(Resource)), dtype=np.int16)
+        for vertex_id, tile_ids in enumerate(topology.lists.vertex_tiles):
+            for tile_id in tile_ids:
+                if producing[tile_id]:
+                    self.vertex_resource_pips[vertex_id, state.tile_resource[tile_id]] += tile_pips[tile_id]
+        self.vertex_pips = self.vertex_resource_pips.sum(axis=1)
+        self.vertex_diversity = (self.vertex_resource_pips > 0).sum(axis=1)
+        self.vertex_has_harbor = state.vertex_harbor != NONE
+
+        vertex_vertices = topology.lists.vertex_vertices
+        self.vertex_second_neighbors = [
+            sorted({second for first in vertex_vertices[vertex_id] for second in vertex_vertices[first]} - {vertex_id})
+            for vertex_id in range(topology.num_vertices)
+        ]
+
+        self.pips = self.vertex_pips.tolist()
+        self.diversity = self.vertex_diversity.tolist()
+        self.has_harbor = self.vertex_has_harbor.tolist()
+
+    @staticmethod
+    def for_board(board: Board) -> BoardAnalytics:
+        """The table for the board's current layout, built on first use."""
+        analytics = board.analytics
+        if analytics is None:
+            analytics = board.analytics = BoardAnalytics(board)
+        return analytics
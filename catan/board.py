@@ -9,8 +9,16 @@ from dataclasses import dataclass
 import random
 import enum
 import itertools
+from typing import TYPE_CHECKING
 
-from catan.util import Point, CubeCoordinates, TILE_TO_TILE_DIRECTIONS, TILE_TO_ROAD_VERTEX_DIRECTIONS
+import numpy as np
+
+from catan.error import CatanException
+from catan.topology import BoardTopology, BoardState, NONE, open_settlement_mask
+from catan.util import Point, CubeCoordinates
+if TYPE_CHECKING:
+    from catan.actions import ActionCatalogue
+    from catan.analytics import BoardAnalytics
 
 class Resource(enum.Enum):
     WOOD = 0
@@ -22,6 +30,14 @@ class Resource(enum.Enum):
     def __str__(self):
         return self.name.title()
 
+RESOURCES = list(Resource)
+
+# number tokens of the standard board; 6 and 8 may never be on neighbouring tiles
+NUMBER_TOKENS = [2, 3, 3, 4, 4, 5, 5, 6, 6, 8, 8, 9, 9, 10, 10, 11, 11, 12]
+RED_NUMBERS = (6, 8)
+# random greedy tries before falling back to a colour class when placing the 6s and 8s
+INDEPENDENT_SET_ATTEMPTS = 10
+
 class Harbor(enum.Enum):
     THREE_TO_ONE = 0
     ORE = 1
@@ -70,7 +86,7 @@ class DevCard:
 class DevelopmentCardDeck:
     cards: list[DevCard]
 
-    def __init__(self):
+    def __init__(self, rng: random.Random):
         self.cards = (
             [DevCard(DevelopmentCard.KNIGHT) for _ in range(14)] +
             [DevCard(DevelopmentCard.ROAD_BUILDING) for _ in range(2)] +
@@ -78,20 +94,43 @@ class DevelopmentCardDeck:
             [DevCard(DevelopmentCard.MONOPOLY) for _ in range(2)] +
             [DevCard(DevelopmentCard.VICTORY_POINT) for _ in range(5)]
         )
-        random.shuffle(self.cards)
+        rng.shuffle(self.cards)
 
     def draw(self) -> DevelopmentCard:
         return self.cards.pop()
+
+    def copy(self) -> DevelopmentCardDeck:
+        deck = DevelopmentCardDeck.__new__(DevelopmentCardDeck)
+        deck.cards = [DevCard(card.card_type, card.on_cooldown) for card in self.cards]
+        return deck
+
+    def take(self, card_type: DevelopmentCard) -> DevCard:
+        """Remove a card of the given type, for replaying a recorded draw."""
+        for i in range(len(self.cards) - 1, -1, -1):
+            if self.cards[i].card_type == card_type:
+                return self.cards.pop(i)
+        raise CatanException(f'No {card_type} left in the deck')
     
     def remaining_cards(self) -> int:
         return len(self.cards)
 
 
+# Tile, RoadVertex and Road are views over the board's topology arrays: each carries its
+# dense id, and assigning one of its state attributes also writes the board's BoardState.
+# The attributes themselves are plain instance attributes and only writes go through
+# __setattr__, since reads (ownership checks, legality, scoring) far outnumber writes.
+
+_TILE_STATE_FIELDS = frozenset(('resource', 'number', 'has_robber'))
+_VERTEX_BUILDING_FIELDS = frozenset(('owner', 'has_settlement', 'has_city'))
+
+
 class Tile:
+    id: int
     cube_coords: CubeCoordinates
     resource: Resource | None
     number: int
     has_robber: bool
+    _state: BoardState | None
 
     # fixed length of 6
     # order: top-right, right, bottom-right, bottom-left, left, top-left
@@ -112,6 +151,8 @@ class Tile:
             adjacent_tiles: list[Tile | None] | None = None,
             adjacent_road_vertices: list[RoadVertex] | None = None,
             adjacent_roads: list[Road] | None = None):
+        self.id = NONE
+        self._state = None
         self.cube_coords = cube_coords
         self.resource = resource
         self.number = number
@@ -119,6 +160,12 @@ class Tile:
         self.adjacent_tiles = adjacent_tiles or [None] * 6
         self.adjacent_road_vertices = adjacent_road_vertices or [None] * 6
         self.adjacent_roads = adjacent_roads or [None] * 6
+
+    def __setattr__(self, name: str, value):
+        object.__setattr__(self, name, value)
+        if name in _TILE_STATE_FIELDS and self._state is not None:
+            resource = NONE if self.resource is None else self.resource.value
+            self._state.set_tile(self.id, resource, self.number, self.has_robber)
     
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Tile):
@@ -132,14 +179,15 @@ class Tile:
         return self.cube_coords.to_cartesian() * hex_radius
 
 class RoadVertex:
+    id: int
     cube_coords: CubeCoordinates
     parent_tile: Tile
     index_on_parent: int
-
     harbor: Harbor | None
     owner: int | None
     has_settlement: bool
     has_city: bool
+    _state: BoardState | None
 
     adjacent_tiles: list[Tile]
     adjacent_road_vertices: list[RoadVertex]
@@ -158,6 +206,9 @@ class RoadVertex:
             adjacent_tiles: list[Tile | None] | None = None,
             adjacent_road_vertices: list[RoadVertex] | None = None,
             adjacent_roads: list[Road | None] | None = None):
+        self.id = NONE
+        self._state = None
+        self._hash = None
         self.cube_coords = cube_coords
         self.parent_tile = parent_tile
         self.index_on_parent = index_on_parent
@@ -171,13 +222,25 @@ class RoadVertex:
         self.adjacent_road_vertices = adjacent_road_vertices or []
         self.adjacent_roads = adjacent_roads or []
 
+    def __setattr__(self, name: str, value):
+        object.__setattr__(self, name, value)
+        if name in _VERTEX_BUILDING_FIELDS:
+            if self._state is not None:
+                owner = NONE if self.owner is None else self.owner
+                self._state.set_vertex(self.id, owner, 2 if self.has_city else 1 if self.has_settlement else 0)
+        elif name == 'harbor' and self._state is not None:
+            self._state.vertex_harbor[self.id] = NONE if value is None else value.value
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, RoadVertex):
             return False
         return self.cube_coords == other.cube_coords
     
     def __hash__(self):
-        return hash((self.parent_tile.cube_coords, self.index_on_parent))
+        # vertices are hashed constantly (frontiers, road sets) and their position never changes
+        if self._hash is None:
+            self._hash = hash((self.parent_tile.cube_coords, self.index_on_parent))
+        return self._hash
 
     def __repr__(self) -> str:
         return f'RoadVertex(harbor={self.harbor}, owner={self.owner}, has_settlement={self.has_settlement}, has_city={self.has_city})'
@@ -186,8 +249,10 @@ class RoadVertex:
         return self.cube_coords.to_cartesian() * hex_radius
 
 class Road:
+    id: int
     endpoints: tuple[RoadVertex, RoadVertex]
     owner: int | None
+    _state: BoardState | None
 
     adjacent_tiles: list[Tile]
 
@@ -197,18 +262,28 @@ class Road:
             endpoints: tuple[RoadVertex, RoadVertex],
             owner: int | None = None,
             adjacent_tiles: list[Tile | None] | None = None):
+        self.id = NONE
+        self._state = None
+        self._hash = None
         self.endpoints = endpoints
         self.owner = owner
 
         self.adjacent_tiles = adjacent_tiles or []
 
+    def __setattr__(self, name: str, value):
+        object.__setattr__(self, name, value)
+        if name == 'owner' and self._state is not None:
+            self._state.road_owner[self.id] = NONE if value is None else value
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Road):
             return False
         return self.endpoints == other.endpoints or self.endpoints == (other.endpoints[1], other.endpoints[0])
     
     def __hash__(self) -> int:
-        return hash(self.endpoints)
+        if self._hash is None:
+            self._hash = hash(self.endpoints)
+        return self._hash
     
     def __repr__(self) -> str:
         return f'Road(endpoints={self.endpoints}, owner={self.owner})'
@@ -221,174 +296,182 @@ class Board:
     road_vertices: dict[CubeCoordinates, RoadVertex]
     roads: list[Road]
     development_card_deck: DevelopmentCardDeck
-
-    def __init__(self, size: int):
-        assert size > 0
+    # all of a game's randomness, from the layout to the agents' choices, comes from this
+    rng: random.Random
+    # indexed by id; roads is already in id order
+    tile_list: list[Tile]
+    road_vertex_list: list[RoadVertex]
+    # shared by every board of this size
+    topology: BoardTopology
+    state: BoardState
+    # catan.actions.ActionCatalogue.for_board builds it on first use
+    action_catalogue: ActionCatalogue | None
+    # catan.analytics.BoardAnalytics.for_board builds it on first use, a new layout drops it
+    analytics: BoardAnalytics | None
+
+    def __init__(self, size: int, rng: random.Random | None = None):
         self.size = size
-        self.center_tile = Tile(CubeCoordinates(0, 0, 0), None, 0)
-        self.tiles = {self.center_tile.cube_coords: self.center_tile}
-        self.road_vertices = {}
-        self.roads = []
-        self.development_card_deck = DevelopmentCardDeck()
-
-        # create tiles
-        for i in range(1, size):
-            # convert to list to prevent iterator runtime error
-            tiles_list = list(self.tiles.values())
-            for tile in tiles_list:
-                self._extend_tile_in_all_directions(tile)
-        
-        # connect edge tiles that were not included
-        for tile in self.tiles.values():
-            self._connect_tile_to_neighbors(tile)
-
-        # create road vertices
-        for tile in self.tiles.values():
-            self._create_road_vertices_on_tile(tile)
-        
-        # create roads
-        for tile in self.tiles.values():
-            self._create_roads_on_tile(tile)
-        
+        # without an explicit generator, seed one from the global state so random.seed() still applies
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
+        self.topology = BoardTopology.for_size(size)
+        self.state = BoardState(self.topology)
+        self.development_card_deck = DevelopmentCardDeck(self.rng)
+        self.action_catalogue = None
+        self.analytics = None
+        self._create_objects()
         self.set_harbors()
-        
-        # verify
-        for tile in self.tiles.values():
-            assert len(tile.adjacent_road_vertices) == 6
-            assert tile.adjacent_road_vertices.count(None) == 0
-            assert len(tile.adjacent_roads) == 6
-            assert tile.adjacent_roads.count(None) == 0
-    
-    def _extend_tile_in_all_directions(self, tile: Tile):
-        for i, offset in enumerate(TILE_TO_TILE_DIRECTIONS):
-            if tile.adjacent_tiles[i] is not None:
-                continue
-            new_coords = tile.cube_coords + offset
-            if new_coords not in self.tiles:
-                self.tiles[new_coords] = Tile(new_coords, None, 0)
-            tile.adjacent_tiles[i] = self.tiles[new_coords]
-            self.tiles[new_coords].adjacent_tiles[(i + 3) % 6] = tile
-    
-    def _connect_tile_to_neighbors(self, tile: Tile):
-        for i, offset in enumerate(TILE_TO_TILE_DIRECTIONS):
-            if tile.adjacent_tiles[i] is not None:
-                continue
-            new_coords = tile.cube_coords + offset
-            if new_coords in self.tiles:
-                tile.adjacent_tiles[i] = self.tiles[new_coords]
-                self.tiles[new_coords].adjacent_tiles[(i + 3) % 6] = tile
-    
-    def _create_road_vertices_on_tile(self, tile: Tile):
-        for i, offset in enumerate(TILE_TO_ROAD_VERTEX_DIRECTIONS):
-            if tile.adjacent_road_vertices[i] is not None:
-                continue
-            vert_coords = tile.cube_coords + offset
-            new_road_vertex = RoadVertex(vert_coords, tile, i)
-            tile.adjacent_road_vertices[i] = new_road_vertex
-            new_road_vertex.adjacent_tiles.append(tile)
-            self.road_vertices[vert_coords] = new_road_vertex
-            if (tile_1 := tile.adjacent_tiles[i - 1]) is not None:
-                tile_1.adjacent_road_vertices[(i + 2) % 6] = new_road_vertex
-                new_road_vertex.adjacent_tiles.append(tile_1)
-            if (tile_2 := tile.adjacent_tiles[i]) is not None:
-                tile_2.adjacent_road_vertices[(i + 4) % 6] = new_road_vertex
-                new_road_vertex.adjacent_tiles.append(tile_2)
-
-    def _create_roads_on_tile(self, tile: Tile):
-        for i in range(6):
-            if tile.adjacent_roads[i] is not None:
-                continue
-            vert_1 = tile.adjacent_road_vertices[i]
-            vert_2 = tile.adjacent_road_vertices[(i + 1) % 6]
-            new_road = Road((vert_1, vert_2))
-            self.roads.append(new_road)
-
-            vert_1.adjacent_roads.append(new_road)
-            vert_1.adjacent_road_vertices.append(vert_2)
-            assert len(vert_1.adjacent_roads) <= 3
-            assert len(vert_1.adjacent_road_vertices) <= 3
-            vert_2.adjacent_roads.append(new_road)
-            vert_2.adjacent_road_vertices.append(vert_1)
-            assert len(vert_2.adjacent_roads) <= 3
-            assert len(vert_2.adjacent_road_vertices) <= 3
-            tile.adjacent_roads[i] = new_road
-            if (shared_tile := tile.adjacent_tiles[i]) is not None:
-                shared_tile.adjacent_roads[(i + 3) % 6] = new_road
-    
+
+    def clone(self) -> Board:
+        """
+        Copy of this board's mutable state, sharing the topology. The random stream is
+        copied too, so the copy would draw the same outcomes as this board from here on.
+        """
+        board = Board.__new__(Board)
+        board.size = self.size
+        board.rng = random.Random()
+        board.rng.setstate(self.rng.getstate())
+        board.topology = self.topology
+        board.state = self.state.copy()
+        board.development_card_deck = self.development_card_deck.copy()
+        # catalogue actions refer to this board's objects
+        board.action_catalogue = None
+        # the layout is the same, so is its table
+        board.analytics = self.analytics
+        board._create_objects()
+        # the copied arrays are already current, so set the objects' fields without writing through
+        for tile, source in zip(board.tile_list, self.tile_list):
+            fields = tile.__dict__
+            fields['resource'], fields['number'], fields['has_robber'] = source.resource, source.number, source.has_robber
+        for vertex, source in zip(board.road_vertex_list, self.road_vertex_list):
+            fields = vertex.__dict__
+            fields['harbor'], fields['owner'] = source.harbor, source.owner
+            fields['has_settlement'], fields['has_city'] = source.has_settlement, source.has_city
+            fields['_hash'] = source._hash
+        for road, source in zip(board.roads, self.roads):
+            road.__dict__['owner'] = source.owner
+            road.__dict__['_hash'] = source._hash
+        return board
+
+    def _create_objects(self):
+        """Wire this board's tiles, road vertices and roads from the shared topology."""
+        topology = self.topology
+        lists = topology.lists
+        self.tile_list = [Tile(coords, None, 0) for coords in topology.tile_coords]
+        self.road_vertex_list = [RoadVertex(coords, self.tile_list[tile_id], index_on_parent)
+                                 for coords, (tile_id, index_on_parent) in zip(topology.vertex_coords, topology.vertex_parents)]
+        self.roads = [Road((self.road_vertex_list[v1], self.road_vertex_list[v2])) for v1, v2 in lists.road_vertices]
+        tiles, vertices, roads = self.tile_list, self.road_vertex_list, self.roads
+
+        for tile, adjacent_tiles, adjacent_vertices, adjacent_roads in zip(
+                tiles, lists.tile_tiles, lists.tile_vertices, lists.tile_roads):
+            tile.adjacent_tiles = [tiles[i] if i != NONE else None for i in adjacent_tiles]
+            tile.adjacent_road_vertices = [vertices[i] for i in adjacent_vertices]
+            tile.adjacent_roads = [roads[i] for i in adjacent_roads]
+        for vertex, adjacent_tiles, adjacent_vertices, adjacent_roads in zip(
+                vertices, lists.vertex_tiles, lists.vertex_vertices, lists.vertex_roads):
+            vertex.adjacent_tiles = [tiles[i] for i in adjacent_tiles]
+            vertex.adjacent_road_vertices = [vertices[i] for i in adjacent_vertices]
+            vertex.adjacent_roads = [roads[i] for i in adjacent_roads]
+        for road, adjacent_tiles in zip(roads, lists.road_tiles):
+            road.adjacent_tiles = [tiles[i] for i in adjacent_tiles]
+
+        # fresh objects are in the same default state as the fresh arrays, so there is nothing to write yet
+        for objects in (tiles, vertices, roads):
+            for i, obj in enumerate(objects):
+                obj.id = i
+                obj._state = self.state
+
+        self.center_tile = tiles[0]
+        self.tiles = {tile.cube_coords: tile for tile in tiles}
+        self.road_vertices = {vertex.cube_coords: vertex for vertex in vertices}
+
+    def get_roll_payouts(self, roll: int) -> list[tuple[int, Resource, int]]:
+        """(player index, resource, amount) for everything a dice roll produces."""
+        return [(owner, RESOURCES[resource], amount)
+                for (owner, resource), amount in self.state.production.payouts[roll].items()]
+
+    def get_open_settlement_vertices(self) -> list[RoadVertex]:
+        """Vertices where a settlement could go ignoring road connectivity, in id order."""
+        open_ids = np.flatnonzero(open_settlement_mask(self.topology, self.state))
+        return [self.road_vertex_list[i] for i in open_ids]
+
     def set_harbors(self):
         remaining_harbor_types = list(Harbor) + [Harbor.THREE_TO_ONE] * (len(HARBOR_LOCATIONS) - len(Harbor))
-        random.shuffle(remaining_harbor_types)
+        self.rng.shuffle(remaining_harbor_types)
 
         for v1_coords, v2_coords in HARBOR_LOCATIONS:
             harbor = remaining_harbor_types.pop()
             self.road_vertices[v1_coords].harbor = harbor
             self.road_vertices[v2_coords].harbor = harbor
+        self.analytics = None
 
     def initialize_tile_info(self):
-        total_tiles = len(self.tiles)
-        
-        desert_tile = random.choice(list(self.tiles.values()))
+        """
+        Lay out the desert, resources and numbers so that no two 6/8 tiles touch. The 6s and
+        8s go down first on an independent set of tiles and the other numbers fill in around
+        them, so there is no repair loop and the cost is linear in the number of tiles.
+        """
+        desert_tile = self.rng.choice(self.tile_list)
         desert_tile.number = 0
-        desert_tile.has_robber = True
+        desert_tile.resource = None
+        self.move_robber(desert_tile)
+
+        producing_tiles = [tile for tile in self.tile_list if tile is not desert_tile]
+        resources = [resource for _, resource in zip(producing_tiles, itertools.cycle(Resource))]
+        self.rng.shuffle(resources)
+        # boards larger than the standard one reuse the token set as many times as needed
+        numbers = [NUMBER_TOKENS[i % len(NUMBER_TOKENS)] for i in range(len(producing_tiles))]
+        red_numbers = [number for number in numbers if number in RED_NUMBERS]
+        other_numbers = [number for number in numbers if number not in RED_NUMBERS]
+        self.rng.shuffle(red_numbers)
+        self.rng.shuffle(other_numbers)
+
+        red_tiles = self._choose_independent_tiles(producing_tiles, len(red_numbers))
+        red_tile_ids = {tile.id for tile in red_tiles}
+        for tile, number in zip(red_tiles, red_numbers):
+            tile.number = number
+        for tile, number in zip((tile for tile in producing_tiles if tile.id not in red_tile_ids), other_numbers):
+            tile.number = number
+        for tile, resource in zip(producing_tiles, resources):
+            tile.resource = resource
+        self.analytics = None
+
+    def _choose_independent_tiles(self, candidates: list[Tile], count: int) -> list[Tile]:
+        """Pick count random candidates, no two of them adjacent, in bounded time."""
+        if count == 0:
+            return []
+        tile_tiles = self.topology.lists.tile_tiles
+        for _ in range(INDEPENDENT_SET_ATTEMPTS):
+            chosen: list[Tile] = []
+            blocked: set[int] = set()
+            for tile in self.rng.sample(candidates, len(candidates)):
+                if tile.id in blocked:
+                    continue
+                chosen.append(tile)
+                if len(chosen) == count:
+                    return chosen
+                blocked.update(tile_tiles[tile.id])
+        # a class of the topology's tile colouring is independent by construction
+        candidate_ids = {tile.id for tile in candidates}
+        color_class = max(([self.tile_list[i] for i in color_class if i in candidate_ids]
+                           for color_class in self.topology.tile_color_classes), key=len)
+        if len(color_class) < count:
+            raise CatanException(f'Cannot place {count} non-adjacent tiles on a board of size {self.size}')
+        return self.rng.sample(color_class, count)
 
-        numbers = [2, 3, 3, 4, 4, 5, 5, 6, 6, 8, 8, 9, 9, 10, 10, 11, 11, 12]
-
-        resources_remaining: dict[Resource, int] = {}
-
-        for _, resource in zip(range(total_tiles - 1), itertools.cycle(Resource)):
-            resources_remaining[resource] = resources_remaining.get(resource, 0) + 1
-
-        for tile in self.tiles.values():
-            if tile is desert_tile:
-                continue
-            tile.number = random.choice(numbers)
-            numbers.remove(tile.number)
-            tile.resource = random.choice(list(resources_remaining.keys()))
-            resources_remaining[tile.resource] -= 1
-            if resources_remaining[tile.resource] == 0:
-                del resources_remaining[tile.resource]
-
-        def is_valid_placement(tile, new_number, swap_partner=None, partner_new_number=None):
-            for neighbor in tile.adjacent_tiles:
-                neighbor_number = partner_new_number if neighbor == swap_partner else getattr(neighbor, 'number', None)
-                if neighbor_number is not None:
-                    if new_number in (6, 8) and neighbor_number in (6, 8):
-                        return False
-            return True
-
-        def swap_tiles(tile1, tile2):
-            tile1.number, tile2.number = tile2.number, tile1.number
-            tile1.resource, tile2.resource = tile2.resource, tile1.resource
-            tile1.has_robber, tile2.has_robber = tile2.has_robber, tile1.has_robber
-
-        # Loop to fix conflicts where a 6 or 8 is adjacent to another 6 or 8.
-        conflict_found = True
-        while conflict_found:
-            conflict_found = False
-            for tile in self.tiles.values():
-                if getattr(tile, 'number', None) in (6, 8):
-                    for adj in tile.adjacent_tiles:
-                        if getattr(adj, 'number', None) in (6, 8):
-                            candidate_tiles = []
-                            for candidate in self.tiles.values():
-                                if candidate == tile:
-                                    continue
-                                if (is_valid_placement(tile, candidate.number, swap_partner=candidate, partner_new_number=tile.number) and
-                                    is_valid_placement(candidate, tile.number, swap_partner=tile, partner_new_number=candidate.number)):
-                                    candidate_tiles.append(candidate)
-                            if candidate_tiles:
-                                chosen = random.choice(candidate_tiles)
-                                swap_tiles(tile, chosen)
-                                conflict_found = True
-                                break
-                    if conflict_found:
-                        break                    
-    
     def get_robber_tile(self) -> Tile | None:
-        for tile in self.tiles.values():
-            if tile.has_robber:
-                return tile
-        return None
+        robber_tile = self.state.robber_tile
+        return self.tile_list[robber_tile] if robber_tile != NONE else None
+
+    def move_robber(self, tile: Tile | None):
+        """Move the robber to tile (or off the board), touching only the old and new tiles."""
+        old_tile = self.get_robber_tile()
+        if old_tile is tile:
+            return
+        if old_tile is not None:
+            old_tile.has_robber = False
+        if tile is not None:
+            tile.has_robber = True
     
     def get_vertex_at_pos(self, mouse_pos: tuple[float, float],
                         hexagon_size: float,
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+from catan.actions import ActionCatalogue
+from catan.agent.rl_agent import BOARD_SIZE, calculate_reward
+from catan.game import Game
+from catan.player import Player, Action
+from catan.serialization import BrickRepresentation
+from catan.sim import DEFAULT_MAX_TURNS, GameResult, SeatDriver, get_result
+
+# Single-seat environment with a reset(seed)/step(action_id) interface. The other seats are
+# played by their own agents inside step(), so every observation is a decision of the
+# learning seat, encoded from that seat's perspective by the serialization layer.
+
+# seed -> a fresh game, e.g. functools.partial(sim.create_game, agent_factories, board_size)
+GameFactory = Callable[[int | None], Game]
+RewardFunction = Callable[[Player], float]
+
+
+@dataclass
+class Observation:
+    # (players + 1, height, width), see BrickRepresentation.board
+    board: np.ndarray
+    player_state: np.ndarray
+    # over the board's ActionCatalogue, True for the ids of the legal actions
+    action_mask: np.ndarray
+
+
+class CatanEnv:
+    '''
+    Episodes are games built by new_game, played from seat's point of view. Action ids are
+    ActionCatalogue ids, so the same id means the same move in every state of every game on
+    boards of one size. The observation returned once the game is over has an all-False mask.
+    '''
+    new_game: GameFactory
+    seat: int
+    max_turns: int
+    reward: RewardFunction
+    game: Game | None
+    catalogue: ActionCatalogue | None
+    _driver: SeatDriver | None
+    # catalogue ids of the current decision's possible actions
+    _legal_ids: list[int]
+    _encoder: BrickRepresentation | None
+
+    def __init__(
+            self,
+            new_game: GameFactory,
+            seat: int,
+            max_turns: int = DEFAULT_MAX_TURNS,
+            reward: RewardFunction = calculate_reward,
+    ):
+        self.new_game = new_game
+        self.seat = seat
+        self.max_turns = max_turns
+        self.reward = reward
+        self.game = None
+        self.catalogue = None
+        self._driver = None
+        self._legal_ids = []
+        self._encoder = None
+
+    @property
+    def player(self) -> Player:
+        return self.game.player_agents[self.seat].player
+
+    @property
+    def done(self) -> bool:
+        return self._driver is None or self._driver.decision is None
+
+    @property
+    def legal_actions(self) -> list[Action]:
+        """The actions the current decision offers."""
+        return [] if self.done else self._driver.decision.possible_actions
+
+    @property
+    def result(self) -> GameResult:
+        return get_result(self.game)
+
+    def reset(self, seed: int | None = None) -> Observation:
+        """Start a new game and play it up to the seat's first decision."""
+        self.game = self.new_game(seed)
+        self.catalogue = ActionCatalogue.for_board(self.game.board)
+        if self._encoder is None or self._encoder.num_players != len(self.game.player_agents):
+            self._encoder = BrickRepresentation(BOARD_SIZE, len(self.game.player_agents), self.game, self.seat)
+        self._encoder.game = self.game
+        self._encoder.agent_player_num = self.seat
+        self._driver = SeatDriver(self.game, self.seat, self.max_turns)
+        self._driver.advance()
+        return self._observe()
+
+    def step(self, action_id: int) -> tuple[Observation, float, bool, dict]:
+        """
+        Perform the legal action with catalogue id action_id for the seat and play on to
+        its next decision.
+        Returns the observation there, the seat's reward, whether the game is over, and an
+        info dict holding the game's GameResult once it is.
+        """
+        if self.done:
+            raise RuntimeError("step() called on a finished game, call reset() first")
+        if action_id not in self._legal_ids:
+            raise ValueError(f"Action id {action_id} is not legal in this state")
+        self._driver.advance(self.legal_actions[self._legal_ids.index(action_id)])
+        observation = self._observe()
+        info = {"result": self.result} if self.done else {}
+        return observation, self.reward(self.player), self.done, info
+
+    def _observe(self) -> Observation:
+        self._encoder.encode_all(self.player)
+        self._legal_ids = [self.catalogue.get_id(action) for action in self.legal_actions]
+        mask = self.catalogue.get_mask(self._legal_ids)
+        # the encoder's buffers are overwritten by the next encode
+        return Observation(self._encoder.board.copy(), self._encoder.player_states.copy(), mask)
@@ -1,11 +1,14 @@
+import copy
 import random
 from dataclasses import dataclass
 from enum import Enum
-from typing import Callable
+from typing import Callable, Generator, TypeVar
 
 from catan.agent.human import HumanAgent
-from catan.board import Board, RoadVertex
-from catan.player import Player
+from catan.board import Board, RoadVertex, Tile, DevCard
+from catan.game_record import GameRecorder, RecordKind, NO_VALUE
+from catan.longest_road import LongestRoadTracker
+from catan.player import Player, PlayerCheckpoint, Action, BuyDevelopmentCardAction, EndTurnAction
 from catan.agent import Agent
 
 from globals import DEV_MODE
@@ -19,11 +22,36 @@ class PlayerAgent:
     def as_tuple(self) -> tuple[Player, Agent]:
         return (self.player, self.agent)
 
+T = TypeVar('T')
+
+
+@dataclass
+class Decision:
+    '''A choice between several actions that a player has to make before the game can go on.'''
+    player_index: int
+    possible_actions: list[Action]
+
+
 class GamePhase(Enum):
     SETUP = 0
     MAIN = 1
 
 
+@dataclass
+class GameCheckpoint:
+    '''Enough of a game's state to take back the actions applied after it, see Game.checkpoint().'''
+    players: list[PlayerCheckpoint]
+    player_turn_index: int
+    winning_player_index: int | None
+    setup_turns_elapsed: int
+    main_turns_elapsed: int
+    game_phase: GamePhase
+    robber_tile: Tile | None
+    deck: list[DevCard]
+    # only kept when the longest roads may be recomputed, i.e. when a turn can end
+    longest_road_tracker: LongestRoadTracker | None
+
+
 class Game:
     board: Board
     player_agents: list[PlayerAgent]
@@ -34,13 +62,18 @@ class Game:
     game_phase: GamePhase
     setup_round_count: int
     longest_road_length: int
+    longest_road_tracker: LongestRoadTracker
     largest_army_size: int
     human_dice_rolled: bool
     setup_turn_counter: int
     has_human: bool
+    # bumped by every undo(), so caches built incrementally from the game's state know to start over
+    undo_count: int
+    # optional event log of every decision and random outcome, see catan.game_record
+    recorder: GameRecorder | None
 
     ''' keep track of the state of the game'''
-    def __init__(self, board: Board, player_agents: list[PlayerAgent]):
+    def __init__(self, board: Board, player_agents: list[PlayerAgent], recorder: GameRecorder | None = None, seed: int | None = None):
         self.board = board
         self.board.initialize_tile_info()
         self.board.set_harbors()
@@ -52,14 +85,110 @@ class Game:
         self.game_phase = GamePhase.SETUP
         self.setup_round_count = 2
         self.longest_road_length = 4
+        self.longest_road_tracker = LongestRoadTracker([pa.player for pa in player_agents])
         self.largest_army_size = 2
         self.human_dice_rolled = False
         self.has_human = any(isinstance(pa.agent, HumanAgent) for pa in player_agents)
         self.setup_stage = 0
         self.setup_turn_counter = 0
+        self.undo_count = 0
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.start_game(self, seed)
+
+    @property
+    def rng(self) -> random.Random:
+        """The game's random stream, shared with its board so a seed determines the whole game."""
+        return self.board.rng
+
+    def clone(self) -> 'Game':
+        """
+        Copy of the game's mutable state for branching a position, far cheaper than deepcopy.
+        The copy's agents are shallow copies bound to its own board and players, so models
+        are shared rather than copied, and the copy never records.
+        """
+        game = copy.copy(self)
+        game.board = self.board.clone()
+        game.player_agents = []
+        for player_agent in self.player_agents:
+            player = player_agent.player.clone(game.board)
+            game.player_agents.append(PlayerAgent(player, player_agent.agent.clone(game.board, player)))
+        game.longest_road_tracker = self.longest_road_tracker.copy([pa.player for pa in game.player_agents], game.board.roads)
+        game.recorder = None
+        return game
+
+    def checkpoint(self, include_longest_road: bool = True) -> GameCheckpoint:
+        """
+        Capture the state that playing on can change, for undo(). Copying the longest road
+        tracker is the expensive part and can be skipped if no turn will end before the undo.
+        """
+        return GameCheckpoint(
+            [pa.player.checkpoint() for pa in self.player_agents],
+            self.player_turn_index, self.winning_player_index, self.setup_turns_elapsed,
+            self.main_turns_elapsed, self.game_phase, self.board.get_robber_tile(),
+            self.board.development_card_deck.cards.copy(),
+            self.longest_road_tracker.copy(self.longest_road_tracker.players, self.board.roads) if include_longest_road else None)
+
+    def undo(self, checkpoint: GameCheckpoint):
+        """
+        Return to a checkpoint. Nested checkpoints must be undone newest first. The random
+        stream is not rewound, so replaying a line after an undo draws fresh outcomes.
+        """
+        self.undo_count += 1
+        for player_agent, player_checkpoint in zip(self.player_agents, checkpoint.players):
+            player_agent.player.rollback(player_checkpoint)
+        self.player_turn_index = checkpoint.player_turn_index
+        self.winning_player_index = checkpoint.winning_player_index
+        self.setup_turns_elapsed = checkpoint.setup_turns_elapsed
+        self.main_turns_elapsed = checkpoint.main_turns_elapsed
+        self.game_phase = checkpoint.game_phase
+        self.board.move_robber(checkpoint.robber_tile)
+        self.board.development_card_deck.cards = checkpoint.deck.copy()
+        if checkpoint.longest_road_tracker is not None:
+            tracker = checkpoint.longest_road_tracker
+            self.longest_road_tracker = tracker.copy(tracker.players, self.board.roads)
+
+    def apply_action(self, action: Action, player_index: int | None = None) -> GameCheckpoint:
+        """play_action() that also returns the checkpoint undoing it."""
+        is_end_turn = isinstance(action, EndTurnAction)
+        checkpoint = self.checkpoint(include_longest_road=is_end_turn)
+        self.play_action(action, player_index)
+        return checkpoint
+
+    def play_action(self, action: Action, player_index: int | None = None) -> bool:
+        """
+        Perform an action for search, with the bookkeeping play_turn() does after it: a setup
+        placement counts as a setup turn (in the turn order without a human), and an
+        EndTurnAction in the main phase also finishes the turn, so the next player is up
+        (after a roll). Returns whether a main turn ended. Meant for clones: the action is
+        not recorded.
+        """
+        if player_index is None:
+            player_index = self.player_turn_index
+        turn_ended = self.player_agents[player_index].player.perform_action(action, self.board, self)
+        if self.game_phase == GamePhase.SETUP:
+            self.setup_turns_elapsed += 1
+            return False
+        if turn_ended:
+            self.end_main_turn()
+        return turn_ended
+
+    def is_setup_complete(self) -> bool:
+        return self.setup_turns_elapsed >= 2 * len(self.player_agents) * self.setup_round_count
 
-    def perform_dice_roll(self):
-        roll = random.randint(1, 6) + random.randint(1, 6)
+    def get_setup_player_index(self) -> int:
+        """Who places next in the setup phase without a human: in seat order, then reversed each round."""
+        n = len(self.player_agents)
+        current_round, remainder = divmod(self.setup_turns_elapsed, 2 * n)
+        player_index_in_round = remainder // 2
+        return player_index_in_round if current_round % 2 == 0 else n - 1 - player_index_in_round
+
+    def perform_dice_roll(self, roll: int | None = None):
+        """Roll the dice, or resolve the given roll, e.g. when a search enumerates them."""
+        if roll is None:
+            roll = self.rng.randint(1, 6) + self.rng.randint(1, 6)
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.ROLL, self.player_turn_index, roll)
         if DEV_MODE:
             print(f"Rolled a {roll}")
 
@@ -67,13 +196,11 @@ class Game:
             self.discard_half_resources_from_all()
             self.move_robber_and_steal(self.player_turn_index)
             return
+        self.produce_resources(roll)
 
-        for tile in self.board.tiles.values():
-            if tile.number == roll and not tile.has_robber:
-                for road_vertex in tile.adjacent_road_vertices:
-                    if road_vertex.has_settlement and road_vertex.owner is not None:
-                        count = 2 if road_vertex.has_city else 1
-                        self.player_agents[road_vertex.owner].player.give_resource(tile.resource, count)
+    def produce_resources(self, roll: int):
+        for owner, resource, amount in self.board.get_roll_payouts(roll):
+            self.player_agents[owner].player.give_resource(resource, amount)
 
     def move_robber_and_steal(self, player_index: int, location = None):
         player, agent = self.player_agents[player_index].as_tuple()
@@ -81,33 +208,43 @@ class Game:
             location = agent.get_robber_placement(self)
         if DEV_MODE:
             print(f"Player {self.player_turn_index + 1} moves robber to {location}")
-        for tile in self.board.tiles.values():
-            tile.has_robber = tile.cube_coords == location
-            if tile.has_robber and not isinstance(agent, HumanAgent):
-                players_on_tile = [vertex.owner for vertex in tile.adjacent_road_vertices \
-                                   if vertex.owner is not None and vertex.owner != player_index]
-                if players_on_tile:
-                    steal_from = agent.get_player_to_steal_from(self, players_on_tile)
-                    target_player = self.player_agents[steal_from].player
-                    if target_player.get_resource_count() == 0:
-                        continue
-                    resource = target_player.take_random_resources(1)[0]
-                    player.give_resource(resource, 1)
-                    if DEV_MODE:
-                        print(f"Player {self.player_turn_index + 1} steals from Player {steal_from + 1}")
+        tile = self.board.tiles.get(location)
+        self.board.move_robber(tile)
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.ROBBER, player_index, NO_VALUE if tile is None else tile.id)
+        if tile is None or isinstance(agent, HumanAgent):
+            return
+        players_on_tile = [vertex.owner for vertex in tile.adjacent_road_vertices \
+                           if vertex.owner is not None and vertex.owner != player_index]
+        if players_on_tile:
+            steal_from = agent.get_player_to_steal_from(self, players_on_tile)
+            target_player = self.player_agents[steal_from].player
+            if target_player.get_resource_count() == 0:
+                return
+            resource = target_player.take_random_resources(1, self.rng)[0]
+            player.give_resource(resource, 1)
+            if self.recorder is not None:
+                self.recorder.record(RecordKind.STEAL, player_index, steal_from, resource.value)
+            if DEV_MODE:
+                print(f"Player {self.player_turn_index + 1} steals from Player {steal_from + 1}")
     
     def discard_half_resources_from_all(self):
         for player_agent in self.player_agents:
             player = player_agent.player
             if player.get_resource_count() > 7:
                 discard_count = player.get_resource_count() // 2
-                _ = player.take_random_resources(discard_count)
+                discarded = player.take_random_resources(discard_count, self.rng)
+                if self.recorder is not None:
+                    for resource in set(discarded):
+                        self.recorder.record(RecordKind.DISCARD, player.index, resource.value, discarded.count(resource))
                 if DEV_MODE:
                     print(f"Player {player.index + 1} discards {discard_count} resources")
     
     def select_and_give_resource(self, player_index: int):
         player, agent = self.player_agents[player_index].as_tuple()
         resource = agent.get_most_needed_resource(self)
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.CHOOSE_RESOURCE, player_index, resource.value)
         player.give_resource(resource, 1)
 
     def select_and_steal_all_resources(self, player_index: int, chosen_resource = None):
@@ -116,6 +253,8 @@ class Game:
             resource = chosen_resource
         else:
             resource = agent.get_most_needed_resource(self)
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.CHOOSE_RESOURCE, player_index, resource.value)
         count = 0
         for player_agent in self.player_agents:
             if player_agent.player.index != player_index:
@@ -148,8 +287,9 @@ class Game:
     def recompute_longest_road(self):
         def set_award(player: Player, award: bool):
             player.has_longest_road = award
+        self.longest_road_tracker.update()
         self.award_from_highest_score(
-            lambda player: player.find_longest_road_size(),
+            lambda player: player.longest_road_size,
             set_award,
             5
         )
@@ -164,6 +304,8 @@ class Game:
         )
 
     def award_initial_resources(self, player: Player, settlement: RoadVertex):
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.SETUP_AWARD, player.index, settlement.id)
         adjacent_tiles = [tile for tile in self.board.tiles.values() 
                           if settlement in tile.adjacent_road_vertices]
         for tile in adjacent_tiles:
@@ -174,24 +316,69 @@ class Game:
 
     # returns whether the player has ended their turn
     def get_and_perform_player_action(self, player_index: int = None):
+        return self._answer(self._player_action(player_index))
+
+    def _player_action(self, player_index: int | None = None) -> Generator[Decision, Action, bool | None]:
         # Use the provided index if given, else use the stored player_turn_index.
         if player_index is None:
             player_index = self.player_turn_index
-        # tuple unpacking moment
-        player, agent = self.player_agents[player_index].as_tuple()
+        player = self.player_agents[player_index].player
         all_possible_actions = player.get_all_possible_actions(self.board, self.game_phase == GamePhase.SETUP)
         if not all_possible_actions:
-            return
+            return None
         elif len(all_possible_actions) == 1:
-            return player.perform_action(all_possible_actions[0], self.board, self)
+            action = all_possible_actions[0]
         else:
-            action = agent.get_action(self, all_possible_actions)
+            action = yield Decision(player_index, all_possible_actions)
+        return self.perform_player_action(player_index, action)
+
+    def perform_player_action(self, player_index: int, action: Action) -> bool:
+        player = self.player_agents[player_index].player
+        if self.recorder is None:
             return player.perform_action(action, self.board, self)
+        self.recorder.record_action(player_index, action)
+        turn_ended = player.perform_action(action, self.board, self)
+        if isinstance(action, BuyDevelopmentCardAction):
+            self.recorder.record(RecordKind.DRAW_DEVELOPMENT_CARD, player_index, player.unplayed_dev_cards[-1].card_type.value)
+        return turn_ended
+
+    def _answer(self, steps: Generator[Decision, Action, T]) -> T:
+        """Run steps to the end, asking the deciding player's agent for every Decision it yields."""
+        try:
+            decision = next(steps)
+            while True:
+                agent = self.player_agents[decision.player_index].agent
+                decision = steps.send(agent.get_action(self, decision.possible_actions))
+        except StopIteration as stop:
+            return stop.value
     
     def advance_player_turn(self):
         self.player_turn_index = (self.player_turn_index + 1) % len(self.player_agents)
     
+    def start_main_phase(self):
+        self.game_phase = GamePhase.MAIN
+        for pa in self.player_agents:
+            pa.player.pending_settlement_for_road = None
+        self.player_turn_index = 0
+
+    def end_main_turn(self):
+        self.main_turns_elapsed += 1
+        self.recompute_longest_road()
+        self.recompute_largest_army()
+        for player_agent in self.player_agents:
+            if player_agent.player.get_victory_points() >= 10:
+                self.winning_player_index = player_agent.player.index
+                return
+        self.advance_player_turn()
+
     def do_full_turn(self):
+        self._answer(self.play_turn())
+
+    def play_turn(self) -> Generator[Decision, Action, None]:
+        """
+        do_full_turn() as a generator: instead of asking agents, it yields a Decision whenever
+        a player has a choice to make and continues once the chosen action is sent back.
+        """
         if self.winning_player_index is not None:
             return
 
@@ -216,14 +403,14 @@ class Game:
                     else:
                         if DEV_MODE:
                             print(f"Bot {current_player_index + 1} auto-turn: placing settlement and road.")
-                        self.get_and_perform_player_action(current_player_index)  # settlement
+                        yield from self._player_action(current_player_index)  # settlement
 
                         player = self.player_agents[current_player_index].player
                         if len(player.settlements) == 2:
                             settlement = player.settlements[-1]
                             self.award_initial_resources(player, settlement)
 
-                        self.get_and_perform_player_action(current_player_index)  # road
+                        yield from self._player_action(current_player_index)  # road
                         self.setup_turn_counter += 1
                         if self.setup_turn_counter < len(total_order):
                             self.player_turn_index = total_order[self.setup_turn_counter]
@@ -238,26 +425,17 @@ class Game:
                 n = len(self.player_agents)
                 actions_per_player = 2  # settlement then road
                 total_actions_in_round = n * actions_per_player
-                total_setup_turns = total_actions_in_round * self.setup_round_count
 
-                if self.setup_turns_elapsed >= total_setup_turns:
-                    self.game_phase = GamePhase.MAIN
-                    for pa in self.player_agents:
-                        pa.player.pending_settlement_for_road = None
-                    self.player_turn_index = 0
+                if self.is_setup_complete():
+                    self.start_main_phase()
                     return
 
                 current_round = self.setup_turns_elapsed // total_actions_in_round
                 remainder = self.setup_turns_elapsed % total_actions_in_round
-                player_index_in_round = remainder // actions_per_player
                 action_index = remainder % actions_per_player  # 0 for settlement, 1 for road
+                current_player_index = self.get_setup_player_index()
 
-                if current_round % 2 == 0:
-                    current_player_index = player_index_in_round
-                else:
-                    current_player_index = n - 1 - player_index_in_round
-
-                self.get_and_perform_player_action(current_player_index)
+                yield from self._player_action(current_player_index)
 
                 if action_index == 0:
                     if DEV_MODE:
@@ -275,16 +453,11 @@ class Game:
         else:
             # MAIN phase: roll dice, process actions until turn ends, etc.
             self.perform_dice_roll()
-            while not self.get_and_perform_player_action():
+            while not (yield from self._player_action()):
                 pass
-            self.main_turns_elapsed += 1
-            self.recompute_longest_road()
-            self.recompute_largest_army()
-            for player_agent in self.player_agents:
-                if player_agent.player.get_victory_points() >= 10:
-                    self.winning_player_index = player_agent.player.index
-                    return
-            self.advance_player_turn()
+            self.end_main_turn()
+            if self.recorder is not None and self.winning_player_index is None:
+                self.recorder.end_turn(self)
 
     def human_dice_roll(self):
         self.perform_dice_roll()
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import enum
+import os
+from typing import IO, TYPE_CHECKING, Iterator
+
+import numpy as np
+
+from catan.board import Resource
+from catan.player import Action, EndTurnAction, BuildSettlementAction, BuildCityAction, BuildRoadAction, BuyDevelopmentCardAction, UseDevelopmentCardAction, TradeAction
+if TYPE_CHECKING:
+    from catan.game import Game
+
+# A game record is a flat sequence of fixed-size 8 byte records: a kind, the acting player
+# and three 16-bit fields. It starts with a GAME_START header, the seed and the board
+# layout, followed by every decision and every random outcome in the order they happen,
+# and ends with GAME_END. Records of many games are simply concatenated, which makes the
+# log append-only and lets a reader split it wherever a GAME_START appears.
+# Every few main turns the recorder also embeds a snapshot of the state that cannot be
+# rebuilt from the builds alone (hands, cards, awards, robber), so catan.replay can jump
+# to a turn without replaying every event before it.
+
+RECORD_DTYPE = np.dtype([("kind", "u1"), ("player", "i1"), ("a", "<u2"), ("b", "<u2"), ("c", "<u2")])
+RECORD_FORMAT_VERSION = 2
+NO_PLAYER = -1
+# stands in for None (no seed, no winner, robber off the board) in the 16-bit fields
+NO_VALUE = 0xFFFF
+SEED_BITS = 64
+DEFAULT_SNAPSHOT_INTERVAL = 20
+
+
+class RecordKind(enum.IntEnum):
+    # header: player = number of players, a = board size, b = 1 if seeded, c = format version
+    GAME_START = 0
+    # c = part index, a/b = low/high 16 bits of the 32 seed bits in that part
+    SEED = 1
+    # a = tile id, b = resource value + 1 (0 for the desert), c = number
+    TILE = 2
+    # a = vertex id, b = harbor value
+    HARBOR = 3
+    # actions; a/b/c as noted
+    END_TURN = 10
+    BUILD_SETTLEMENT = 11  # a = vertex id, b = paid for
+    BUILD_CITY = 12  # a = vertex id, b = paid for
+    BUILD_ROAD = 13  # a = road id, b = paid for
+    BUY_DEVELOPMENT_CARD = 14
+    USE_DEVELOPMENT_CARD = 15  # a = card type
+    TRADE = 16  # a = resource given, b = count given, c = resource received
+    # outcomes and follow-up choices
+    SETUP_AWARD = 20  # a = settlement vertex id
+    ROLL = 21  # a = roll
+    DISCARD = 22  # a = resource, b = count
+    ROBBER = 23  # a = tile id
+    STEAL = 24  # a = victim, b = resource
+    DRAW_DEVELOPMENT_CARD = 25  # a = card type
+    CHOOSE_RESOURCE = 26  # a = resource (year of plenty and monopoly picks)
+    # a = winner (NO_VALUE if none), b = main turns elapsed
+    GAME_END = 30
+    # snapshot of the state at the start of a main turn, before its roll. The header is
+    # followed by the details of every player:
+    SNAPSHOT = 40  # a = main turns elapsed, b = player to move, c = robber tile id (NO_VALUE if none)
+    SNAPSHOT_PLAYER = 41  # a = army size, b = 1 if longest road + 2 if largest army
+    SNAPSHOT_RESOURCES = 42  # a = resource, b = count (resources the player has none of are left out)
+    SNAPSHOT_DEV_CARD = 43  # a = card type, b = played, c = on cooldown
+
+
+ACTION_KINDS = frozenset({
+    RecordKind.END_TURN, RecordKind.BUILD_SETTLEMENT, RecordKind.BUILD_CITY, RecordKind.BUILD_ROAD,
+    RecordKind.BUY_DEVELOPMENT_CARD, RecordKind.USE_DEVELOPMENT_CARD, RecordKind.TRADE,
+})
+SNAPSHOT_KINDS = frozenset({
+    RecordKind.SNAPSHOT, RecordKind.SNAPSHOT_PLAYER, RecordKind.SNAPSHOT_RESOURCES, RecordKind.SNAPSHOT_DEV_CARD,
+})
+
+
+def encode_action(action: Action) -> tuple[RecordKind, int, int, int]:
+    if isinstance(action, EndTurnAction):
+        return RecordKind.END_TURN, 0, 0, 0
+    elif isinstance(action, BuildSettlementAction):
+        return RecordKind.BUILD_SETTLEMENT, action.road_vertex.id, int(action.pay_for), 0
+    elif isinstance(action, BuildCityAction):
+        return RecordKind.BUILD_CITY, action.road_vertex.id, int(action.pay_for), 0
+    elif isinstance(action, BuildRoadAction):
+        return RecordKind.BUILD_ROAD, action.road.id, int(action.pay_for), 0
+    elif isinstance(action, BuyDevelopmentCardAction):
+        return RecordKind.BUY_DEVELOPMENT_CARD, 0, 0, 0
+    elif isinstance(action, UseDevelopmentCardAction):
+        return RecordKind.USE_DEVELOPMENT_CARD, action.card.card_type.value, 0, 0
+    elif isinstance(action, TradeAction):
+        return RecordKind.TRADE, action.giving[0].value, len(action.giving), action.receiving[0].value
+    raise ValueError(f"Cannot record action {action}")
+
+
+class GameRecorder:
+    '''
+    Collects the records of one game at a time. Game calls the record_* hooks as it plays;
+    end_game() returns the finished game's bytes and, if the recorder was given a binary
+    stream, appends them to it, so a whole batch streams into one append-only file.
+    A snapshot is embedded every snapshot_interval main turns (never, if it is 0).
+    '''
+    stream: IO[bytes] | None
+    snapshot_interval: int
+    rows: list[tuple[int, int, int, int, int]]
+
+    def __init__(self, stream: IO[bytes] | None = None, snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        self.stream = stream
+        self.snapshot_interval = snapshot_interval
+        self.rows = []
+
+    def record(self, kind: RecordKind, player: int = NO_PLAYER, a: int = 0, b: int = 0, c: int = 0):
+        self.rows.append((kind, player, a, b, c))
+
+    def start_game(self, game: Game, seed: int | None):
+        self.rows = []
+        board = game.board
+        self.record(RecordKind.GAME_START, len(game.player_agents), board.size, int(seed is not None), RECORD_FORMAT_VERSION)
+        if seed is not None:
+            if not 0 <= seed < 1 << SEED_BITS:
+                raise ValueError(f"Recorded seeds must fit in {SEED_BITS} unsigned bits")
+            for part in range(SEED_BITS // 32):
+                bits = (seed >> (32 * part)) & 0xFFFFFFFF
+                self.record(RecordKind.SEED, NO_PLAYER, bits & 0xFFFF, bits >> 16, part)
+        for tile in board.tile_list:
+            resource = 0 if tile.resource is None else tile.resource.value + 1
+            self.record(RecordKind.TILE, NO_PLAYER, tile.id, resource, tile.number)
+        for vertex in board.road_vertex_list:
+            if vertex.harbor is not None:
+                self.record(RecordKind.HARBOR, NO_PLAYER, vertex.id, vertex.harbor.value)
+
+    def record_action(self, player_index: int, action: Action):
+        kind, a, b, c = encode_action(action)
+        self.record(kind, player_index, a, b, c)
+
+    def end_turn(self, game: Game):
+        if self.snapshot_interval and game.main_turns_elapsed % self.snapshot_interval == 0:
+            self.record_snapshot(game)
+
+    def record_snapshot(self, game: Game):
+        robber_tile = game.board.state.robber_tile
+        self.record(RecordKind.SNAPSHOT, NO_PLAYER, game.main_turns_elapsed, game.player_turn_index,
+                    NO_VALUE if robber_tile < 0 else robber_tile)
+        for player_agent in game.player_agents:
+            player = player_agent.player
+            flags = int(player.has_longest_road) | int(player.has_largest_army) << 1
+            self.record(RecordKind.SNAPSHOT_PLAYER, player.index, player.army_size, flags)
+            for resource, count in player.resources.items():
+                if count:
+                    self.record(RecordKind.SNAPSHOT_RESOURCES, player.index, resource.value, count)
+            for played, cards in ((0, player.unplayed_dev_cards), (1, player.played_dev_cards)):
+                for card in cards:
+                    self.record(RecordKind.SNAPSHOT_DEV_CARD, player.index, card.card_type.value, played, int(card.on_cooldown))
+
+    def end_game(self, game: Game) -> bytes:
+        winner = NO_VALUE if game.winning_player_index is None else game.winning_player_index
+        self.record(RecordKind.GAME_END, NO_PLAYER, winner, game.main_turns_elapsed)
+        data = np.array(self.rows, dtype=RECORD_DTYPE).tobytes()
+        self.rows = []
+        if self.stream is not None:
+            self.stream.write(data)
+        return data
+
+
+def parse_records(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=RECORD_DTYPE)
+
+
+def split_games(records: np.ndarray) -> list[np.ndarray]:
+    """Split concatenated records into one array per game."""
+    starts = np.flatnonzero(records["kind"] == RecordKind.GAME_START)
+    return np.split(records, starts[1:]) if len(starts) else []
+
+
+def read_game_records(path: str) -> Iterator[np.ndarray]:
+    """Yield the records of every complete game in a log file, memory-mapping rather than loading it."""
+    # a writer that died mid-game can leave a partial record or game at the end; both are skipped
+    count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+    for game in split_games(records):
+        if game[-1]["kind"] == RecordKind.GAME_END:
+            yield game
+
+
+def get_seed(records: np.ndarray) -> int | None:
+    header = records[0]
+    if not header["b"]:
+        return None
+    seed = 0
+    for row in records[records["kind"] == RecordKind.SEED]:
+        seed |= (int(row["a"]) | int(row["b"]) << 16) << (32 * int(row["c"]))
+    return seed
+
+
+def get_layout(records: np.ndarray) -> tuple[list[tuple[Resource | None, int]], dict[int, int]]:
+    """Tile (resource, number) in tile id order, and harbor values by vertex id."""
+    tiles = [(None if row["b"] == 0 else Resource(int(row["b"]) - 1), int(row["c"]))
+             for row in records[records["kind"] == RecordKind.TILE]]
+    harbors = {int(row["a"]): int(row["b"]) for row in records[records["kind"] == RecordKind.HARBOR]}
+    return tiles, harbors
+
+
+def get_result(records: np.ndarray) -> tuple[int | None, int]:
+    """(winner, main turns elapsed) from a complete game's GAME_END record."""
+    end = records[-1]
+    return (None if end["a"] == NO_VALUE else int(end["a"])), int(end["b"])
@@ -0,0 +1,171 @@
+from dataclasses import dataclass, field
+
+from catan.board import Road, RoadVertex
+from catan.player import Player
+
+
+@dataclass(eq=False)
+class RoadComponent:
+    # roads of one player that are connected through vertices the player may pass through
+    roads: set[Road]
+    longest_road_size: int = 0
+    longest_road_path: list[Road] = field(default_factory=list)
+    dirty: bool = True
+
+
+class LongestRoadTracker:
+    '''
+    Incremental replacement for calling Player.find_longest_road_size on every player.
+
+    Each player's roads are grouped into connected components. A new road merges the
+    components it touches, and an opponent's new settlement splits the components running
+    through its vertex. Only those components are searched again; every other component
+    keeps its cached result. Player.roads and Player.settlements only ever grow, so the
+    tracker just remembers how much of each list it has already seen.
+    '''
+    players: list[Player]
+    components: list[list[RoadComponent]]
+    # total DFS nodes visited over the tracker's lifetime, for measuring the savings
+    dfs_nodes_visited: int
+
+    def __init__(self, players: list[Player]):
+        self.players = players
+        self.components = [[] for _ in players]
+        self.dfs_nodes_visited = 0
+        self._component_of: list[dict[Road, RoadComponent]] = [{} for _ in players]
+        self._roads_seen = [0 for _ in players]
+        self._settlements_seen = [0 for _ in players]
+
+    def copy(self, players: list[Player], roads: list[Road]) -> 'LongestRoadTracker':
+        '''Copy for the given players, with roads (indexed by id) standing in for this tracker's roads.'''
+        tracker = LongestRoadTracker(players)
+        for i, components in enumerate(self.components):
+            component_of = tracker._component_of[i]
+            for component in components:
+                copied = RoadComponent({roads[road.id] for road in component.roads}, component.longest_road_size,
+                                       [roads[road.id] for road in component.longest_road_path], component.dirty)
+                tracker.components[i].append(copied)
+                for road in copied.roads:
+                    component_of[road] = copied
+        tracker.dfs_nodes_visited = self.dfs_nodes_visited
+        tracker._roads_seen = self._roads_seen.copy()
+        tracker._settlements_seen = self._settlements_seen.copy()
+        return tracker
+
+    @staticmethod
+    def _is_passable(road_vertex: RoadVertex, player_index: int) -> bool:
+        # Opposing player settlements break up road chains
+        return road_vertex.owner is None or road_vertex.owner == player_index
+
+    def update(self):
+        '''Fold in every road and settlement built since the last call and refresh the players' longest roads.'''
+        for i, player in enumerate(self.players):
+            for road in player.roads[self._roads_seen[i]:]:
+                self._add_road(i, road)
+            self._roads_seen[i] = len(player.roads)
+
+        for i, player in enumerate(self.players):
+            for settlement in player.settlements[self._settlements_seen[i]:]:
+                self._split_at(settlement)
+            self._settlements_seen[i] = len(player.settlements)
+
+        for i, player in enumerate(self.players):
+            best: RoadComponent | None = None
+            for component in self.components[i]:
+                if component.dirty:
+                    self._evaluate(player.index, component)
+                if best is None or component.longest_road_size > best.longest_road_size:
+                    best = component
+            player.longest_road_size = best.longest_road_size if best else 0
+            player.longest_road_path = best.longest_road_path.copy() if best else []
+
+    def _add_road(self, i: int, road: Road):
+        player_index = self.players[i].index
+        component_of = self._component_of[i]
+        touching: list[RoadComponent] = []
+        for road_vertex in road.endpoints:
+            if not self._is_passable(road_vertex, player_index):
+                continue
+            for adjacent_road in road_vertex.adjacent_roads:
+                component = component_of.get(adjacent_road)
+                if component is not None and component not in touching:
+                    touching.append(component)
+
+        merged = RoadComponent({road})
+        for component in touching:
+            merged.roads |= component.roads
+            self.components[i].remove(component)
+        for merged_road in merged.roads:
+            component_of[merged_road] = merged
+        self.components[i].append(merged)
+
+    def _split_at(self, road_vertex: RoadVertex):
+        for i, player in enumerate(self.players):
+            if player.index == road_vertex.owner:
+                continue
+            component_of = self._component_of[i]
+            affected: list[RoadComponent] = []
+            for road in road_vertex.adjacent_roads:
+                component = component_of.get(road)
+                if component is not None and component not in affected:
+                    affected.append(component)
+            for component in affected:
+                self.components[i].remove(component)
+                for new_component in self._connected_components(player.index, component.roads):
+                    for road in new_component.roads:
+                        component_of[road] = new_component
+                    self.components[i].append(new_component)
+
+    def _connected_components(self, player_index: int, roads: set[Road]) -> list[RoadComponent]:
+        remaining = set(roads)
+        components = []
+        while remaining:
+            start = remaining.pop()
+            component_roads = {start}
+            stack = [start]
+            while stack:
+                road = stack.pop()
+                for road_vertex in road.endpoints:
+                    if not self._is_passable(road_vertex, player_index):
+                        continue
+                    for adjacent_road in road_vertex.adjacent_roads:
+                        if adjacent_road in remaining:
+                            remaining.remove(adjacent_road)
+                            component_roads.add(adjacent_road)
+                            stack.append(adjacent_road)
+            components.append(RoadComponent(component_roads))
+        return components
+
+    def _evaluate(self, player_index: int, component: RoadComponent):
+        # Same exhaustive search as Player.find_longest_road_size, restricted to one component
+        max_length = 0
+        best_path: list[Road] = []
+        visited_roads: set[Road] = set()
+        current_path: list[Road] = []
+
+        def dfs(vertex: RoadVertex, current_length: int):
+            nonlocal max_length, best_path
+            self.dfs_nodes_visited += 1
+            if current_length > max_length:
+                max_length = current_length
+                best_path = current_path.copy()
+            if not self._is_passable(vertex, player_index):
+                return
+
+            for road in vertex.adjacent_roads:
+                if road in component.roads and road not in visited_roads:
+                    visited_roads.add(road)
+                    next_vertex = road.endpoints[0] if road.endpoints[0] != vertex else road.endpoints[1]
+                    current_path.append(road)
+                    dfs(next_vertex, current_length + 1)
+                    current_path.pop()
+                    visited_roads.remove(road)
+
+        vertices_to_check = {vertex for road in component.roads for vertex in road.endpoints}
+        for vertex in vertices_to_check:
+            if self._is_passable(vertex, player_index):
+                dfs(vertex, 0)
+
+        component.longest_road_size = max_length
+        component.longest_road_path = best_path
+        component.dirty = False
@@ -1,8 +1,13 @@
 from collections import Counter, defaultdict
 from dataclasses import dataclass
-from typing import Union, TYPE_CHECKING
+import copy
+from typing import TYPE_CHECKING
 import random
 
+import numpy as np
+
+from catan.actions import Action, ActionCatalogue, EndTurnAction, BuildSettlementAction, BuildCityAction, \
+    BuildRoadAction, BuyDevelopmentCardAction, UseDevelopmentCardAction, TradeAction
 from catan.board import Board, DevelopmentCard, Resource, RoadVertex, Road, Harbor, DevCard
 from catan.error import CatanException
 from catan.constants import *
@@ -13,49 +18,30 @@ from globals import DEV_MODE
 
 
 @dataclass
-class EndTurnAction:
-    pass
-
-@dataclass
-class BuildSettlementAction:
-    road_vertex: RoadVertex
-    pay_for: bool = True
-
-@dataclass
-class BuildCityAction:
-    road_vertex: RoadVertex
-    pay_for: bool = True
-
-@dataclass
-class BuildRoadAction:
-    road: Road
-    pay_for: bool = True
-
-@dataclass
-class BuyDevelopmentCardAction:
-    pass
-
-@dataclass
-class UseDevelopmentCardAction:
-    card: DevCard
-
-@dataclass
-class TradeAction:
-    giving: list[Resource]
-    receiving: list[Resource]
-
-    def simple_trade_options(giving: Resource, count: int) -> list['TradeAction']:
-        return [TradeAction([giving] * count, [resource]) for resource in Resource if resource != giving]
-
-Action = Union[
-    EndTurnAction,
-    BuildSettlementAction,
-    BuildCityAction,
-    BuildRoadAction,
-    BuyDevelopmentCardAction,
-    UseDevelopmentCardAction,
-    TradeAction
-]
+class PlayerCheckpoint:
+    '''What perform_action can change about a player, see Player.checkpoint().'''
+    resources: dict[Resource, int]
+    unplayed_dev_cards: list[DevCard]
+    played_dev_cards: list[DevCard]
+    cooldowns: list[bool]
+    free_roads_remaining: int
+    setup_last_settlement: RoadVertex | None
+    pending_settlement_for_road: RoadVertex | None
+    available_settlements: int
+    available_cities: int
+    available_roads: int
+    # settlements, cities and roads only ever grow, so their lengths are enough
+    settlement_count: int
+    city_count: int
+    road_count: int
+    road_frontier: dict[Road, None]
+    settlement_frontier: dict[RoadVertex, None]
+    upgradable_settlements: list[RoadVertex]
+    longest_road_size: int
+    longest_road_path: list[Road]
+    has_longest_road: bool
+    army_size: int
+    has_largest_army: bool
 
 
 class Player:
@@ -77,6 +63,14 @@ class Player:
     cities: list[RoadVertex]
     available_roads: int
     roads: list[Road]
+
+    # Frontier index for action generation. Grown by this player's own builds
+    # and pruned lazily once a candidate stops being legal, which only ever
+    # happens because somebody built on or next to it. Dicts are used as
+    # insertion-ordered sets.
+    road_frontier: dict[Road, None]
+    settlement_frontier: dict[RoadVertex, None]
+    upgradable_settlements: list[RoadVertex]
     
     longest_road_size: int
     longest_road_path: list[Road]
@@ -102,6 +96,10 @@ class Player:
         self.available_roads = 15
         self.roads = []
 
+        self.road_frontier = {}
+        self.settlement_frontier = {}
+        self.upgradable_settlements = []
+
         self.longest_road_size = 0
         self.longest_road_path = []
         self.has_longest_road = False
@@ -110,6 +108,71 @@ class Player:
 
         self.pending_settlement_for_road = None
     
+    def clone(self, board: Board) -> 'Player':
+        """Copy of this player whose buildings and frontiers refer to board, a clone of this player's board."""
+        player = copy.copy(self)
+        vertices, roads = board.road_vertex_list, board.roads
+        player.resources = self.resources.copy()
+        player.unplayed_dev_cards = [DevCard(card.card_type, card.on_cooldown) for card in self.unplayed_dev_cards]
+        player.played_dev_cards = [DevCard(card.card_type, card.on_cooldown) for card in self.played_dev_cards]
+        player.settlements = [vertices[vertex.id] for vertex in self.settlements]
+        player.cities = [vertices[vertex.id] for vertex in self.cities]
+        player.roads = [roads[road.id] for road in self.roads]
+        player.road_frontier = {roads[road.id]: None for road in self.road_frontier}
+        player.settlement_frontier = {vertices[vertex.id]: None for vertex in self.settlement_frontier}
+        player.upgradable_settlements = [vertices[vertex.id] for vertex in self.upgradable_settlements]
+        player.longest_road_path = [roads[road.id] for road in self.longest_road_path]
+        if self.setup_last_settlement is not None:
+            player.setup_last_settlement = vertices[self.setup_last_settlement.id]
+        if self.pending_settlement_for_road is not None:
+            player.pending_settlement_for_road = vertices[self.pending_settlement_for_road.id]
+        return player
+
+    def checkpoint(self) -> PlayerCheckpoint:
+        """Capture this player's state so that rollback() can undo any actions performed after it."""
+        return PlayerCheckpoint(
+            self.resources.copy(), self.unplayed_dev_cards.copy(), self.played_dev_cards.copy(),
+            [card.on_cooldown for card in self.unplayed_dev_cards], self.free_roads_remaining,
+            self.setup_last_settlement, self.pending_settlement_for_road,
+            self.available_settlements, self.available_cities, self.available_roads,
+            len(self.settlements), len(self.cities), len(self.roads),
+            self.road_frontier.copy(), self.settlement_frontier.copy(), self.upgradable_settlements.copy(),
+            self.longest_road_size, self.longest_road_path, self.has_longest_road,
+            self.army_size, self.has_largest_army)
+
+    def rollback(self, checkpoint: PlayerCheckpoint):
+        """Restore a checkpoint of this player, taking back any buildings placed since. Checkpoints must be undone newest first."""
+        for road_vertex in reversed(self.cities[checkpoint.city_count:]):
+            road_vertex.has_city = False
+        for road_vertex in reversed(self.settlements[checkpoint.settlement_count:]):
+            road_vertex.has_settlement = False
+            road_vertex.owner = None
+        for road in reversed(self.roads[checkpoint.road_count:]):
+            road.owner = None
+        del self.cities[checkpoint.city_count:]
+        del self.settlements[checkpoint.settlement_count:]
+        del self.roads[checkpoint.road_count:]
+
+        self.resources = checkpoint.resources.copy()
+        self.unplayed_dev_cards = checkpoint.unplayed_dev_cards.copy()
+        self.played_dev_cards = checkpoint.played_dev_cards.copy()
+        for card, on_cooldown in zip(self.unplayed_dev_cards, checkpoint.cooldowns):
+            card.on_cooldown = on_cooldown
+        self.free_roads_remaining = checkpoint.free_roads_remaining
+        self.setup_last_settlement = checkpoint.setup_last_settlement
+        self.pending_settlement_for_road = checkpoint.pending_settlement_for_road
+        self.available_settlements = checkpoint.available_settlements
+        self.available_cities = checkpoint.available_cities
+        self.available_roads = checkpoint.available_roads
+        self.road_frontier = checkpoint.road_frontier.copy()
+        self.settlement_frontier = checkpoint.settlement_frontier.copy()
+        self.upgradable_settlements = checkpoint.upgradable_settlements.copy()
+        self.longest_road_size = checkpoint.longest_road_size
+        self.longest_road_path = checkpoint.longest_road_path
+        self.has_longest_road = checkpoint.has_longest_road
+        self.army_size = checkpoint.army_size
+        self.has_largest_army = checkpoint.has_largest_army
+
     def get_victory_points(self) -> int:
         return (len(self.settlements) + len(self.cities) +
             sum(1 for card in self.played_dev_cards if card.card_type == DevelopmentCard.VICTORY_POINT) +
@@ -135,11 +198,11 @@ class Player:
     def give_resource(self, resource: Resource, count: int = 1):
         self.resources[resource] += count
     
-    def take_random_resources(self, count: int) -> list[Resource]:
+    def take_random_resources(self, count: int, rng: random.Random) -> list[Resource]:
         array = self.get_resources_array()
         if len(array) < count:
             raise CatanException('Not enough resources')
-        resources = random.sample(array, count)
+        resources = rng.sample(array, count)
         for resource in resources:
             self.resources[resource] -= 1
         return resources
@@ -160,6 +223,12 @@ class Player:
         if pay_for:
             self.pay_for(SETTLEMENT_COST)
 
+        self.upgradable_settlements.append(road_vertex)
+        self.settlement_frontier.pop(road_vertex, None)
+        for road in road_vertex.adjacent_roads:
+            if road.owner is None:
+                self.road_frontier[road] = None
+
         self.pending_settlement_for_road = road_vertex
     
     def build_city(self, road_vertex: RoadVertex, pay_for: bool = True):
@@ -180,6 +249,8 @@ class Player:
         self.available_cities -= 1
         if pay_for:
             self.pay_for(CITY_COST)
+
+        self.upgradable_settlements.remove(road_vertex)
     
     def build_road(self, road: Road, game, pay_for: bool = True):
         if road.owner is not None:
@@ -195,12 +266,22 @@ class Player:
         self.available_roads -= 1
         if pay_for:
             self.pay_for(ROAD_COST)
+
+        self.road_frontier.pop(road, None)
+        for road_vertex in road.endpoints:
+            if road_vertex.owner is None:
+                self.settlement_frontier[road_vertex] = None
+            for adjacent_road in road_vertex.adjacent_roads:
+                if adjacent_road.owner is None:
+                    self.road_frontier[adjacent_road] = None
     
-    def buy_development_card(self, board: Board):
+    def buy_development_card(self, board: Board, card_type: DevelopmentCard | None = None):
+        """Buy the top card of the deck, or a card of card_type when replaying a recorded draw."""
         if not self.can_afford(DEVELOPMENT_CARD_COST):
             raise CatanException('Cannot afford development card')
         
-        card = board.development_card_deck.draw()
+        deck = board.development_card_deck
+        card = deck.draw() if card_type is None else deck.take(card_type)
         self.unplayed_dev_cards.append(card)
         self.pay_for(DEVELOPMENT_CARD_COST)
 
@@ -271,6 +352,28 @@ class Player:
                         return True
         return False
     
+    def get_frontier_roads(self) -> list[Road]:
+        """Legal road locations for this player, pruning frontier entries that can no longer become legal."""
+        roads = []
+        for road in list(self.road_frontier):
+            # A frontier road that is illegal now can only become legal through one of
+            # this player's own builds next to it, and those add it back to the frontier.
+            if self.is_valid_road_location(road):
+                roads.append(road)
+            else:
+                del self.road_frontier[road]
+        return roads
+
+    def get_frontier_settlement_locations(self) -> list[RoadVertex]:
+        """Legal settlement locations for this player, pruning frontier entries that are permanently blocked."""
+        road_vertices = []
+        for road_vertex in list(self.settlement_frontier):
+            if self.is_valid_settlement_location(road_vertex):
+                road_vertices.append(road_vertex)
+            else:
+                del self.settlement_frontier[road_vertex]
+        return road_vertices
+
     def get_available_roads_around(self, road_vertex: RoadVertex) -> list[Road]:
         return [road for road in road_vertex.adjacent_roads if road.owner == None]
     
@@ -303,56 +406,71 @@ class Player:
         return self.has_harbor(resource) and (not check_count or self.resources[resource] >= 2)
     
     def get_all_possible_actions(self, board: Board, is_setup: bool) -> list[Action]:
-        if self.free_roads_remaining > 0:
-            self.free_roads_remaining -= 1
-            return [BuildRoadAction(road, False) for road in board.roads if self.is_valid_road_location(road)]
+        catalogue = ActionCatalogue.for_board(board)
+        return catalogue.get_actions(self._get_possible_action_ids(catalogue, board, is_setup), self)
+
+    def get_possible_action_ids(self, board: Board, is_setup: bool) -> np.ndarray:
+        """The ActionCatalogue ids of get_all_possible_actions, in the same order."""
+        return np.array(self._get_possible_action_ids(ActionCatalogue.for_board(board), board, is_setup), dtype=np.int64)
+
+    def get_possible_action_mask(self, board: Board, is_setup: bool) -> np.ndarray:
+        """Boolean mask over the board's ActionCatalogue marking the legal actions."""
+        catalogue = ActionCatalogue.for_board(board)
+        return catalogue.get_mask(self._get_possible_action_ids(catalogue, board, is_setup))
+
+    def _get_possible_action_ids(self, catalogue: ActionCatalogue, board: Board, is_setup: bool) -> list[int]:
+        # free roads are only spent once built (see perform_action), so asking for the
+        # actions, e.g. to encode a state, never changes the player
+        if self.free_roads_remaining > 0 and (free_roads := self.get_frontier_roads()):
+            return [catalogue.free_road_offset + road.id for road in free_roads]
         if is_setup:
-            return self._get_all_possible_actions_placing(board)
-        return self._get_all_possible_actions_normal(board)
+            return self._get_possible_action_ids_placing(catalogue, board)
+        return self._get_possible_action_ids_normal(catalogue, board)
 
-    def _get_all_possible_actions_placing(self, board: Board) -> list[Action]:
-        actions: list[Action] = []
+    def _get_possible_action_ids_placing(self, catalogue: ActionCatalogue, board: Board) -> list[int]:
         if self.setup_last_settlement is None:
-            for cube_coord, road_vertex in board.road_vertices.items():
-                if self.is_valid_settlement_location(road_vertex, needs_road=False):
-                    actions.append(BuildSettlementAction(road_vertex, False))
-        else:
-            for road in self.get_available_roads_around(self.setup_last_settlement):
-                actions.append(BuildRoadAction(road, False))
-        return actions
-
-    def _get_all_possible_actions_normal(self, board: Board) -> list[Action]:
-        actions: list[Action] = [EndTurnAction()]
-        if self.available_settlements > 0:
-            for cube_coord, road_vertex in board.road_vertices.items():
-                if self.is_valid_settlement_location(road_vertex) and self.can_afford(SETTLEMENT_COST):
-                    actions.append(BuildSettlementAction(road_vertex))
-        if self.available_cities > 0:
-            for road_vertex in self.settlements:
-                if self.is_valid_city_location(road_vertex) and self.can_afford(CITY_COST):
-                    actions.append(BuildCityAction(road_vertex))
-        if self.available_roads > 0:
-            for road in board.roads:
-                if self.is_valid_road_location(road) and self.can_afford(ROAD_COST):
-                    actions.append(BuildRoadAction(road))
+            offset = catalogue.free_settlement_offset
+            return [offset + road_vertex.id for road_vertex in board.get_open_settlement_vertices()]
+        offset = catalogue.free_road_offset
+        return [offset + road.id for road in self.get_available_roads_around(self.setup_last_settlement)]
+
+    def _get_possible_action_ids_normal(self, catalogue: ActionCatalogue, board: Board) -> list[int]:
+        action_ids = [catalogue.END_TURN_ID]
+        if self.available_settlements > 0 and self.can_afford(SETTLEMENT_COST):
+            offset = catalogue.settlement_offset
+            action_ids.extend(offset + road_vertex.id for road_vertex in self.get_frontier_settlement_locations())
+        if self.available_cities > 0 and self.can_afford(CITY_COST):
+            offset = catalogue.city_offset
+            action_ids.extend(offset + road_vertex.id for road_vertex in self.upgradable_settlements)
+        if self.available_roads > 0 and self.can_afford(ROAD_COST):
+            offset = catalogue.road_offset
+            action_ids.extend(offset + road.id for road in self.get_frontier_roads())
         if board.development_card_deck.remaining_cards() > 0 and self.can_afford(DEVELOPMENT_CARD_COST):
-            actions.append(BuyDevelopmentCardAction())
-        unique_cards = {}
+            action_ids.append(catalogue.buy_development_card_id)
+        playable_types = []
         for card in self.unplayed_dev_cards:
             if card.card_type != DevelopmentCard.VICTORY_POINT and not card.on_cooldown:
-                if card.card_type not in unique_cards:
-                    unique_cards[card.card_type] = card
-        for unique_card in unique_cards.values():
-            actions.append(UseDevelopmentCardAction(unique_card))
+                if card.card_type not in playable_types:
+                    playable_types.append(card.card_type)
+        action_ids.extend(catalogue.get_use_development_card_id(card_type) for card_type in playable_types)
         for resource in Resource:
             if self.can_trade_2_to_1(resource, True):
-                actions.extend(TradeAction.simple_trade_options(resource, 2))
+                action_ids.extend(catalogue.trade_ids[2][resource.value])
             elif self.can_trade_3_to_1(resource):
-                actions.extend(TradeAction.simple_trade_options(resource, 3))
+                action_ids.extend(catalogue.trade_ids[3][resource.value])
             elif self.can_trade_4_to_1(resource):
-                actions.extend(TradeAction.simple_trade_options(resource, 4))
-        return actions
-    
+                action_ids.extend(catalogue.trade_ids[4][resource.value])
+        return action_ids
+
+    def play_development_card(self, card: DevCard):
+        """Move a card to the played pile and apply its effect on this player alone."""
+        self.unplayed_dev_cards.remove(card)
+        self.played_dev_cards.append(card)
+        if card.card_type == DevelopmentCard.KNIGHT:
+            self.army_size += 1
+        elif card.card_type == DevelopmentCard.ROAD_BUILDING:
+            self.free_roads_remaining += min(2, self.available_roads)
+
     # returns whether the player has ended their turn
     def perform_action(self, action: Action, board: Board, game: 'Game') -> bool:
         if DEV_MODE:
@@ -361,6 +479,8 @@ class Player:
             for card in self.unplayed_dev_cards:
                 if card.card_type != DevelopmentCard.VICTORY_POINT and card.on_cooldown:
                     card.on_cooldown = False
+            # free roads that could not be placed expire with the turn
+            self.free_roads_remaining = 0
             return True
         elif isinstance(action, BuildSettlementAction):
             self.build_settlement(action.road_vertex, action.pay_for)
@@ -370,16 +490,14 @@ class Player:
         elif isinstance(action, BuildRoadAction):
             self.build_road(action.road, game, action.pay_for)
             self.setup_last_settlement = None
+            if not action.pay_for and self.free_roads_remaining > 0:
+                self.free_roads_remaining -= 1
         elif isinstance(action, BuyDevelopmentCardAction):
             self.buy_development_card(board)
         elif isinstance(action, UseDevelopmentCardAction):
-            self.unplayed_dev_cards.remove(action.card)
-            self.played_dev_cards.append(action.card)
+            self.play_development_card(action.card)
             if action.card.card_type == DevelopmentCard.KNIGHT:
                 game.move_robber_and_steal(self.index)
-                self.army_size += 1
-            elif action.card.card_type == DevelopmentCard.ROAD_BUILDING:
-                self.free_roads_remaining += min(2, self.available_roads)
             elif action.card.card_type == DevelopmentCard.YEAR_OF_PLENTY:
                 for _ in range(2):
                     game.select_and_give_resource(self.index)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from catan.topology import BoardTopology
+
+# 2d6 rolls, indexed directly by the roll
+ROLL_COUNT = 13
+
+
+class ProductionTable:
+    '''
+    What every dice roll pays out, as {(player index, resource value): amount} per roll.
+    BoardState forwards every tile and vertex write here; the table keeps its own small
+    copy of what each tile pays and each building collects, so an update only moves the
+    difference and resolving a roll is a single lookup.
+    '''
+    topology: BoardTopology
+    payouts: list[dict[tuple[int, int], int]]
+    # (roll, resource value) for tiles that currently produce, None otherwise
+    _tile_payouts: list[tuple[int, int] | None]
+    # (owner, amount) collected by the building on each vertex, None if it is empty
+    _vertex_buildings: list[tuple[int, int] | None]
+
+    def __init__(self, topology: BoardTopology):
+        self.topology = topology
+        self.payouts = [{} for _ in range(ROLL_COUNT)]
+        self._tile_payouts = [None] * topology.num_tiles
+        self._vertex_buildings = [None] * topology.num_vertices
+
+    def copy(self) -> ProductionTable:
+        table = ProductionTable.__new__(ProductionTable)
+        table.topology = self.topology
+        table.payouts = [payouts.copy() for payouts in self.payouts]
+        table._tile_payouts = self._tile_payouts.copy()
+        table._vertex_buildings = self._vertex_buildings.copy()
+        return table
+
+    def _add(self, roll: int, owner: int, resource: int, amount: int):
+        payouts = self.payouts[roll]
+        key = (owner, resource)
+        total = payouts.get(key, 0) + amount
+        if total:
+            payouts[key] = total
+        else:
+            del payouts[key]
+
+    def set_tile(self, tile_id: int, resource: int, number: int, robber: bool):
+        old = self._tile_payouts[tile_id]
+        new = (number, resource) if number and not robber else None
+        if old == new:
+            return
+        for vertex_id in self.topology.lists.tile_vertices[tile_id]:
+            building = self._vertex_buildings[vertex_id]
+            if building is None:
+                continue
+            owner, amount = building
+            if old is not None:
+                self._add(old[0], owner, old[1], -amount)
+            if new is not None:
+                self._add(new[0], owner, new[1], amount)
+        self._tile_payouts[tile_id] = new
+
+    def set_vertex(self, vertex_id: int, owner: int, building: int):
+        old = self._vertex_buildings[vertex_id]
+        new = (owner, building) if owner >= 0 and building else None
+        if old == new:
+            return
+        for tile_id in self.topology.lists.vertex_tiles[vertex_id]:
+            tile = self._tile_payouts[tile_id]
+            if tile is None:
+                continue
+            roll, resource = tile
+            if old is not None:
+                self._add(roll, old[0], resource, -old[1])
+            if new is not None:
+                self._add(roll, new[0], resource, new[1])
+        self._vertex_buildings[vertex_id] = new
@@ -0,0 +1,206 @@
+import random
+
+import numpy as np
+
+from catan.agent import Agent
+from catan.board import Board, Resource, Harbor, DevelopmentCard, DevCard
+from catan.game import Game, GamePhase, PlayerAgent
+from catan.game_record import RecordKind, NO_PLAYER, NO_VALUE, SNAPSHOT_KINDS, get_seed, get_layout
+from catan.player import Player, EndTurnAction, BuildSettlementAction, BuildCityAction, BuildRoadAction, TradeAction
+from catan.sim import PLAYER_COLORS
+
+# Rebuilds a Game from its record by applying the recorded decisions and outcomes directly:
+# no agent is asked for anything and no action list is generated, so a position deep into a
+# game costs a few microseconds per event. Agents in a replayed game are plain Agent
+# placeholders; swap real ones in before playing on from a replayed position.
+
+
+class GameReplayer:
+    '''
+    Replays the records of one game (an element of read_game_records or split_games).
+    game always holds the state reached so far; seek(turn) moves it to the start of a main
+    turn, before that turn's roll, starting from the nearest embedded snapshot.
+    '''
+    records: np.ndarray
+    game: Game
+    position: int
+    # (main turn, record index) of every embedded snapshot, in order
+    snapshots: list[tuple[int, int]]
+    # card type of the development card whose resource choices are being replayed
+    _pending_card: DevelopmentCard | None
+
+    def __init__(self, records: np.ndarray):
+        if records[0]["kind"] != RecordKind.GAME_START:
+            raise ValueError("Records must start with a GAME_START header")
+        self.records = records
+        # plain ints are much faster to dispatch on than numpy scalars
+        self._rows = records.tolist()
+        self._seed = get_seed(records)
+        self._layout = get_layout(records)
+        snapshot_indices = np.flatnonzero(records["kind"] == RecordKind.SNAPSHOT)
+        self.snapshots = [(int(records[i]["a"]), int(i)) for i in snapshot_indices]
+        self.reset()
+
+    def reset(self):
+        """Go back to the state before the first setup action."""
+        _, player_count, size, _, _ = self._rows[0]
+        # nothing random is drawn while replaying, the generator only has to exist
+        board = Board(size, random.Random(self._seed if self._seed is not None else 0))
+        player_agents = []
+        for i in range(player_count):
+            player = Player(i, PLAYER_COLORS[i])
+            player_agents.append(PlayerAgent(player, Agent(board, player)))
+        self.game = Game(board, player_agents)
+        tiles, harbors = self._layout
+        for tile, (resource, number) in zip(board.tile_list, tiles):
+            tile.resource = resource
+            tile.number = number
+            if resource is None:
+                board.move_robber(tile)
+        for vertex in board.road_vertex_list:
+            vertex.harbor = Harbor(harbors[vertex.id]) if vertex.id in harbors else None
+        board.analytics = None
+        self.position = 0
+        self._pending_card = None
+
+    @property
+    def turn(self) -> int:
+        return self.game.main_turns_elapsed
+
+    def step(self) -> bool:
+        """Apply the next record. Returns False once the game's records are exhausted."""
+        if self.position >= len(self._rows):
+            return False
+        self._apply(*self._rows[self.position])
+        self.position += 1
+        return True
+
+    def play_to_end(self) -> Game:
+        while self.step():
+            pass
+        return self.game
+
+    def seek(self, turn: int) -> Game:
+        """
+        The state at the start of main turn `turn`, before its roll. Jumps to the latest
+        snapshot at or before it (or rewinds to the start if the replay is already past
+        it), then applies the remaining records. If the game ended first, the final state.
+        """
+        snapshot = max(((snapshot_turn, index) for snapshot_turn, index in self.snapshots if snapshot_turn <= turn), default=None)
+        can_continue = self.turn < turn or self.turn == turn and (self.game.game_phase == GamePhase.SETUP or self._at_turn_start())
+        if snapshot is not None and not (can_continue and self.position > snapshot[1]):
+            self._restore_snapshot(snapshot[1])
+        elif not can_continue:
+            self.reset()
+        while self.position < len(self._rows):
+            if self._rows[self.position][0] == RecordKind.ROLL and self.turn >= turn:
+                break
+            self.step()
+        return self.game
+
+    def _at_turn_start(self) -> bool:
+        return self.position < len(self._rows) and self._rows[self.position][0] == RecordKind.ROLL
+
+    def _player(self, index: int) -> Player:
+        return self.game.player_agents[index].player
+
+    def _finish_setup_action(self):
+        game = self.game
+        if game.game_phase != GamePhase.SETUP:
+            return
+        game.setup_turns_elapsed += 1
+        if game.is_setup_complete():
+            game.start_main_phase()
+
+    def _apply(self, kind: int, player_index: int, a: int, b: int, c: int):
+        if kind == RecordKind.GAME_START:
+            # its player field is the player count
+            return
+        game = self.game
+        board = game.board
+        player = self._player(player_index) if player_index != NO_PLAYER else None
+        if kind == RecordKind.ROLL:
+            if a != 7:
+                game.produce_resources(a)
+        elif kind == RecordKind.END_TURN:
+            player.perform_action(EndTurnAction(), board, game)
+            game.end_main_turn()
+        elif kind == RecordKind.BUILD_SETTLEMENT:
+            player.perform_action(BuildSettlementAction(board.road_vertex_list[a], bool(b)), board, game)
+            self._finish_setup_action()
+        elif kind == RecordKind.BUILD_CITY:
+            player.perform_action(BuildCityAction(board.road_vertex_list[a], bool(b)), board, game)
+        elif kind == RecordKind.BUILD_ROAD:
+            player.perform_action(BuildRoadAction(board.roads[a], bool(b)), board, game)
+            self._finish_setup_action()
+        elif kind == RecordKind.DRAW_DEVELOPMENT_CARD:
+            player.buy_development_card(board, DevelopmentCard(a))
+        elif kind == RecordKind.USE_DEVELOPMENT_CARD:
+            card_type = DevelopmentCard(a)
+            # action generation offers the first playable card of each type
+            card = next(card for card in player.unplayed_dev_cards
+                        if card.card_type == card_type and not card.on_cooldown)
+            player.play_development_card(card)
+            self._pending_card = card_type
+        elif kind == RecordKind.CHOOSE_RESOURCE:
+            if self._pending_card == DevelopmentCard.MONOPOLY:
+                game.select_and_steal_all_resources(player_index, Resource(a))
+            else:
+                player.give_resource(Resource(a), 1)
+        elif kind == RecordKind.TRADE:
+            player.perform_action(TradeAction([Resource(a)] * b, [Resource(c)]), board, game)
+        elif kind == RecordKind.SETUP_AWARD:
+            game.award_initial_resources(player, board.road_vertex_list[a])
+        elif kind == RecordKind.DISCARD:
+            player.pay_for([Resource(a)] * b)
+        elif kind == RecordKind.ROBBER:
+            board.move_robber(None if a == NO_VALUE else board.tile_list[a])
+        elif kind == RecordKind.STEAL:
+            self._player(a).pay_for([Resource(b)])
+            player.give_resource(Resource(b), 1)
+        elif kind == RecordKind.GAME_END:
+            game.winning_player_index = None if a == NO_VALUE else a
+        # the header, layout, purchases (resolved by their DRAW) and snapshots change nothing here
+
+    def _restore_snapshot(self, index: int):
+        """Rebuild the state recorded by the snapshot at records[index] and continue after it."""
+        self.reset()
+        game = self.game
+        board = game.board
+        # buildings are never removed, so the board is exactly the builds made so far;
+        # everything else a player holds comes from the snapshot itself
+        for kind, player_index, a, b, c in self._rows[:index]:
+            if kind == RecordKind.BUILD_SETTLEMENT:
+                self._player(player_index).build_settlement(board.road_vertex_list[a], False)
+            elif kind == RecordKind.BUILD_CITY:
+                self._player(player_index).build_city(board.road_vertex_list[a], False)
+            elif kind == RecordKind.BUILD_ROAD:
+                self._player(player_index).build_road(board.roads[a], game, False)
+            elif kind == RecordKind.DRAW_DEVELOPMENT_CARD:
+                board.development_card_deck.take(DevelopmentCard(a))
+        game.setup_turns_elapsed = 2 * len(game.player_agents) * game.setup_round_count
+        game.start_main_phase()
+        for player_agent in game.player_agents:
+            player_agent.player.setup_last_settlement = None
+
+        _, _, turn, player_turn_index, robber_tile = self._rows[index]
+        game.main_turns_elapsed = turn
+        game.player_turn_index = player_turn_index
+        board.move_robber(None if robber_tile == NO_VALUE else board.tile_list[robber_tile])
+        position = index + 1
+        while position < len(self._rows) and self._rows[position][0] in SNAPSHOT_KINDS:
+            kind, player_index, a, b, c = self._rows[position]
+            player = self._player(player_index)
+            if kind == RecordKind.SNAPSHOT_PLAYER:
+                player.army_size = a
+                player.has_longest_road = bool(b & 1)
+                player.has_largest_army = bool(b & 2)
+            elif kind == RecordKind.SNAPSHOT_RESOURCES:
+                player.resources[Resource(a)] = b
+            elif kind == RecordKind.SNAPSHOT_DEV_CARD:
+                cards = player.played_dev_cards if b else player.unplayed_dev_cards
+                cards.append(DevCard(DevelopmentCard(a), bool(c)))
+            position += 1
+        game.longest_road_tracker.update()
+        self.position = position
+        self._pending_card = None
@@ -0,0 +1,182 @@
+from typing import NamedTuple
+
+import numpy as np
+import torch
+
+
+class ReplayBatch(NamedTuple):
+    board_states: torch.Tensor
+    player_states: torch.Tensor
+    actions: torch.Tensor
+    rewards: torch.Tensor
+    next_board_states: torch.Tensor
+    next_player_states: torch.Tensor
+    dones: torch.Tensor
+
+
+class ReplayBuffer:
+    '''
+    Fixed-capacity ring buffer of transitions held in contiguous preallocated tensors.
+    Appending copies into the slot under the write cursor, and sampling is a single
+    index_select per field instead of stacking a batch of separate tensors.
+    '''
+    capacity: int
+    position: int
+    size: int
+
+    def __init__(self, capacity: int, board_shape: tuple[int, ...], player_state_dim: int):
+        self.capacity = capacity
+        self.position = 0
+        self.size = 0
+        self.board_states = torch.zeros((capacity, *board_shape), dtype=torch.float32)
+        self.player_states = torch.zeros((capacity, player_state_dim), dtype=torch.float32)
+        self.actions = torch.zeros(capacity, dtype=torch.long)
+        self.rewards = torch.zeros(capacity, dtype=torch.float32)
+        self.next_board_states = torch.zeros((capacity, *board_shape), dtype=torch.float32)
+        self.next_player_states = torch.zeros((capacity, player_state_dim), dtype=torch.float32)
+        self.dones = torch.zeros(capacity, dtype=torch.float32)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, state, action_index: int, reward: float, next_state, done: bool) -> int:
+        """Copy one transition into the buffer, overwriting the oldest once full. Returns the slot used."""
+        board_state, player_state = state
+        next_board_state, next_player_state = next_state
+        i = self.position
+        self.board_states[i] = torch.as_tensor(board_state).reshape(self.board_states.shape[1:])
+        self.player_states[i] = torch.as_tensor(player_state).reshape(-1)
+        self.actions[i] = action_index
+        self.rewards[i] = reward
+        self.next_board_states[i] = torch.as_tensor(next_board_state).reshape(self.next_board_states.shape[1:])
+        self.next_player_states[i] = torch.as_tensor(next_player_state).reshape(-1)
+        self.dones[i] = float(done)
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def sample_indices(self, batch_size: int) -> torch.Tensor:
+        return torch.randint(0, self.size, (batch_size,))
+
+    def get(self, indices: torch.Tensor) -> ReplayBatch:
+        # index_select is noticeably cheaper than advanced indexing for gathering rows
+        return ReplayBatch(
+            self.board_states.index_select(0, indices),
+            self.player_states.index_select(0, indices),
+            self.actions.index_select(0, indices),
+            self.rewards.index_select(0, indices),
+            self.next_board_states.index_select(0, indices),
+            self.next_player_states.index_select(0, indices),
+            self.dones.index_select(0, indices),
+        )
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        """Uniformly sample a batch of transitions (with replacement)."""
+        return self.get(self.sample_indices(batch_size))
+
+
+class SumTree:
+    '''
+    Binary tree over a power-of-two number of leaves where every internal node holds the
+    sum of its children. Updates and proportional lookups touch one node per level, so
+    both are O(log n) and are done for a whole batch at once with NumPy.
+    '''
+    capacity: int
+    leaf_offset: int
+    depth: int
+    nodes: np.ndarray
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.depth = max(1, (capacity - 1).bit_length())
+        self.leaf_offset = 1 << self.depth
+        # node 1 is the root, leaves live in [leaf_offset, 2 * leaf_offset)
+        self.nodes = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    def total(self) -> float:
+        return float(self.nodes[1])
+
+    def get(self, indices: np.ndarray) -> np.ndarray:
+        return self.nodes[np.asarray(indices) + self.leaf_offset]
+
+    def update(self, indices: np.ndarray, values: np.ndarray):
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaf_offset
+        self.nodes[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """For each value in [0, total), return the leaf whose cumulative range contains it."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.nodes[left]
+            go_right = values >= left_sums
+            values -= left_sums * go_right
+            nodes = left + go_right
+        return nodes - self.leaf_offset
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    '''
+    Proportional prioritized experience replay (Schaul et al. 2015) on top of the ring
+    buffer. Transitions are sampled with probability priority^alpha / sum, and the batch
+    comes with importance-sampling weights that are annealed towards 1 through beta.
+    '''
+    alpha: float
+    beta: float
+    beta_increment: float
+    priority_epsilon: float
+    max_priority: float
+    tree: SumTree
+
+    def __init__(
+            self,
+            capacity: int,
+            board_shape: tuple[int, ...],
+            player_state_dim: int,
+            alpha: float = 0.6,
+            beta: float = 0.4,
+            beta_increment: float = 1e-5,
+            priority_epsilon: float = 1e-6):
+        super().__init__(capacity, board_shape, player_state_dim)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.priority_epsilon = priority_epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def append(self, state, action_index: int, reward: float, next_state, done: bool) -> int:
+        i = super().append(state, action_index, reward, next_state, done)
+        # new transitions get the highest priority seen so far so they are replayed at least once
+        self.tree.update(np.array([i]), np.array([self.max_priority ** self.alpha]))
+        return i
+
+    def sample_indices(self, batch_size: int) -> torch.Tensor:
+        # stratified: one uniform draw from each of batch_size equal slices of the total mass
+        total = self.tree.total()
+        bounds = np.linspace(0.0, total, batch_size + 1)
+        # drawn from torch's generator like the uniform buffers, so seeding torch seeds every sampler
+        values = bounds[:-1] + torch.rand(batch_size, dtype=torch.float64).numpy() * np.diff(bounds)
+        values = np.minimum(values, np.nextafter(total, 0.0))
+        indices = np.minimum(self.tree.find(values), self.size - 1)
+        return torch.from_numpy(indices)
+
+    def sample_with_weights(self, batch_size: int) -> tuple[ReplayBatch, torch.Tensor, torch.Tensor]:
+        """Sample a batch and return it with its buffer indices and importance-sampling weights."""
+        indices = self.sample_indices(batch_size)
+        probabilities = self.tree.get(indices.numpy()) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        # normalise by the batch maximum so weights only ever scale updates down
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.get(indices), indices, torch.as_tensor(weights, dtype=torch.float32)
+
+    def update_priorities(self, indices: torch.Tensor, td_errors: torch.Tensor):
+        priorities = np.abs(td_errors.detach().cpu().numpy().astype(np.float64)) + self.priority_epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices.numpy(), priorities ** self.alpha)
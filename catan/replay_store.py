@@ -0,0 +1,170 @@
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+from catan.replay_buffer import ReplayBatch
+
+# Board and player state entries are small integer counts, so float16 stores them exactly
+# at half the size. Samples are handed back as float32 tensors like the in-memory buffer.
+STATE_DTYPE = np.float16
+FIELDS = ("board_states", "player_states", "actions", "rewards", "next_board_states", "next_player_states", "dones")
+
+
+@dataclass
+class Shard:
+    name: str
+    size: int
+    arrays: dict[str, np.ndarray]
+
+
+class MemmapReplayStore:
+    '''
+    Replay storage kept on local disk as fixed-size shards of memory-mapped .npy files,
+    with the same append/sample/len interface as ReplayBuffer.
+
+    A writer (e.g. a self-play worker) appends into its open shard and seals it when it is
+    full, which flushes the arrays and then atomically publishes a small JSON manifest.
+    Readers (the learner) only ever sample from sealed shards: refresh() picks up newly
+    published manifests and maps their files read-only, so sampling reads just the rows
+    it needs instead of loading whole shards. Several writers can share a directory as
+    long as each uses its own writer_id.
+    '''
+    directory: str
+    board_shape: tuple[int, ...]
+    player_state_dim: int
+    shard_size: int
+    writer_id: str
+    max_sealed_shards: int | None
+
+    def __init__(
+            self,
+            directory: str,
+            board_shape: tuple[int, ...],
+            player_state_dim: int,
+            shard_size: int = 100_000,
+            writer_id: str | None = None,
+            max_sealed_shards: int | None = None):
+        self.directory = directory
+        self.board_shape = tuple(board_shape)
+        self.player_state_dim = player_state_dim
+        self.shard_size = shard_size
+        self.writer_id = writer_id if writer_id is not None else str(os.getpid())
+        self.max_sealed_shards = max_sealed_shards
+        os.makedirs(directory, exist_ok=True)
+
+        self._open_shard: Shard | None = None
+        self._next_sequence = 0
+        self._sealed: list[Shard] = []
+        self._sealed_names: set[str] = set()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self.refresh()
+
+    def __len__(self) -> int:
+        """Number of transitions available for sampling (sealed shards only)."""
+        return int(self._offsets[-1])
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{name}.{suffix}")
+
+    def _field_specs(self, size: int) -> dict[str, tuple[tuple[int, ...], np.dtype]]:
+        return {
+            "board_states": ((size, *self.board_shape), STATE_DTYPE),
+            "player_states": ((size, self.player_state_dim), STATE_DTYPE),
+            "actions": ((size,), np.int64),
+            "rewards": ((size,), np.float32),
+            "next_board_states": ((size, *self.board_shape), STATE_DTYPE),
+            "next_player_states": ((size, self.player_state_dim), STATE_DTYPE),
+            "dones": ((size,), np.float32),
+        }
+
+    # writer side
+
+    def _start_shard(self):
+        name = f"shard-{self.writer_id}-{self._next_sequence:06d}"
+        self._next_sequence += 1
+        arrays = {}
+        for field, (shape, dtype) in self._field_specs(self.shard_size).items():
+            arrays[field] = np.lib.format.open_memmap(self._path(name, f"{field}.npy"), mode="w+", dtype=dtype, shape=shape)
+        self._open_shard = Shard(name, 0, arrays)
+
+    def append(self, state, action_index: int, reward: float, next_state, done: bool):
+        if self._open_shard is None:
+            self._start_shard()
+        shard = self._open_shard
+        board_state, player_state = state
+        next_board_state, next_player_state = next_state
+        i = shard.size
+        shard.arrays["board_states"][i] = np.asarray(board_state).reshape(self.board_shape)
+        shard.arrays["player_states"][i] = np.asarray(player_state).reshape(-1)
+        shard.arrays["actions"][i] = action_index
+        shard.arrays["rewards"][i] = reward
+        shard.arrays["next_board_states"][i] = np.asarray(next_board_state).reshape(self.board_shape)
+        shard.arrays["next_player_states"][i] = np.asarray(next_player_state).reshape(-1)
+        shard.arrays["dones"][i] = float(done)
+        shard.size += 1
+        if shard.size == self.shard_size:
+            self.seal()
+
+    def seal(self):
+        """Flush the open shard and publish it to readers. Partially filled shards are sealed as-is."""
+        shard = self._open_shard
+        if shard is None:
+            return
+        self._open_shard = None
+        if shard.size == 0:
+            for field in FIELDS:
+                os.remove(self._path(shard.name, f"{field}.npy"))
+            return
+        for array in shard.arrays.values():
+            array.flush()
+        manifest = {"size": shard.size, "board_shape": list(self.board_shape), "player_state_dim": self.player_state_dim}
+        temporary_path = self._path(shard.name, "json.tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary_path, self._path(shard.name, "json"))
+        self.refresh()
+
+    def close(self):
+        self.seal()
+
+    # reader side
+
+    def refresh(self):
+        """Map any shards sealed since the last call, by this or any other writer."""
+        names = sorted(entry[:-len(".json")] for entry in os.listdir(self.directory) if entry.endswith(".json"))
+        for name in names:
+            if name in self._sealed_names:
+                continue
+            with open(self._path(name, "json")) as f:
+                manifest = json.load(f)
+            arrays = {field: np.load(self._path(name, f"{field}.npy"), mmap_mode="r") for field in FIELDS}
+            self._sealed.append(Shard(name, manifest["size"], arrays))
+            self._sealed_names.add(name)
+        if self.max_sealed_shards is not None and len(self._sealed) > self.max_sealed_shards:
+            # only the newest shards stay in the sampling window
+            self._sealed = self._sealed[-self.max_sealed_shards:]
+        self._offsets = np.concatenate(([0], np.cumsum([shard.size for shard in self._sealed]))).astype(np.int64)
+
+    def sample_indices(self, batch_size: int) -> torch.Tensor:
+        return torch.randint(0, len(self), (batch_size,))
+
+    def get(self, indices: torch.Tensor) -> ReplayBatch:
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self._offsets, indices, side="right") - 1
+        out = {}
+        for field, (shape, dtype) in self._field_specs(len(indices)).items():
+            out[field] = np.empty(shape, dtype=np.float32 if dtype == STATE_DTYPE else dtype)
+        for shard_id in np.unique(shard_ids):
+            positions = np.nonzero(shard_ids == shard_id)[0]
+            rows = indices[positions] - self._offsets[shard_id]
+            shard = self._sealed[shard_id]
+            for field in FIELDS:
+                out[field][positions] = shard.arrays[field][rows]
+        return ReplayBatch(*(torch.from_numpy(out[field]) for field in FIELDS))
+
+    def sample(self, batch_size: int) -> ReplayBatch:
+        """Uniformly sample a batch of transitions (with replacement) from the sealed shards."""
+        return self.get(self.sample_indices(batch_size))
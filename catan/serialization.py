@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 
-from catan.board import Tile, Road, Resource, DevelopmentCard, RoadVertex, Harbor
+import numpy as np
+
+from catan.board import Board, Tile, Road, Resource, DevelopmentCard, RoadVertex, Harbor
 from catan.game import Game, GamePhase, PlayerAgent
 from catan.player import Player, EndTurnAction, BuildSettlementAction, BuildCityAction, BuildRoadAction, BuyDevelopmentCardAction, UseDevelopmentCardAction, TradeAction
 
@@ -8,6 +10,25 @@ from globals import DEV_MODE
 
 BOARD_SIZE = 5
 
+# Layout of the flat player state vector. The order matches the nested lists the
+# encoder used to build and flatten, so saved models see the same inputs.
+END_TURN_INDEX = 0
+BUY_DEV_CARD_INDEX = 1
+ROAD_BUILDING_INDEX = 2
+YEAR_OF_PLENTY_INDEX = 3
+MONOPOLY_INDEX = 4
+TRADE_4_TO_1_OFFSET = 5  # 4:1 bank trade 1 option per resource
+TRADE_3_TO_1_OFFSET = 10  # 3:1 harbor trade 1 option per resource
+TRADE_2_TO_1_OFFSET = 15  # 2:1 harbor trade 1 option per resource
+ACTION_MAP_OFFSET = 20
+# Road, settlement, city, dev card: Knight
+ACTION_MAP_CHANNELS = 4
+# Resources for each player (Wood, Grain, Sheep, Ore, Brick) +
+# Rem Roads + Rem Cit + Rem Sett + Vict Points + If Long Road + Length Long Road + If Larg Arm + Size Arm
+PLAYER_STAT_COUNT = 13
+# Unplayed dev cards: Knight, Road Building, Year of Plenty, Monopoly, Victory Point
+DEV_CARD_COUNT = len(DevelopmentCard)
+
 
 @dataclass(init=False)
 class BrickRepresentation:
@@ -18,8 +39,25 @@ class BrickRepresentation:
     num_players: int
     game: Game
     agent_player_num: int
-    board: list[list[list[int]]]
-    player_states: list
+    # (num_players + 1, height, width); one ownership channel per player, static board info last
+    board: np.ndarray
+    # flat vector, see the layout constants above
+    player_states: np.ndarray
+    # views into player_states
+    action_map: np.ndarray
+    player_stats: np.ndarray
+    unplayed_dev_cards: np.ndarray
+    # Tile resources, numbers and harbors never change after the board is laid out, so the
+    # static channel is written once per game. Ownership is then applied incrementally from
+    # each player's append-only settlements/cities/roads lists, and only the robber cell moves.
+    # Game.undo() takes buildings back, so after one the channels are rebuilt from scratch.
+    _encoded_game: Game | None
+    _encoded_board: Board | None
+    _encoded_undo_count: int
+    _robber_cell: tuple[int, int] | None
+    _settlements_seen: list[int]
+    _cities_seen: list[int]
+    _roads_seen: list[int]
 
     def __init__(self, size: int, num_players: int, game: Game, agent_player_num: int):
         self.size = size
@@ -29,9 +67,27 @@ class BrickRepresentation:
         self.num_players = num_players
         self.game = game
         self.agent_player_num = agent_player_num
-        self.board = [[[0 for _ in range(self.width)] for _ in range(self.height)] for _ in range(num_players + 1)]
-        self.reinitialize()
-    
+        self.board = np.zeros((num_players + 1, self.height, self.width), dtype=np.float32)
+
+        action_map_end = ACTION_MAP_OFFSET + self.height * self.width * ACTION_MAP_CHANNELS
+        player_stats_end = action_map_end + num_players * PLAYER_STAT_COUNT
+        self.player_states = np.zeros(player_stats_end + DEV_CARD_COUNT, dtype=np.float32)
+        self.action_map = self.player_states[ACTION_MAP_OFFSET:action_map_end].reshape(self.height, self.width, ACTION_MAP_CHANNELS)
+        self.player_stats = self.player_states[action_map_end:player_stats_end].reshape(num_players, PLAYER_STAT_COUNT)
+        self.unplayed_dev_cards = self.player_states[player_stats_end:]
+
+        self._encoded_game = None
+        self._encoded_board = None
+        self._encoded_undo_count = 0
+        self._robber_cell = None
+        self._settlements_seen = [0] * num_players
+        self._cities_seen = [0] * num_players
+        self._roads_seen = [0] * num_players
+
+    @property
+    def player_state_dim(self) -> int:
+        return self.player_states.shape[0]
+
     def get_tile_brick_coords(self, tile: Tile) -> tuple[int, int]:
         cube = tile.cube_coords
         return (cube.q * 2) + self.center[0], ((cube.s - cube.r) // 3) * 2 + self.center[1]
@@ -54,33 +110,15 @@ class BrickRepresentation:
             else:
                 flat_list.append(item)
         return flat_list
-    
+
     def reinitialize(self):
-        self.player_states = [
-        [0], # end turn
-        [0], # buy dev card
-        [0], # road building card
-        [0], # year of plenty
-        [0], # monopoly card
-        [0,0,0,0,0], # 4:1 bank trade 1 option per resouce
-        [0,0,0,0,0], # 3:1 harbor trade 1 option per resouce
-        [0,0,0,0,0], # 2:1 harbor trade 1 option per resouce
-        [[[0, #Road 
-           0, #settlment
-           0, #city
-           0, #dev card: Knight card
-           ] for _ in range(self.width)] for _ in range(self.height)],
-        [[0] * 13 for _ in range(self.num_players)],
-        # Resources for each player (Wood, Grain, Sheep, Ore, Brick) + 
-                                                # Rem Roads + Rem Cit + Rem Sett + Vict Points + If Long Road + Length Long Road + If Larg Arm + Size Arm
-        [0, 0, 0, 0, 0] # Unplayed dev cards: Knight, Road Building, Year of Plenty, Monopoly, Victory Point
-        ]
+        self.player_states.fill(0)
 
     def to_1d(self):
-        return [cell for row in self.board for cell in row]
-    
+        return self.board.reshape(-1, self.width)
+
     def encode_player_states(self, game: Game, given_player: Player):
-        # Reset the board and player states
+        # Reset the player states in place
         self.reinitialize()
 
         # Get action space for player
@@ -91,114 +129,144 @@ class BrickRepresentation:
         # Encode actions into player_states
         for act in actions:
             if isinstance(act, EndTurnAction):
-                self.player_states[0] = 1
-            elif isinstance(act, BuildSettlementAction): 
-                coords = self.get_road_vertex_brick_coords(act.road_vertex)
-                self.player_states[8][coords[1]][coords[0]][1] = 1
+                self.player_states[END_TURN_INDEX] = 1
+            elif isinstance(act, BuildSettlementAction):
+                x, y = self.get_road_vertex_brick_coords(act.road_vertex)
+                self.action_map[y, x, 1] = 1
             elif isinstance(act, BuildCityAction): # 0/1 and whole map copy
-                coords = self.get_road_vertex_brick_coords(act.road_vertex)
-                self.player_states[8][coords[1]][coords[0]][2] = 1
+                x, y = self.get_road_vertex_brick_coords(act.road_vertex)
+                self.action_map[y, x, 2] = 1
             elif isinstance(act, BuildRoadAction): # 0/1 and whole map copy
-                coords = self.get_road_brick_coords(act.road)
-                self.player_states[8][coords[1]][coords[0]][0] = 1
+                x, y = self.get_road_brick_coords(act.road)
+                self.action_map[y, x, 0] = 1
             elif isinstance(act, BuyDevelopmentCardAction): # Just 0/1
-                self.player_states[1] = 1
+                self.player_states[BUY_DEV_CARD_INDEX] = 1
             elif isinstance(act, UseDevelopmentCardAction):
-                dev_card_type = act.card
-                match dev_card_type:
+                match act.card.card_type:
                     case DevelopmentCard.KNIGHT:
                         for tile in game.board.tiles.values():
                             if tile.has_robber:
                                 continue
-                            coords = self.get_tile_brick_coords(tile.cube_coords)
-                            self.player_states[8][coords[1]][coords[0]][3] = 1
-                        break
+                            x, y = self.get_tile_brick_coords(tile)
+                            self.action_map[y, x, 3] = 1
                     case DevelopmentCard.ROAD_BUILDING:
-                        self.player_states[2] = 1
-                        break
+                        self.player_states[ROAD_BUILDING_INDEX] = 1
                     case DevelopmentCard.YEAR_OF_PLENTY:
-                        self.player_states[3] = 1
-                        break
+                        self.player_states[YEAR_OF_PLENTY_INDEX] = 1
                     case DevelopmentCard.MONOPOLY:
-                        self.player_states[4] = 1
-                        break
+                        self.player_states[MONOPOLY_INDEX] = 1
             elif isinstance(act, TradeAction):
-                # Only encode 4:1 trades (I could be wrong on this)
-                for resource in act.giving:
-                    resource_index = resource.value  # Get the enum index of the resource
-                    if act.giving.count(resource) == 4:  # Only consider 4:1 trades
-                        self.player_states[5][resource_index] = 1  # Mark that a 4:1 trade is possible
-                    elif act.giving.count(resource) == 3:  # Only consider 4:1 trades
-                        self.player_states[6][resource_index] = 1  # Mark that a 4:1 trade is possible
-                    elif act.giving.count(resource) == 2:  # Only consider 4:1 trades
-                        self.player_states[7][resource_index] = 1  # Mark that a 4:1 trade is possible
+                # Every option in a trade gives away a single resource type
+                resource = act.giving[0]
+                count = len(act.giving)
+                if count == 4:
+                    self.player_states[TRADE_4_TO_1_OFFSET + resource.value] = 1
+                elif count == 3:
+                    self.player_states[TRADE_3_TO_1_OFFSET + resource.value] = 1
+                elif count == 2:
+                    self.player_states[TRADE_2_TO_1_OFFSET + resource.value] = 1
 
         # Encode player states
-        for player_index, player in enumerate(game.player_agents):
-            self.player_states[9][player_index][0] = player.player.resources[Resource.WOOD]
-            self.player_states[9][player_index][1] = player.player.resources[Resource.GRAIN]
-            self.player_states[9][player_index][2] = player.player.resources[Resource.SHEEP]
-            self.player_states[9][player_index][3] = player.player.resources[Resource.ORE]
-            self.player_states[9][player_index][4] = player.player.resources[Resource.BRICK]
-            self.player_states[9][player_index][5] = player.player.free_roads_remaining
-            self.player_states[9][player_index][6] = player.player.available_cities
-            self.player_states[9][player_index][7] = player.player.available_settlements
-            self.player_states[9][player_index][8] = player.player.get_victory_points()
-            self.player_states[9][player_index][9] = 1 if player.player.has_longest_road else 0
-            self.player_states[9][player_index][10] = player.player.longest_road_size
-            self.player_states[9][player_index][11] = 1 if player.player.has_largest_army else 0
-            self.player_states[9][player_index][12] = player.player.army_size
-        
+        for player_index, player_agent in enumerate(game.player_agents):
+            player = player_agent.player
+            self.player_stats[player_index] = (
+                player.resources[Resource.WOOD],
+                player.resources[Resource.GRAIN],
+                player.resources[Resource.SHEEP],
+                player.resources[Resource.ORE],
+                player.resources[Resource.BRICK],
+                player.free_roads_remaining,
+                player.available_cities,
+                player.available_settlements,
+                player.get_victory_points(),
+                1 if player.has_longest_road else 0,
+                player.longest_road_size,
+                1 if player.has_largest_army else 0,
+                player.army_size,
+            )
+
         # Given player's current Dev Cards
         for dev_card in given_player.unplayed_dev_cards:
-            self.player_states[2][dev_card.card_type.value] += 1
+            self.unplayed_dev_cards[dev_card.card_type.value] += 1
 
-        self.player_states = self.flatten_nested_list(self.player_states)
 
-        
     # Last channel in the matrix
     def board_state(self):
         return self.board[-1]
-    
-    def encode_board_recursive(
-            self,
-            game: Game,
-            tile: Tile | None = None,
-            visited: set[tuple[int, int]] | None = None):
-        tile = tile or game.board.center_tile
-        visited = visited or set()
-        brick_coords = self.get_tile_brick_coords(tile)
-        if brick_coords in visited:
-            return
-        visited.add(brick_coords)
 
-        self.serialize_tile(game, tile)
-        for neighbor in tile.adjacent_tiles:
-            self.encode_board_recursive(game, neighbor, visited)
+    def encode_board(self, game: Game):
+        if (game is not self._encoded_game or game.board is not self._encoded_board
+                or game.undo_count != self._encoded_undo_count or self._buildings_removed(game)):
+            self.encode_static_board(game)
+        self.update_robber(game)
+        self.update_ownership(game)
+
+    def encode_static_board(self, game: Game):
+        """Start encoding a new game: clear every channel and write the static layer once."""
+        self.board.fill(0)
+        for tile in game.board.tiles.values():
+            self.serialize_tile(tile)
+        for vertex in game.board.road_vertices.values():
+            if vertex.harbor is not None:
+                x, y = self.get_road_vertex_brick_coords(vertex)
+                self.board[-1, y, x] = vertex.harbor.value + 1
+
+        self._encoded_game = game
+        self._encoded_board = game.board
+        self._encoded_undo_count = game.undo_count
+        self._robber_cell = None
+        self._settlements_seen = [0] * self.num_players
+        self._cities_seen = [0] * self.num_players
+        self._roads_seen = [0] * self.num_players
+
+    def _buildings_removed(self, game: Game) -> bool:
+        """Whether any building list is shorter than when last encoded, i.e. was not only appended to."""
+        for i, player_agent in enumerate(game.player_agents):
+            player = player_agent.player
+            if (len(player.settlements) < self._settlements_seen[i] or len(player.cities) < self._cities_seen[i]
+                    or len(player.roads) < self._roads_seen[i]):
+                return True
+        return False
 
-    def serialize_tile(self, game: Game, tile: Tile):
+    def serialize_tile(self, tile: Tile):
         x, y = self.get_tile_brick_coords(tile)
         if tile.resource is not None:
-            self.board[-1][y][x - 1] = tile.resource.value + 1
-        self.board[-1][y][x] = tile.number
-        self.board[-1][y][x + 1] = 1 if tile.has_robber else 0
-        for vertex in tile.adjacent_road_vertices:
-            self.serialize_road_vertex(vertex)
-        for road in tile.adjacent_roads:
-            self.serialize_road(road)
-    
-    def serialize_road_vertex(self, intersection: RoadVertex):
-        x, y = self.get_road_vertex_brick_coords(intersection)
-        if intersection.owner is not None:
-            self.board[intersection.owner][y][x] = 2 if intersection.has_city else 1
-        if intersection.harbor is not None:
-            self.board[-1][y][x] = intersection.harbor.value + 1
-    
-    def serialize_road(self, road: Road):
-        x, y = self.get_road_brick_coords(road)
-        if road.owner is not None:
-            self.board[road.owner][y][x] = 1
-    
+            self.board[-1, y, x - 1] = tile.resource.value + 1
+        self.board[-1, y, x] = tile.number
+
+    def update_robber(self, game: Game):
+        robber_tile = game.board.get_robber_tile()
+        cell = None
+        if robber_tile is not None:
+            x, y = self.get_tile_brick_coords(robber_tile)
+            cell = (x + 1, y)
+        if cell == self._robber_cell:
+            return
+        if self._robber_cell is not None:
+            self.board[-1, self._robber_cell[1], self._robber_cell[0]] = 0
+        if cell is not None:
+            self.board[-1, cell[1], cell[0]] = 1
+        self._robber_cell = cell
+
+    def update_ownership(self, game: Game):
+        """Apply only the buildings placed since the previous encode of this game."""
+        for i, player_agent in enumerate(game.player_agents):
+            player = player_agent.player
+            channel = self.board[player.index]
+            for settlement in player.settlements[self._settlements_seen[i]:]:
+                x, y = self.get_road_vertex_brick_coords(settlement)
+                # a settlement may already have been upgraded by the time it is first seen
+                channel[y, x] = 2 if settlement.has_city else 1
+            for city in player.cities[self._cities_seen[i]:]:
+                x, y = self.get_road_vertex_brick_coords(city)
+                channel[y, x] = 2
+            for road in player.roads[self._roads_seen[i]:]:
+                x, y = self.get_road_brick_coords(road)
+                channel[y, x] = 1
+            self._settlements_seen[i] = len(player.settlements)
+            self._cities_seen[i] = len(player.cities)
+            self._roads_seen[i] = len(player.roads)
+
     def encode_all(self, given_player: Player):
-        self.encode_board_recursive(self.game)
+        self.encode_board(self.game)
         self.encode_player_states(self.game, given_player)
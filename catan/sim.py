@@ -0,0 +1,177 @@
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Generator
+
+from catan.agent import Agent
+from catan.board import Board
+from catan.constants import RED, BLUE, WHITE, ORANGE
+from catan.game import Game, PlayerAgent, Decision
+from catan.game_record import GameRecorder
+from catan.player import Player, Action
+
+# Headless game driver: nothing in here may import pygame or torch so that
+# batch evaluation starts fast. Agents that need torch bring it in themselves.
+
+PLAYER_COLORS = [RED, BLUE, WHITE, ORANGE]
+DEFAULT_MAX_TURNS = 1000
+
+AgentFactory = Callable[[Board, Player], Agent]
+
+
+@dataclass
+class GameResult:
+    winner: int | None
+    turns: int
+    victory_points: list[int]
+
+
+@dataclass
+class SimulationResult:
+    games: list[GameResult] = field(default_factory=list)
+
+    def add(self, result: GameResult):
+        self.games.append(result)
+
+    def win_counts(self) -> dict[int | None, int]:
+        counts: dict[int | None, int] = {}
+        for game in self.games:
+            counts[game.winner] = counts.get(game.winner, 0) + 1
+        return counts
+
+    def average_turns(self) -> float:
+        if not self.games:
+            return 0.0
+        return sum(game.turns for game in self.games) / len(self.games)
+
+    def print_summary(self):
+        print(f"Games played: {len(self.games)}")
+        print(f"Average number of turns: {self.average_turns():.2f}")
+        counts = self.win_counts()
+        for winner in sorted(index for index in counts if index is not None):
+            print(f"Player {winner + 1}: {counts[winner]} wins")
+        if None in counts:
+            print(f"Unfinished: {counts[None]}")
+
+
+def create_game(
+        agent_factories: list[AgentFactory],
+        board_size: int = 3,
+        seed: int | None = None,
+        recorder: GameRecorder | None = None,
+) -> Game:
+    """
+    Build a fresh board, players and agents for one game. With a seed, the game's
+    random stream is fully determined, so the same seed and agents replay the same game.
+    """
+    if len(agent_factories) > len(PLAYER_COLORS):
+        raise ValueError(f"At most {len(PLAYER_COLORS)} players are supported")
+    board = Board(board_size, random.Random(seed) if seed is not None else None)
+    player_agents = []
+    for i, factory in enumerate(agent_factories):
+        player = Player(i, PLAYER_COLORS[i])
+        player_agents.append(PlayerAgent(player, factory(board, player)))
+    return Game(board, player_agents, recorder, seed)
+
+
+def is_over(game: Game, max_turns: int = DEFAULT_MAX_TURNS) -> bool:
+    return game.winning_player_index is not None or game.main_turns_elapsed >= max_turns
+
+
+def get_result(game: Game) -> GameResult:
+    return GameResult(
+        winner=game.winning_player_index,
+        turns=game.main_turns_elapsed,
+        victory_points=[pa.player.get_victory_points() for pa in game.player_agents],
+    )
+
+
+def close_agents(game: Game):
+    for player_agent in game.player_agents:
+        player_agent.agent.close()
+
+
+def play_game(game: Game, max_turns: int = DEFAULT_MAX_TURNS) -> GameResult:
+    """Run a game to completion, or until max_turns main-phase turns have elapsed, then close its agents."""
+    try:
+        while not is_over(game, max_turns):
+            game.do_full_turn()
+    finally:
+        close_agents(game)
+    return get_result(game)
+
+
+class SeatDriver:
+    '''
+    Plays a game from one seat's point of view: advance() runs the game, answering every
+    other seat's decisions with its agent, until that seat has to decide. decision is then
+    the pending decision, and the next advance() continues with the seat's answer to it.
+    '''
+    game: Game
+    seat: int
+    max_turns: int
+    decision: Decision | None
+    # the turn in progress, None between turns
+    _steps: Generator[Decision, Action, None] | None
+
+    def __init__(self, game: Game, seat: int, max_turns: int = DEFAULT_MAX_TURNS):
+        self.game = game
+        self.seat = seat
+        self.max_turns = max_turns
+        self.decision = None
+        self._steps = None
+
+    def advance(self, action: Action | None = None) -> bool:
+        """
+        Answer the pending decision with action and play up to the seat's next one. Returns
+        False once the game is over, after closing the game's agents.
+        """
+        game = self.game
+        self.decision = None
+        while True:
+            if self._steps is None:
+                if is_over(game, self.max_turns):
+                    close_agents(game)
+                    return False
+                self._steps = game.play_turn()
+                action = None
+            try:
+                decision = self._steps.send(action)
+            except StopIteration:
+                self._steps = None
+                continue
+            if decision.player_index == self.seat:
+                self.decision = decision
+                return True
+            action = game.player_agents[decision.player_index].agent.get_action(game, decision.possible_actions)
+
+
+def simulate(
+        agent_factories: list[AgentFactory],
+        num_games: int,
+        board_size: int = 3,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        on_result: Callable[[int, GameResult], None] | None = None,
+        seed: int | None = None,
+        record_path: str | None = None,
+) -> SimulationResult:
+    """
+    Play num_games independent games and collect their results. Game i is seeded with
+    seed + i. With record_path, every game's record is appended to that log file.
+    """
+    results = SimulationResult()
+    stream = open(record_path, "ab") if record_path is not None else None
+    try:
+        recorder = GameRecorder(stream) if stream is not None else None
+        for i in range(num_games):
+            game_seed = seed + i if seed is not None else None
+            game = create_game(agent_factories, board_size, game_seed, recorder)
+            result = play_game(game, max_turns)
+            if recorder is not None:
+                recorder.end_game(game)
+            results.add(result)
+            if on_result is not None:
+                on_result(i, result)
+    finally:
+        if stream is not None:
+            stream.close()
+    return results
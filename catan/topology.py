@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from catan.production import ProductionTable
+from catan.util import CubeCoordinates, TILE_TO_TILE_DIRECTIONS, TILE_TO_ROAD_VERTEX_DIRECTIONS
+
+# Every tile, road vertex and road of a board has a dense integer id: tiles in the order of
+# Board.tiles, vertices in the order of Board.road_vertices and roads in the order of
+# Board.roads. Adjacency is stored in fixed-width arrays padded with -1, so legality checks,
+# production and encoding can be written as array operations instead of object walks.
+
+ID_DTYPE = np.int16
+NONE = -1
+
+
+class AdjacencyLists(NamedTuple):
+    '''The unpadded adjacency as plain Python lists, for wiring object graphs quickly.'''
+    tile_tiles: list[list[int]]  # -1 where there is no neighbouring tile
+    tile_vertices: list[list[int]]
+    tile_roads: list[list[int]]
+    vertex_tiles: list[list[int]]
+    vertex_vertices: list[list[int]]
+    vertex_roads: list[list[int]]
+    road_vertices: list[tuple[int, int]]
+    road_tiles: list[list[int]]
+
+
+class BoardTopology:
+    '''
+    Immutable structure of a board: coordinates and adjacency by id. It only depends on the
+    board size, so it is built once per size with for_size() and shared by every board in
+    the process; boards keep their mutable state in a separate BoardState.
+    '''
+    size: int
+    tile_coords: list[CubeCoordinates]
+    vertex_coords: list[CubeCoordinates]
+    # (tile id, index on that tile) each vertex was created from, which RoadVertex hashes on
+    vertex_parents: list[tuple[int, int]]
+    # tile ids split into the three classes of a proper colouring, so each is an independent set
+    tile_color_classes: list[list[int]]
+    # (tiles, 6) in the same orders as Tile.adjacent_tiles/adjacent_road_vertices/adjacent_roads
+    tile_tiles: np.ndarray
+    tile_vertices: np.ndarray
+    tile_roads: np.ndarray
+    # (vertices, 3), padded with -1 on the coast
+    vertex_tiles: np.ndarray
+    vertex_vertices: np.ndarray
+    vertex_roads: np.ndarray
+    # (roads, 2)
+    road_vertices: np.ndarray
+    road_tiles: np.ndarray
+    lists: AdjacencyLists
+
+    def __init__(
+            self,
+            size: int,
+            tile_coords: list[CubeCoordinates],
+            vertex_coords: list[CubeCoordinates],
+            vertex_parents: list[tuple[int, int]],
+            tile_tiles: list[list[int]],
+            tile_vertices: list[list[int]],
+            tile_roads: list[list[int]],
+            vertex_tiles: list[list[int]],
+            vertex_vertices: list[list[int]],
+            vertex_roads: list[list[int]],
+            road_vertices: list[tuple[int, int]]):
+        self.size = size
+        self.tile_coords = tile_coords
+        self.vertex_coords = vertex_coords
+        self.vertex_parents = vertex_parents
+        # neighbouring tiles differ by 1 or 2 in q, so q mod 3 never repeats across an edge
+        self.tile_color_classes = [[i for i, coords in enumerate(tile_coords) if coords.q % 3 == color] for color in range(3)]
+        self.tile_tiles = _id_array(tile_tiles, 6)
+        self.tile_vertices = _id_array(tile_vertices, 6)
+        self.tile_roads = _id_array(tile_roads, 6)
+        self.vertex_tiles = _id_array(vertex_tiles, 3)
+        self.vertex_vertices = _id_array(vertex_vertices, 3)
+        self.vertex_roads = _id_array(vertex_roads, 3)
+        self.road_vertices = _id_array(road_vertices, 2)
+        road_tiles: list[list[int]] = [[] for _ in road_vertices]
+        for tile_id, roads in enumerate(tile_roads):
+            for road_id in roads:
+                road_tiles[road_id].append(tile_id)
+        self.road_tiles = _id_array(road_tiles, 2)
+        self.lists = AdjacencyLists(tile_tiles, tile_vertices, tile_roads, vertex_tiles, vertex_vertices,
+                                    vertex_roads, road_vertices, road_tiles)
+
+    @property
+    def num_tiles(self) -> int:
+        return len(self.tile_tiles)
+
+    @property
+    def num_vertices(self) -> int:
+        return len(self.vertex_tiles)
+
+    @property
+    def num_roads(self) -> int:
+        return len(self.road_vertices)
+
+    def __deepcopy__(self, memo) -> BoardTopology:
+        # shared and never mutated, so copies of a board keep pointing at the same topology
+        return self
+
+    @classmethod
+    def for_size(cls, size: int) -> BoardTopology:
+        if size not in _TOPOLOGY_CACHE:
+            _TOPOLOGY_CACHE[size] = cls._build(size)
+        return _TOPOLOGY_CACHE[size]
+
+    @classmethod
+    def _build(cls, size: int) -> BoardTopology:
+        """
+        Lay out a hexagonal board of the given size. Tiles grow outwards ring by ring from
+        the center, then vertices and roads are created tile by tile, which fixes the id
+        order and the order of every adjacency list.
+        """
+        assert size > 0
+        tile_ids = {CubeCoordinates(0, 0, 0): 0}
+        for _ in range(1, size):
+            for coords in list(tile_ids):
+                for offset in TILE_TO_TILE_DIRECTIONS:
+                    tile_ids.setdefault(coords + offset, len(tile_ids))
+        tile_coords = list(tile_ids)
+        tile_tiles = [[tile_ids.get(coords + offset, NONE) for offset in TILE_TO_TILE_DIRECTIONS] for coords in tile_coords]
+
+        vertex_coords: list[CubeCoordinates] = []
+        vertex_parents: list[tuple[int, int]] = []
+        vertex_tiles: list[list[int]] = []
+        tile_vertices = [[NONE] * 6 for _ in tile_coords]
+        for tile_id, coords in enumerate(tile_coords):
+            for i, offset in enumerate(TILE_TO_ROAD_VERTEX_DIRECTIONS):
+                if tile_vertices[tile_id][i] != NONE:
+                    continue
+                vertex_id = len(vertex_coords)
+                vertex_coords.append(coords + offset)
+                vertex_parents.append((tile_id, i))
+                vertex_tiles.append([tile_id])
+                tile_vertices[tile_id][i] = vertex_id
+                if (tile_1 := tile_tiles[tile_id][i - 1]) != NONE:
+                    tile_vertices[tile_1][(i + 2) % 6] = vertex_id
+                    vertex_tiles[vertex_id].append(tile_1)
+                if (tile_2 := tile_tiles[tile_id][i]) != NONE:
+                    tile_vertices[tile_2][(i + 4) % 6] = vertex_id
+                    vertex_tiles[vertex_id].append(tile_2)
+
+        road_vertices: list[tuple[int, int]] = []
+        vertex_vertices: list[list[int]] = [[] for _ in vertex_coords]
+        vertex_roads: list[list[int]] = [[] for _ in vertex_coords]
+        tile_roads = [[NONE] * 6 for _ in tile_coords]
+        for tile_id in range(len(tile_coords)):
+            for i in range(6):
+                if tile_roads[tile_id][i] != NONE:
+                    continue
+                road_id = len(road_vertices)
+                vertex_1 = tile_vertices[tile_id][i]
+                vertex_2 = tile_vertices[tile_id][(i + 1) % 6]
+                road_vertices.append((vertex_1, vertex_2))
+                vertex_roads[vertex_1].append(road_id)
+                vertex_vertices[vertex_1].append(vertex_2)
+                vertex_roads[vertex_2].append(road_id)
+                vertex_vertices[vertex_2].append(vertex_1)
+                tile_roads[tile_id][i] = road_id
+                if (shared_tile := tile_tiles[tile_id][i]) != NONE:
+                    tile_roads[shared_tile][(i + 3) % 6] = road_id
+
+        # verify
+        assert all(NONE not in vertices for vertices in tile_vertices)
+        assert all(NONE not in roads for roads in tile_roads)
+        assert all(len(roads) <= 3 for roads in vertex_roads)
+        assert all(len(vertices) <= 3 for vertices in vertex_vertices)
+        assert all((tile_coords[i].q - tile_coords[j].q) % 3 != 0
+                   for i, neighbors in enumerate(tile_tiles) for j in neighbors if j != NONE)
+
+        return cls(size, tile_coords, vertex_coords, vertex_parents, tile_tiles, tile_vertices, tile_roads,
+                   vertex_tiles, vertex_vertices, vertex_roads, road_vertices)
+
+
+_TOPOLOGY_CACHE: dict[int, BoardTopology] = {}
+
+
+def _id_array(rows: list, width: int) -> np.ndarray:
+    """Fixed-width read-only id array from ragged rows, padded with -1."""
+    array = np.full((len(rows), width), NONE, dtype=ID_DTYPE)
+    for i, row in enumerate(rows):
+        array[i, :len(row)] = row
+    array.flags.writeable = False
+    return array
+
+
+class BoardState:
+    '''
+    Mutable per-game board state in flat arrays indexed by topology ids. The Tile,
+    RoadVertex and Road objects write through to these arrays whenever their state
+    attributes are assigned, so both views always agree. Tile and vertex writes go
+    through set_tile/set_vertex, which also keep the production table current.
+    '''
+    tile_resource: np.ndarray  # Resource value, -1 for the desert
+    tile_number: np.ndarray
+    tile_robber: np.ndarray  # bool
+    robber_tile: int  # id of the tile with the robber, -1 if it is off the board
+    vertex_harbor: np.ndarray  # Harbor value, -1 for none
+    vertex_owner: np.ndarray  # player index, -1 for none
+    vertex_building: np.ndarray  # 0 empty, 1 settlement, 2 city
+    road_owner: np.ndarray  # player index, -1 for none
+    production: ProductionTable
+
+    def __init__(self, topology: BoardTopology):
+        self.tile_resource = np.full(topology.num_tiles, NONE, dtype=np.int8)
+        self.tile_number = np.zeros(topology.num_tiles, dtype=np.int8)
+        self.tile_robber = np.zeros(topology.num_tiles, dtype=bool)
+        self.robber_tile = NONE
+        self.vertex_harbor = np.full(topology.num_vertices, NONE, dtype=np.int8)
+        self.vertex_owner = np.full(topology.num_vertices, NONE, dtype=np.int8)
+        self.vertex_building = np.zeros(topology.num_vertices, dtype=np.int8)
+        self.road_owner = np.full(topology.num_roads, NONE, dtype=np.int8)
+        self.production = ProductionTable(topology)
+
+    def copy(self) -> BoardState:
+        state = BoardState.__new__(BoardState)
+        for name in ('tile_resource', 'tile_number', 'tile_robber', 'vertex_harbor', 'vertex_owner', 'vertex_building', 'road_owner'):
+            setattr(state, name, getattr(self, name).copy())
+        state.robber_tile = self.robber_tile
+        state.production = self.production.copy()
+        return state
+
+    def set_tile(self, tile_id: int, resource: int, number: int, robber: bool):
+        self.tile_resource[tile_id] = resource
+        self.tile_number[tile_id] = number
+        self.tile_robber[tile_id] = robber
+        if robber:
+            self.robber_tile = tile_id
+        elif self.robber_tile == tile_id:
+            self.robber_tile = NONE
+        self.production.set_tile(tile_id, resource, number, robber)
+
+    def set_vertex(self, vertex_id: int, owner: int, building: int):
+        self.vertex_owner[vertex_id] = owner
+        self.vertex_building[vertex_id] = building
+        self.production.set_vertex(vertex_id, owner, building)
+
+
+def gather(values: np.ndarray, ids: np.ndarray, fill=0) -> np.ndarray:
+    """values[ids] for a padded id array, with fill wherever the id is -1."""
+    return np.where(ids >= 0, values[ids], fill)
+
+
+def open_settlement_mask(topology: BoardTopology, state: BoardState) -> np.ndarray:
+    """Vertices that are unoccupied and satisfy the distance rule, regardless of roads."""
+    occupied = state.vertex_building > 0
+    neighbor_occupied = gather(occupied, topology.vertex_vertices, False).any(axis=1)
+    return ~occupied & ~neighbor_occupied & (state.vertex_owner == NONE)
@@ -0,0 +1,70 @@
+import multiprocessing
+from typing import Callable, Iterator
+
+from catan.game_record import GameRecorder
+from catan.sim import AgentFactory, GameResult, SimulationResult, DEFAULT_MAX_TURNS, create_game, play_game
+
+# Each worker process builds its own Board/Player/agents per game, so nothing
+# but the agent factories (picklable classes or module-level functions) and
+# the small GameResult records (and, when recording, each game's log bytes) ever cross
+# the process boundary. Only the parent process writes the log file.
+
+
+def _play_one(task: tuple[int, list[AgentFactory], int, int, int | None, bool]) -> tuple[int, GameResult, bytes | None]:
+    game_index, agent_factories, board_size, max_turns, seed, record = task
+    # same per-game seeds as catan.sim.simulate, whichever worker ends up playing the game
+    game_seed = seed + game_index if seed is not None else None
+    recorder = GameRecorder() if record else None
+    game = create_game(agent_factories, board_size, game_seed, recorder)
+    result = play_game(game, max_turns)
+    data = recorder.end_game(game) if recorder is not None else None
+    return game_index, result, data
+
+
+def iter_tournament(
+        agent_factories: list[AgentFactory],
+        num_games: int,
+        workers: int | None = None,
+        board_size: int = 3,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        seed: int | None = None,
+        chunksize: int = 1,
+        record_path: str | None = None,
+) -> Iterator[tuple[int, GameResult]]:
+    """
+    Shard num_games across a process pool and yield (game_index, result) pairs
+    in completion order. Closing the iterator early (e.g. breaking out of the
+    loop) terminates the pool, which is how a long run is aborted. With
+    record_path, each finished game's record is appended to that log file.
+    """
+    tasks = ((i, agent_factories, board_size, max_turns, seed, record_path is not None) for i in range(num_games))
+    stream = open(record_path, "ab") if record_path is not None else None
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for game_index, result, data in pool.imap_unordered(_play_one, tasks, chunksize):
+                if stream is not None:
+                    stream.write(data)
+                yield game_index, result
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+def run_tournament(
+        agent_factories: list[AgentFactory],
+        num_games: int,
+        workers: int | None = None,
+        board_size: int = 3,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        seed: int | None = None,
+        chunksize: int = 1,
+        on_result: Callable[[int, GameResult], None] | None = None,
+        record_path: str | None = None,
+) -> SimulationResult:
+    """Parallel counterpart of catan.sim.simulate; results are merged as workers finish."""
+    results = SimulationResult()
+    for game_index, result in iter_tournament(agent_factories, num_games, workers, board_size, max_turns, seed, chunksize, record_path):
+        results.add(result)
+        if on_result is not None:
+            on_result(game_index, result)
+    return results
@@ -0,0 +1,227 @@
+import queue
+import random
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from catan.agent import Agent
+from catan.agent.rl_agent import RL_Model, QNetwork, ActionMapper, BOARD_SIZE, calculate_reward
+from catan.board import Board, Resource
+from catan.env import CatanEnv
+from catan.player import Player, Action
+from catan.serialization import BrickRepresentation
+from catan.sim import AgentFactory, DEFAULT_MAX_TURNS, GameResult, SimulationResult
+from catan.util import CubeCoordinates
+from catan.vector_env import VectorEnv
+if TYPE_CHECKING:
+    from catan.game import Game
+
+from globals import DEV_MODE
+
+# Actor-learner training: self-play actor processes generate transitions with a local copy
+# of the QNetwork, and the learner (the calling process) consumes them, trains, and
+# periodically publishes new weights through a shared-memory copy of the network.
+
+# (board, player state, action index, reward, next board, next player state, done)
+Transition = tuple[np.ndarray, np.ndarray, int, float, np.ndarray, np.ndarray, bool]
+
+
+@dataclass
+class TrainingConfig:
+    agent_factories: list[AgentFactory]
+    # seat played by the learning agent; its entry in agent_factories is ignored
+    learning_seat: int = 0
+    num_actors: int = 2
+    num_games: int = 100
+    board_size: int = 3
+    max_turns: int = DEFAULT_MAX_TURNS
+    # exploration rate used by the actors (exploration falls back to the heuristic policy)
+    epsilon: float = 0.1
+    batch_size: int = 12
+    buffer_capacity: int = 10000
+    prioritized: bool = False
+    # learner train steps between weight publications
+    publish_interval: int = 100
+    # finished games an actor may have queued before it blocks
+    queue_size: int = 16
+    # games each actor plays in lockstep, so that its decisions are batched
+    envs_per_actor: int = 8
+    seed: int | None = None
+
+
+def get_network_dimensions(num_players: int) -> tuple[int, int, int]:
+    """Board channels, player state size and action count for a QNetwork matching the encoder."""
+    encoder = BrickRepresentation(BOARD_SIZE, num_players, None, 0)
+    return num_players + 1, encoder.player_state_dim, len(ActionMapper().actions)
+
+
+class ActorAgent(Agent):
+    '''
+    Plays the learning seat with an RL_Model and records one transition per pair of
+    consecutive decisions: the state and action of the previous decision, the reward
+    observed now, and the current state as the next state.
+    '''
+    rl_model: RL_Model
+    transitions: list[Transition]
+
+    def __init__(self, board: Board, player: Player, rl_model: RL_Model):
+        super().__init__(board, player)
+        self.rl_model = rl_model
+        self.transitions = []
+        self._pending: tuple[np.ndarray, np.ndarray, int] | None = None
+
+    def _observe(self, game: 'Game', done: bool) -> tuple[np.ndarray, np.ndarray]:
+        board_state, player_state = self.rl_model.get_state(game, self.player)
+        # get_state hands out views of the encoder's buffers, which the next call overwrites
+        board_state = board_state.numpy().copy()
+        player_state = player_state.numpy().copy()
+        if self._pending is not None:
+            previous_board, previous_player, action_index = self._pending
+            self.transitions.append((previous_board, previous_player, action_index,
+                                     calculate_reward(self.player), board_state, player_state, done))
+        return board_state, player_state
+
+    def get_action(self, game: 'Game', possible_actions: list[Action]) -> Action:
+        return ActorAgent.get_actions([game], [self.player], [possible_actions])[0]
+
+    @staticmethod
+    def get_actions(games: list['Game'], players: list[Player], possible_actions: list[list[Action]]) -> list[Action]:
+        """
+        Decide for several games whose deciding seats are all ActorAgents sharing one RL_Model,
+        with one batched forward pass. This is the BatchPolicy the actors' VectorEnv uses.
+        """
+        agents: list[ActorAgent] = [game.player_agents[player.index].agent for game, player in zip(games, players)]
+        states = [agent._observe(game, False) for agent, game in zip(agents, games)]
+        rl_model = agents[0].rl_model
+        actions = rl_model.get_actions(games, players, possible_actions, states)
+        for agent, (board_state, player_state), action in zip(agents, states, actions):
+            agent._pending = (board_state, player_state, rl_model.action_mapper.get_action_index(action))
+        return actions
+
+    def finish_game(self, game: 'Game'):
+        self._observe(game, True)
+        self._pending = None
+
+    def get_most_needed_resource(self, game: 'Game') -> Resource:
+        return game.rng.choice(list(Resource))
+
+    def get_robber_placement(self, game: 'Game') -> CubeCoordinates:
+        return CubeCoordinates(0, 0, 0)
+
+    def get_player_to_steal_from(self, game: 'Game', options: list[int]) -> int:
+        return game.rng.choice(options)
+
+
+def run_actor(actor_id: int, config: TrainingConfig, shared_model: QNetwork, weights_version, weights_lock,
+              transition_queue, stop_event):
+    """Actor process: play games forever with the latest published weights and queue their transitions."""
+    torch.set_num_threads(1)
+    actor_rng = random.Random(config.seed + actor_id if config.seed is not None else None)
+    if config.seed is not None:
+        torch.manual_seed(config.seed + actor_id)
+
+    local_model = QNetwork(*get_network_dimensions(len(config.agent_factories)))
+    version = -1
+    rl_model = RL_Model(local_model, epsilon=config.epsilon)
+
+    factories = list(config.agent_factories)
+    factories[config.learning_seat] = lambda board, player: ActorAgent(board, player, rl_model)
+    env = VectorEnv(factories, config.learning_seat, ActorAgent.get_actions, config.envs_per_actor,
+                    board_size=config.board_size, max_turns=config.max_turns,
+                    seed=actor_rng.getrandbits(63) if config.seed is not None else None)
+
+    while not stop_event.is_set():
+        if weights_version.value != version:
+            with weights_lock:
+                local_model.load_state_dict(shared_model.state_dict())
+                version = weights_version.value
+
+        for _, game, _ in env.step():
+            actor_agent: ActorAgent = game.player_agents[config.learning_seat].agent
+            actor_agent.finish_game(game)
+            transition_queue.put(actor_agent.transitions)
+
+
+def train_actor_learner(config: TrainingConfig, model: QNetwork) -> RL_Model:
+    """
+    Train model from config.num_games self-play games generated by config.num_actors actor
+    processes. The calling process is the single learner; the trained RL_Model is returned.
+    """
+    context = mp.get_context("spawn")
+    shared_model = QNetwork(*get_network_dimensions(len(config.agent_factories)))
+    shared_model.load_state_dict(model.state_dict())
+    shared_model.share_memory()
+    weights_version = context.Value("i", 0)
+    weights_lock = context.Lock()
+    transition_queue = context.Queue(maxsize=config.queue_size)
+    stop_event = context.Event()
+
+    learner = RL_Model(model, batch_size=config.batch_size, buffer_capacity=config.buffer_capacity,
+                       prioritized=config.prioritized)
+    actors = [
+        context.Process(target=run_actor, daemon=True,
+                        args=(i, config, shared_model, weights_version, weights_lock, transition_queue, stop_event))
+        for i in range(config.num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    games_received = 0
+    train_steps = 0
+    try:
+        while games_received < config.num_games:
+            try:
+                transitions = transition_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            games_received += 1
+            for board_state, player_state, action_index, reward, next_board_state, next_player_state, done in transitions:
+                learner.store_transition((board_state, player_state), action_index, reward,
+                                         (next_board_state, next_player_state), done)
+                learner.train()
+                train_steps += 1
+                if train_steps % config.publish_interval == 0:
+                    with weights_lock:
+                        for shared, trained in zip(shared_model.parameters(), model.parameters()):
+                            shared.data.copy_(trained.data)
+                        weights_version.value += 1
+            if DEV_MODE:
+                print(f"Learner received game {games_received} ({len(transitions)} transitions, {train_steps} train steps)")
+    finally:
+        stop_event.set()
+        # actors blocked on a full queue can only exit once it has been drained
+        while any(actor.is_alive() for actor in actors):
+            try:
+                transition_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+    return learner
+
+
+def train_on_env(env: CatanEnv, rl_model: RL_Model, num_games: int, seed: int | None = None,
+                 on_result: Callable[[int, GameResult], None] | None = None) -> SimulationResult:
+    """
+    Single-process training: play num_games episodes of env (episode i is seeded with
+    seed + i) and train rl_model after every one of the learning seat's decisions.
+    """
+    results = SimulationResult()
+    for i in range(num_games):
+        observation = env.reset(seed + i if seed is not None else None)
+        info = {"result": env.result} if env.done else {}
+        while not env.done:
+            state = (observation.board, observation.player_state)
+            possible_actions = env.legal_actions
+            action = rl_model.get_actions([env.game], [env.player], [possible_actions], [state])[0]
+            observation, reward, done, info = env.step(env.catalogue.get_id(action))
+            rl_model.store_transition(state, rl_model.action_mapper.get_action_index(action), reward,
+                                      (observation.board, observation.player_state), done)
+            rl_model.train()
+        results.add(info["result"])
+        if on_result is not None:
+            on_result(i, info["result"])
+    return results
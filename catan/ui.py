@@ -7,7 +7,7 @@ import torch
 
 from catan.agent.random import RandomAgent
 from catan.agent.human import HumanAgent
-from catan.board import DevelopmentCard, Harbor, RoadVertex, Board, DevCard
+from catan.board import DevelopmentCard, Harbor, RoadVertex, DevCard
 from catan.game import Game
 from catan.game import GamePhase
 from catan.util import Point
@@ -19,11 +19,11 @@ from globals import NUM_GAMES
 
 # List of resources in fixed order for modal overlays.
 RESOURCE_ORDER = [Resource.WOOD, Resource.GRAIN, Resource.SHEEP, Resource.ORE, Resource.BRICK]
-from catan.serialization import BrickRepresentation
-from catan.agent.rl_agent import RL_Model
+from catan.agent.rl_agent import RL_Model, RL_Agent
+from catan.env import CatanEnv
 from catan.player import Player
-
-import copy
+from catan.sim import SimulationResult, play_game
+from catan.training import train_on_env
 
 
 class CatanUI:
@@ -52,11 +52,10 @@ class CatanUI:
     steal_candidates: list[int] = []
     steal_modal_rects: list[tuple[pygame.Rect, int]] = []
 
-    def __init__(self, game_generator: Callable[[], Game], serialization: BrickRepresentation, rl_agent: RL_Model = None, model_path: str = None):
+    def __init__(self, game_generator: Callable[[], Game], rl_agent: RL_Model = None, model_path: str = None):
         self.game = None
         self.game_generator = game_generator
         self.screen = None
-        self.serialization = serialization
         self.rl_agent = rl_agent
         self.model_path = model_path
 
@@ -536,8 +535,7 @@ class CatanUI:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     tile = self.game.board.get_tile_at_pos(mouse_pos, self.hexagon_size, self.displacement)
                     if tile is not None:
-                        for t in self.game.board.tiles.values():
-                            t.has_robber = (t == tile)
+                        self.game.board.move_robber(tile)
                         if DEV_MODE:
                             print(f"Robber moved to tile at {tile.cube_coords}")
 
@@ -569,7 +567,7 @@ class CatanUI:
                                     print(f"Player {candidate+1} has no resources to steal.")
                             else:
                                 try:
-                                    stolen_resources = target_player.take_random_resources(1)
+                                    stolen_resources = target_player.take_random_resources(1, self.game.rng)
                                     if stolen_resources:
                                         stolen = stolen_resources[0]
                                         current_player.player.give_resource(stolen, 1)
@@ -755,125 +753,15 @@ class CatanUI:
                 if DEV_MODE:
                     print(f'-------- Player {self.game.player_turn_index + 1} takes turn {self.game.main_turns_elapsed + 1} --------')
                 self.game.do_full_turn()
-                self.serialization.encode_all(current_player.player)
-                if DEV_MODE:
-                    print("Player States (Player 2):", self.serialization.player_states)
-                if DEV_MODE:
-                    print("Player 2 Board State:", self.serialization.board[1])
-
-                # Store experience and train RL agent
-                if self.rl_agent:
-                    if DEV_MODE:
-                        print(f'-------- RL AGENT  --------')
-                    # Convert board state to tensor
-                    board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-
-                    # Flatten player_states and convert to tensor
-                    player_state = self.serialization.flatten_nested_list(self.serialization.player_states)
-                    player_state = torch.tensor(player_state, dtype=torch.float32)
-
-                    # Ensure player_state has the correct shape (batch_size, player_state_dim)
-                    player_state = player_state.unsqueeze(0)  # Add batch dimension
-
-                    state = (board_state, player_state)
-
-                    current_player_agent = self.game.player_agents[self.game.player_turn_index]
-                    possible_actions = current_player_agent.player._get_all_possible_actions_normal(self.game.board)
-                    action = self.rl_agent.get_action(self.game, current_player_agent.player, possible_actions)
-                    reward = self.calculate_reward(current_player_agent.player)
-
-                    # Convert next states to tensors
-                    next_board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-                    next_player_state = torch.tensor(player_state, dtype=torch.float32)  # Reuse flattened player_state
-                    next_state = (next_board_state, next_player_state)
-
-                    done = self.game.winning_player_index is not None
-
-                    self.rl_agent.store_experience(state, action, reward, next_state, done)
-
-                    self.rl_agent.train()
-                    # Save the model
-                    if self.rl_agent and self.model_path:
-                        torch.save(self.rl_agent.model.state_dict(), self.model_path)
-                        if DEV_MODE:
-                            print(f"Model saved to {self.model_path}")
-
-                if self.game.winning_player_index is not None:
-                    if DEV_MODE:
-                        print(f"Player {self.game.winning_player_index + 1} wins!")
-                    # Save the model after each game
-                    if self.rl_agent and self.model_path:
-                        torch.save(self.rl_agent.model.state_dict(), self.model_path)
-                        if DEV_MODE:
-                            print(f"Model saved to {self.model_path}")
+                if self.game.winning_player_index is not None and DEV_MODE:
+                    print(f"Player {self.game.winning_player_index + 1} wins!")
             elif event.key == pygame.K_x:
                 while self.game.winning_player_index is None:
                     if DEV_MODE:
                         print(f'-------- Player {self.game.player_turn_index + 1} takes turn {self.game.main_turns_elapsed + 1} --------')
                     self.game.do_full_turn()
-
-                    self.serialization.encode_player_states(self.game, self.game.player_agents[1].player)
-                    if DEV_MODE:
-                        print("Player States (Player 2):", self.serialization.player_states)
-                    self.serialization.recursive_serialize(self.game, self.game.board.center_tile, None, None)
-                    if DEV_MODE:
-                        print("Player 2 Board State:", self.serialization.board[1])
-
-                    # Store experience and train RL agent
-                    if self.rl_agent:
-                        # Convert board state to tensor
-                        board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-
-                        # Flatten player_states and convert to tensor
-                        player_state = self.serialization.flatten_nested_list(self.serialization.player_states)
-                        player_state = torch.tensor(player_state, dtype=torch.float32)
-
-                        # Ensure player_state has the correct shape (batch_size, player_state_dim)
-                        player_state = player_state.unsqueeze(0)  # Add batch dimension
-
-                        state = (board_state, player_state)
-
-                        current_player_agent = self.game.player_agents[self.game.player_turn_index]
-                        possible_actions = current_player_agent.player._get_all_possible_actions_normal(self.game.board)
-                        action = self.rl_agent.get_action(self.game, current_player_agent.player, possible_actions)
-                        reward = self.calculate_reward(current_player_agent.player)
-
-                        # Convert next states to tensors
-                        next_board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-                        next_player_state = torch.tensor(player_state, dtype=torch.float32)  # Reuse flattened player_state
-                        next_state = (next_board_state, next_player_state)
-
-                        done = self.game.winning_player_index is not None
-
-                        self.rl_agent.store_experience(state, action, reward, next_state, done)
-                        self.rl_agent.train()
                 if DEV_MODE:
                     print(f"Player {self.game.winning_player_index + 1} wins!")
-                if self.rl_agent and self.model_path:
-                    torch.save(self.rl_agent.model.state_dict(), self.model_path)
-                    if DEV_MODE:
-                        print(f"Model saved to {self.model_path}")
-
-    def calculate_reward(self, player: Player) -> float:
-        """Calculate reward based on player's progress, with higher rewards for wheat and ore."""
-        reward = 0
-
-        # Reward for victory points
-        reward += player.get_victory_points() * 5  # Reward for victory points
-
-        # Reward for resources, with higher weights for wheat and ore
-        resource_weights = {
-            Resource.GRAIN: .3,
-            Resource.ORE: .3,
-            Resource.BRICK: .1,
-            Resource.WOOD: .1,
-            Resource.SHEEP: .1,
-        }
-        # Calculate weighted sum of resources
-        for resource, amount in player.resources.items():
-            reward += amount * resource_weights.get(resource, 1)  # Use weight if defined, otherwise default to 1
-
-        return reward
 
     def calculate_sizes(self):
         info = pygame.display.Info()
@@ -896,57 +784,32 @@ class CatanUI:
     def open_and_loop(self, doSimulate, train):
         if doSimulate:
             num_games = NUM_GAMES
-            total_turns = 0
-            win_counts = {}
-            self.game = self.game_generator()
-            self.initial_game_state = copy.deepcopy(self.game)
             print("Starting simulation of", num_games, "games...")
+
+            def report(i, result):
+                winner = "none" if result.winner is None else f"Player {result.winner + 1}"
+                print(f"Game {i}: {result.turns} turns, winner {winner}")
+
             if train == 1:
                 print("Training enabled")
-            for i in range(num_games):
-                print("Game ", i)
-                while self.game.winning_player_index is None:
-                    self.game.do_full_turn()
-
-                    if train == 1:
-                        self.serialization.encode_player_states(self.game, self.game.player_agents[1].player)
-                        self.serialization.recursive_serialize(self.game, self.game.board.center_tile, None, None)
-                        board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-                        player_state = self.serialization.flatten_nested_list(self.serialization.player_states)
-                        player_state = torch.tensor(player_state, dtype=torch.float32)
-                        player_state = player_state.unsqueeze(0)  # Add batch dimension
-                        state = (board_state, player_state)
-                        
-                        current_player_agent = self.game.player_agents[self.game.player_turn_index]
-                        possible_actions = current_player_agent.player._get_all_possible_actions_normal(self.game.board)
-                        action = self.rl_agent.get_action(self.game, current_player_agent.player, possible_actions)
-                        reward = self.calculate_reward(current_player_agent.player)
-                        
-                        next_board_state = torch.tensor(self.serialization.board, dtype=torch.float32)
-                        next_player_state = torch.tensor(player_state, dtype=torch.float32)
-                        next_state = (next_board_state, next_player_state)
-                        
-                        done = self.game.winning_player_index is not None
-                        self.rl_agent.store_experience(state, action, reward, next_state, done)
-                        self.rl_agent.train()
-
-                turns = self.game.main_turns_elapsed + 1
-                total_turns += turns
-                winner = self.game.winning_player_index
-                win_counts[winner] = win_counts.get(winner, 0) + 1
-                if DEV_MODE:
-                    print(f"Game {i+1} finished in {turns} turns. Winner: Player {winner + 1}")
-                self.game = self.game_generator()
-                self.game = copy.deepcopy(self.initial_game_state)
-                self.game.board = Board(3)
-                self.game.board.initialize_tile_info()
-                self.game.board.set_harbors()
-            avg_turns = total_turns / num_games
+                game = self.game_generator()
+                seat = next((i for i, player_agent in enumerate(game.player_agents)
+                             if isinstance(player_agent.agent, RL_Agent)), None)
+                if seat is None or self.rl_agent is None:
+                    print("Training needs an RL agent (N) seat")
+                    return
+                # the RL_Agent in the learning seat is never asked, the env plays it with self.rl_agent
+                env = CatanEnv(lambda seed: self.game_generator(), seat)
+                results = train_on_env(env, self.rl_agent, num_games, on_result=report)
+            else:
+                results = SimulationResult()
+                for i in range(num_games):
+                    result = play_game(self.game_generator())
+                    results.add(result)
+                    report(i, result)
             print("\nSimulation complete")
-            print(f"Average number of turns: {avg_turns:.2f}")
-            for player in sorted(win_counts.keys()):
-                print(f"Player {player + 1}: {win_counts[player]} wins")
-            if train == 1 and self.rl_agent and self.model_path:
+            results.print_summary()
+            if train == 1 and self.model_path:
                 torch.save(self.rl_agent.model.state_dict(), self.model_path)
                 print(f"Model saved to {self.model_path}")
             return
@@ -960,7 +823,6 @@ class CatanUI:
         pygame.display.set_caption("Settlers of Catan Board")
 
         self.game = self.game_generator()
-        self.initial_game_state = copy.deepcopy(self.game)
 
         running = True
         while running:
@@ -988,10 +850,6 @@ class CatanUI:
                     running = False
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
                     self.game = self.game_generator()
-                    self.game = copy.deepcopy(self.initial_game_state)
-                    self.game.board = Board(3)
-                    self.game.board.initialize_tile_info()
-                    self.game.board.set_harbors()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     self.handle_event(event, hover_vertex, hover_road)
                 else:
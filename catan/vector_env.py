@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Callable
+
+from catan.game import Game
+from catan.player import Player, Action
+from catan.sim import AgentFactory, DEFAULT_MAX_TURNS, GameResult, SeatDriver, SimulationResult, create_game, get_result
+
+# Lockstep driver for batched policies. Each game runs under a SeatDriver, so it can be paused
+# at any decision: the other seats' decisions are answered by their agents on the spot, while
+# one seat's decisions are collected across all games and answered together,
+# e.g. by RL_Model.get_actions with a single forward pass for the whole batch. Like sim.py,
+# nothing in here imports torch.
+
+# (games, the deciding players, their possible actions) -> the chosen action for each game
+BatchPolicy = Callable[[list[Game], list[Player], list[list[Action]]], list[Action]]
+
+
+@dataclass
+class _Slot:
+    index: int
+    driver: SeatDriver
+
+    @property
+    def game(self) -> Game:
+        return self.driver.game
+
+
+class VectorEnv:
+    '''
+    Plays up to num_envs games side by side, starting a new one whenever one finishes, until
+    num_games have been played (forever if it is None). Game i is seeded with seed + i.
+    step() advances every game to its seat's next decision and then makes all of those
+    decisions with one call to the policy.
+    '''
+    agent_factories: list[AgentFactory]
+    seat: int
+    policy: BatchPolicy
+    num_envs: int
+    num_games: int | None
+    board_size: int
+    max_turns: int
+    seed: int | None
+    games_started: int
+    _slots: list[_Slot]
+
+    def __init__(
+            self,
+            agent_factories: list[AgentFactory],
+            seat: int,
+            policy: BatchPolicy,
+            num_envs: int,
+            num_games: int | None = None,
+            board_size: int = 3,
+            max_turns: int = DEFAULT_MAX_TURNS,
+            seed: int | None = None,
+    ):
+        if num_envs < 1:
+            raise ValueError("A VectorEnv needs at least one environment")
+        self.agent_factories = agent_factories
+        self.seat = seat
+        self.policy = policy
+        self.num_envs = num_envs
+        self.num_games = num_games
+        self.board_size = board_size
+        self.max_turns = max_turns
+        self.seed = seed
+        self.games_started = 0
+        self._slots = []
+
+    @property
+    def done(self) -> bool:
+        return not self._slots and self.num_games is not None and self.games_started >= self.num_games
+
+    def _start_game(self) -> _Slot | None:
+        if self.num_games is not None and self.games_started >= self.num_games:
+            return None
+        index = self.games_started
+        self.games_started += 1
+        game_seed = self.seed + index if self.seed is not None else None
+        game = create_game(self.agent_factories, self.board_size, game_seed)
+        return _Slot(index, SeatDriver(game, self.seat, self.max_turns))
+
+    def step(self) -> list[tuple[int, Game, GameResult]]:
+        """Make one batch of seat decisions. Returns (index, game, result) for every game that finished meanwhile."""
+        finished = []
+        if not self._slots:
+            # first step: fill every environment
+            pending = [slot for slot in (self._start_game() for _ in range(self.num_envs)) if slot is not None]
+            actions: list[Action | None] = [None] * len(pending)
+        else:
+            pending = self._slots
+            actions = self.policy([slot.game for slot in pending],
+                                  [slot.game.player_agents[self.seat].player for slot in pending],
+                                  [slot.driver.decision.possible_actions for slot in pending])
+
+        self._slots = []
+        for slot, action in zip(pending, actions):
+            while slot is not None and not slot.driver.advance(action):
+                finished.append((slot.index, slot.game, get_result(slot.game)))
+                slot, action = self._start_game(), None
+            if slot is not None:
+                self._slots.append(slot)
+        return finished
+
+    def run(self, on_game_end: Callable[[int, Game, GameResult], None] | None = None) -> SimulationResult:
+        """Play all num_games games. Results are collected in the order the games finish."""
+        if self.num_games is None:
+            raise ValueError("run() needs a VectorEnv with a finite num_games")
+        results = SimulationResult()
+        while not self.done:
+            for index, game, result in self.step():
+                results.add(result)
+                if on_game_end is not None:
+                    on_game_end(index, game, result)
+        return results
@@ -1,27 +1,30 @@
 import argparse
 import os
-import torch
 
-from globals import SELECTED_MODEL
+from globals import SELECTED_MODEL, NUM_GAMES
 
 from catan.board import Board
 from catan.player import Player
 from catan.agent.random import RandomAgent
-from catan.agent.rl_agent import RL_Agent, RL_Model, QNetwork
 
 from catan.agent.human import HumanAgent
 from catan.agent.heuristic import HeuristicAgent
+from catan.agent.mcts import MCTSAgent
 from catan.game import Game, PlayerAgent
-from catan.ui import CatanUI
-from catan.serialization import BrickRepresentation
+from catan.sim import AgentFactory, simulate
+from catan.tournament import run_tournament
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Settlers of Catan board visualizer")
     parser.add_argument("--board-size", type=int, default=3, help="Size of the board (default: 3)")
     parser.add_argument("--num-players", type=int, default=4, help="Number of players (default: 4)")
-    parser.add_argument("--players", type=str, default="RHNR", help="Player types, Human = U, Random = R, Heuristic = H, RL_Agent = N")
+    parser.add_argument("--players", type=str, default="RHNR", help="Player types, Human = U, Random = R, Heuristic = H, RL_Agent = N, MCTS = M")
     parser.add_argument("--sim", action="store_true", help="Enable simulation statistics")
     parser.add_argument("--train", action="store_true", help="Enable training")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for headless simulations (0 = all cores)")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed for headless games; game i uses seed + i")
+    parser.add_argument("--record", type=str, default=None, help="Append a binary record of every headless game to this file")
+    parser.add_argument("--actors", type=int, default=0, help="Self-play actor processes for --train (0 = train inline in the simulation loop)")
     return parser.parse_args()
 
 
@@ -51,7 +54,10 @@ def create_game(players) -> Game:
             agents.append(RandomAgent(board, player_list[i]))
         elif player == "H":
             agents.append(HeuristicAgent(board, player_list[i]))
+        elif player == "M":
+            agents.append(MCTSAgent(board, player_list[i]))
         elif player == "N":
+            from catan.agent.rl_agent import RL_Agent
             agents.append(RL_Agent(board, player_list[i]))
         else:
             print("Invalid player type")
@@ -67,38 +73,109 @@ def create_game(players) -> Game:
     return new_game
 
 
+def get_agent_factories(players) -> list[AgentFactory]:
+    factories = []
+    for player in players:
+        if player == "R":
+            factories.append(RandomAgent)
+        elif player == "H":
+            factories.append(HeuristicAgent)
+        elif player == "M":
+            factories.append(MCTSAgent)
+        elif player == "N":
+            from catan.agent.rl_agent import RL_Agent
+            factories.append(RL_Agent)
+        elif player == "U":
+            print("Human players cannot take part in a headless simulation")
+            exit()
+        else:
+            print("Invalid player type")
+            exit()
+    return factories
+
+
+def run_headless_simulation(args):
+    factories = get_agent_factories(args.players)
+    print("Starting simulation of", NUM_GAMES, "games...")
+
+    def report(i, result):
+        winner = "none" if result.winner is None else f"Player {result.winner + 1}"
+        print(f"Game {i}: {result.turns} turns, winner {winner}")
+
+    if args.workers == 1:
+        results = simulate(factories, NUM_GAMES, board_size=args.board_size, on_result=report, seed=args.seed,
+                           record_path=args.record)
+    else:
+        results = run_tournament(factories, NUM_GAMES, workers=args.workers or None,
+                                 board_size=args.board_size, seed=args.seed, on_result=report,
+                                 record_path=args.record)
+    print("\nSimulation complete")
+    results.print_summary()
+
+
+def run_actor_learner_training(args):
+    import torch
+    from catan.training import TrainingConfig, get_network_dimensions, train_actor_learner
+
+    if "N" not in args.players:
+        print("Actor-learner training needs an RL agent (N) seat")
+        exit()
+    learning_seat = args.players.index("N")
+    factories = get_agent_factories(args.players)
+    config = TrainingConfig(factories, learning_seat=learning_seat, num_actors=args.actors,
+                            num_games=NUM_GAMES, board_size=args.board_size, seed=args.seed)
+    model = load_or_create_model(SELECTED_MODEL, *get_network_dimensions(len(factories)))
+    print(f"Training on {NUM_GAMES} self-play games from {args.actors} actors...")
+    train_actor_learner(config, model)
+    torch.save(model.state_dict(), SELECTED_MODEL)
+    print(f"Model saved to {SELECTED_MODEL}")
+
+
 def load_or_create_model(model_path, board_channels, player_state_dim, action_dim):
     """Load a saved model if it exists, otherwise create a new one."""
+    import torch
+    from catan.agent.rl_agent import QNetwork
+
+    model = QNetwork(board_channels, player_state_dim, action_dim)
     if os.path.exists(model_path):
         print(f"Loading model from {model_path}")
-        model = QNetwork(board_channels, player_state_dim, action_dim)
-        model.load_state_dict(torch.load(model_path))
+        try:
+            model.load_state_dict(torch.load(model_path))
+        except RuntimeError:
+            # saved by an older state encoding with different dimensions
+            print(f"Model at {model_path} does not match the current state encoding. Creating a new model.")
+            return QNetwork(board_channels, player_state_dim, action_dim)
         model.eval()  # Set the model to evaluation mode
     else:
         print(f"No model found at {model_path}. Creating a new model.")
-        model = QNetwork(board_channels, player_state_dim, action_dim)
     return model
 
 
 
 def main():
     args = parse_arguments()
-    game = create_game(args.players)
-    # Hard coded to 4 players since no argument functionality at this moment
-    serialization = BrickRepresentation(5, 4, None, 1)
-    serialization.game = game
-
-    # Initialize RL Agent
-    board_channels = args.num_players + 1  # Number of players + 1 for board state
-    player_state_dim = 1224  # Size of the flattened player_state
-    action_dim = 7  # Number of possible actions
-
-    # Load or create the model
-    model = load_or_create_model(SELECTED_MODEL, board_channels, player_state_dim, action_dim)
+    if args.sim and not args.train:
+        # Plain simulations never need the UI, so keep pygame and torch out of the process
+        run_headless_simulation(args)
+        return
+    if args.train and args.actors > 0:
+        run_actor_learner_training(args)
+        return
+
+    from catan.agent.rl_agent import RL_Model
+    from catan.ui import CatanUI
+    from catan.training import get_network_dimensions
+
+    # the UI asks for a fresh game whenever it starts or resets one
+    def new_game() -> Game:
+        return create_game(args.players)
+
+    # Load or create the model, sized to match the encoder
+    model = load_or_create_model(SELECTED_MODEL, *get_network_dimensions(len(args.players)))
     rl_agent = RL_Model(model)
 
     # Pass RL Agent to the UI
-    catan_ui = CatanUI(lambda: game, serialization=serialization, rl_agent=rl_agent, model_path=SELECTED_MODEL)
+    catan_ui = CatanUI(new_game, rl_agent=rl_agent, model_path=SELECTED_MODEL)
     catan_ui.open_and_loop(doSimulate=args.sim, train=args.train)
 
 